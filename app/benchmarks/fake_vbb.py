@@ -0,0 +1,248 @@
+# app/benchmarks/fake_vbb.py
+"""
+Local stand-in for v6.vbb.transport.rest, so transport benchmarks never
+touch the real API.
+
+Answers /stops/:id/departures, /journeys, /journeys/:ref and /locations
+from recorded fixtures when a fixture directory is given, otherwise from
+deterministic generated data. Latency, jitter and error rate are
+configurable; /__stats returns upstream call counts per endpoint.
+
+    python -m benchmarks.fake_vbb serve --port 9300 --latency-ms 80 --error-rate 0.02
+    python -m benchmarks.fake_vbb record --out benchmarks/fixtures --station 900100003
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+FIXTURE_FILES = {
+    "departures": "departures.json",
+    "journeys": "journeys.json",
+    "refresh": "refresh.json",
+    "locations": "locations.json",
+}
+
+
+@dataclass
+class FakeSettings:
+    latency_ms: float = 50
+    jitter_ms: float = 25
+    error_rate: float = 0.0
+    fixtures: str | None = None
+    seed: int = 7
+
+
+def _load_fixtures(path: str | None) -> dict:
+    fixtures = {}
+    if not path:
+        return fixtures
+    for name, filename in FIXTURE_FILES.items():
+        file_path = os.path.join(path, filename)
+        if os.path.exists(file_path):
+            with open(file_path, encoding="utf-8") as f:
+                fixtures[name] = json.load(f)
+    return fixtures
+
+
+def _shift_times(payload, delta: timedelta):
+    """Move every ISO timestamp in a recorded payload by `delta`, so fixtures stay upcoming."""
+    if isinstance(payload, dict):
+        return {k: _shift_times(v, delta) for k, v in payload.items()}
+    if isinstance(payload, list):
+        return [_shift_times(v, delta) for v in payload]
+    if isinstance(payload, str) and len(payload) >= 19 and payload[4] == "-" and payload[10] == "T":
+        try:
+            return (datetime.fromisoformat(payload) + delta).isoformat()
+        except ValueError:
+            return payload
+    return payload
+
+
+def _stable_int(*parts) -> int:
+    return int(hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()[:8], 16)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone(timedelta(hours=1))).replace(microsecond=0)
+
+
+def _location(name: str, station_id: str) -> dict:
+    n = _stable_int(station_id)
+    return {
+        "type": "stop",
+        "id": station_id,
+        "name": name,
+        "location": {"latitude": 52.45 + (n % 1000) / 10000, "longitude": 13.3 + (n // 1000 % 1000) / 5000},
+    }
+
+
+def _generated_departures(station_id: str, duration: int) -> dict:
+    now = _now()
+    departures = []
+    for i in range(max(duration // 3, 1)):
+        planned = now + timedelta(minutes=3 * i)
+        delay = 60 * (_stable_int(station_id, i, now.minute) % 4)
+        departures.append({
+            "tripId": f"1|{_stable_int(station_id, i, planned.hour)}|0|86|1",
+            "when": (planned + timedelta(seconds=delay)).isoformat(),
+            "plannedWhen": planned.isoformat(),
+            "delay": delay,
+            "platform": str(1 + i % 2),
+            "direction": f"Direction {i % 4}",
+            "line": {"name": f"U{1 + i % 9}", "mode": "train", "product": "subway"},
+        })
+    return {"departures": departures}
+
+
+def _generated_journey(from_id: str, to_id: str, k: int, start: datetime) -> dict:
+    legs = []
+    t = start + timedelta(minutes=5 * k)
+    stations = [from_id, f"9000{_stable_int(from_id, to_id) % 100000:05d}", to_id]
+    for leg_no in range(2):
+        origin, destination = stations[leg_no], stations[leg_no + 1]
+        arrive = t + timedelta(minutes=12)
+        legs.append({
+            "origin": _location(f"Stop {origin}", origin),
+            "destination": _location(f"Stop {destination}", destination),
+            "departure": t.isoformat(),
+            "arrival": arrive.isoformat(),
+            "plannedDeparture": t.isoformat(),
+            "line": {"name": f"S{1 + (k + leg_no) % 9}", "mode": "train", "product": "suburban"},
+            "platform": "1",
+            "delay": 0,
+            "stopovers": [
+                {
+                    "stop": _location(f"Stop {origin}-{s}", f"{origin}{s}"),
+                    "arrival": (t + timedelta(minutes=2 * s)).isoformat(),
+                    "departure": (t + timedelta(minutes=2 * s)).isoformat(),
+                    "platform": "1",
+                }
+                for s in range(6)
+            ],
+        })
+        t = arrive + timedelta(minutes=4)
+    return {"legs": legs, "duration": 28, "refreshToken": f"T$A=1@O={from_id}@Z={to_id}@K={k}@S={int(start.timestamp())}$"}
+
+
+def _generated_journeys(from_id: str, to_id: str, results: int) -> dict:
+    return {"journeys": [_generated_journey(from_id, to_id, k, _now()) for k in range(results)]}
+
+
+def create_app(settings: FakeSettings) -> FastAPI:
+    app = FastAPI(title="fake transport.rest")
+    fixtures = _load_fixtures(settings.fixtures)
+    rng = random.Random(settings.seed)
+    calls: Counter = Counter()
+
+    def fixture(name: str):
+        data = fixtures[name]
+        if isinstance(data, dict) and "_recorded_at" in data:
+            # Recorded answers are replayed as if they had been recorded just now
+            shift = _now() - datetime.fromisoformat(data["_recorded_at"])
+            return _shift_times(data["body"], shift)
+        return data
+
+    async def answer(endpoint: str, build):
+        calls[endpoint] += 1
+        delay = max(settings.latency_ms + rng.uniform(-settings.jitter_ms, settings.jitter_ms), 0)
+        await asyncio.sleep(delay / 1000)
+        if rng.random() < settings.error_rate:
+            calls[f"{endpoint}:errors"] += 1
+            return JSONResponse({"message": "injected upstream error"}, status_code=503)
+        return fixture(endpoint) if endpoint in fixtures else build()
+
+    @app.get("/stops/{station_id}/departures")
+    async def departures(station_id: str, duration: int = 30):
+        return await answer("departures", lambda: _generated_departures(station_id, duration))
+
+    @app.get("/journeys")
+    async def journeys(request: Request):
+        q = request.query_params
+        results = int(q.get("results", 5))
+        return await answer("journeys", lambda: _generated_journeys(q.get("from", "0"), q.get("to", "0"), results))
+
+    @app.get("/journeys/{ref:path}")
+    async def refresh(ref: str):
+        def build():
+            parts = dict(p.split("=", 1) for p in ref.strip("T$").split("@") if "=" in p)
+            return {"journey": _generated_journey(parts.get("O", "0"), parts.get("Z", "0"), int(parts.get("K", 0)), _now())}
+        return await answer("refresh", build)
+
+    @app.get("/locations")
+    async def locations(query: str):
+        return await answer(
+            "locations",
+            lambda: [_location(query.title(), f"900{_stable_int(query.lower()) % 1000000:06d}")],
+        )
+
+    @app.get("/__stats")
+    def stats():
+        return dict(calls)
+
+    @app.post("/__reset")
+    def reset():
+        calls.clear()
+        return {"status": "ok"}
+
+    return app
+
+
+async def record(out: str, base_url: str, station: str, from_id: str, to_id: str, query: str):
+    """Save one real answer per endpoint as fixtures; times are shifted to "now" when served."""
+    os.makedirs(out, exist_ok=True)
+    recorded_at = _now().isoformat()
+    async with httpx.AsyncClient(base_url=base_url, headers={"User-Agent": "Explorix-App"}, timeout=20) as client:
+        departures = (await client.get(f"/stops/{station}/departures", params={"duration": 60, "language": "en"})).json()
+        journeys = (await client.get("/journeys", params={"from": from_id, "to": to_id, "stopovers": "true", "results": 5})).json()
+        token = (journeys.get("journeys") or [{}])[0].get("refreshToken")
+        refresh = (await client.get(f"/journeys/{token}", params={"stopovers": "true"})).json() if token else None
+        locations = (await client.get("/locations", params={"query": query, "results": 1})).json()
+
+    for name, body in (("departures", departures), ("journeys", journeys), ("refresh", refresh), ("locations", locations)):
+        if body is None:
+            continue
+        with open(os.path.join(out, FIXTURE_FILES[name]), "w", encoding="utf-8") as f:
+            json.dump({"_recorded_at": recorded_at, "body": body}, f)
+    print(f"✅ Fixtures recorded to {out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve")
+    serve.add_argument("--port", type=int, default=9300)
+    serve.add_argument("--latency-ms", type=float, default=50)
+    serve.add_argument("--jitter-ms", type=float, default=25)
+    serve.add_argument("--error-rate", type=float, default=0.0)
+    serve.add_argument("--fixtures")
+
+    rec = sub.add_parser("record")
+    rec.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "fixtures"))
+    rec.add_argument("--base-url", default="https://v6.vbb.transport.rest")
+    rec.add_argument("--station", default="900100003")
+    rec.add_argument("--from-id", default="900100003")
+    rec.add_argument("--to-id", default="900003201")
+    rec.add_argument("--query", default="alexanderplatz")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        settings = FakeSettings(args.latency_ms, args.jitter_ms, args.error_rate, args.fixtures)
+        uvicorn.run(create_app(settings), host="127.0.0.1", port=args.port, log_level="warning")
+    else:
+        asyncio.run(record(args.out, args.base_url, args.station, args.from_id, args.to_id, args.query))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+# app/benchmarks/transport_bench.py
+"""
+Hermetic load benchmark for the transport endpoints.
+
+Starts the fake transport.rest server (benchmarks.fake_vbb) in-process,
+launches the real app with VBB_BASE_URL pointing at it, then drives
+/transport/departures, /transport/journey and /transport/stations at a
+fixed concurrency. Each scenario reports throughput, p50/p95/p99
+latency, upstream calls and cache hit rates. Redis is the local instance
+the app always connects to (127.0.0.1:6379, see db/db_redis.py), and
+transport cache keys are cleared before each scenario unless --keep-cache
+is given.
+
+    cd app
+    python -m benchmarks.transport_bench --concurrency 50 --requests 2000 --latency-ms 80
+    python -m benchmarks.transport_bench --scenarios departures --error-rate 0.05 --json out.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from itertools import accumulate
+
+import httpx
+import uvicorn
+
+from benchmarks.fake_vbb import FakeSettings, create_app
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ("departures", "journey", "stations")
+# Cache counters each scenario's hit rate is computed from
+CACHE_METRICS = {"departures": "departures_cache", "journey": "journey_cache"}
+CACHE_KEY_PATTERNS = ("departures:*", "journeys:*", "journey:*", "lock:*")
+
+STATION_NAMES = [
+    "alexanderplatz", "zoologischer garten", "friedrichstrasse", "hauptbahnhof",
+    "warschauer strasse", "ostkreuz", "potsdamer platz", "hermannplatz",
+    "spandau", "wannsee", "gesundbrunnen", "suedkreuz",
+]
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    requests: int
+    errors: int
+    seconds: float
+    throughput_rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    upstream_calls: int
+    upstream_errors: int
+    upstream_by_endpoint: dict = field(default_factory=dict)
+    cache_hit_rate: float | None = None
+
+
+def _percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[round(p * (len(sorted_values) - 1))]
+
+
+class _Zipf:
+    """Skewed picks, so a few hot stations dominate like in production traffic."""
+
+    def __init__(self, items: list, s: float, rng: random.Random):
+        self.items = items
+        self.cum_weights = list(accumulate(1 / (rank ** s) for rank in range(1, len(items) + 1)))
+        self.rng = rng
+
+    def pick(self):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+
+def _request_factory(scenario: str, args, rng: random.Random):
+    stations = _Zipf([f"9001{i:05d}" for i in range(args.stations)], args.zipf, rng)
+    if scenario == "departures":
+        return lambda: ("/transport/departures", {"station_id": stations.pick(), "duration": 60})
+    if scenario == "journey":
+        def journey():
+            origin, destination = stations.pick(), stations.pick()
+            while destination == origin:
+                destination = stations.pick()
+            params = {"from_station": origin, "to_station": destination}
+            if rng.random() < args.name_share:
+                # Exercises /locations resolution as well
+                params["from_station"] = rng.choice(STATION_NAMES)
+            return "/transport/journey", params
+        return journey
+
+    def suggest():
+        name = rng.choice(STATION_NAMES)
+        return "/transport/stations", {"q": name[: rng.randint(2, len(name))], "limit": 10}
+    return suggest
+
+
+def _flush_transport_cache():
+    from db.db_redis import redis_client
+
+    removed = 0
+    for pattern in CACHE_KEY_PATTERNS:
+        keys = list(redis_client.scan_iter(match=pattern, count=1000))
+        for i in range(0, len(keys), 500):
+            removed += redis_client.delete(*keys[i:i + 500])
+    return removed
+
+
+def _cache_counters(stats: dict, prefix: str) -> tuple[float, float]:
+    counters = stats.get("metrics", {})
+    return counters.get(f"{prefix}:hit", 0), counters.get(f"{prefix}:miss", 0)
+
+
+async def _drive(client: httpx.AsyncClient, next_request, total: int, concurrency: int):
+    latencies: list[float] = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            path, params = next_request()
+            started = time.perf_counter()
+            try:
+                response = await client.get(path, params=params)
+                body = response.json()
+                failed = response.status_code >= 400 or (isinstance(body, dict) and body.get("status") == "error")
+            except (httpx.HTTPError, ValueError):
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run_scenario(scenario: str, args, app: httpx.AsyncClient, fake: httpx.AsyncClient) -> ScenarioResult:
+    if not args.keep_cache:
+        _flush_transport_cache()
+    await fake.post("/__reset")
+    before = (await app.get("/transport/stats")).json()
+
+    rng = random.Random(args.seed)
+    latencies, errors, seconds = await _drive(app, _request_factory(scenario, args, rng), args.requests, args.concurrency)
+
+    if args.workers > 1:
+        # Other workers flush their counters on their own schedule
+        await asyncio.sleep(args.metrics_flush_wait)
+    after = (await app.get("/transport/stats")).json()
+    upstream = (await fake.get("/__stats")).json()
+
+    hit_rate = None
+    if scenario in CACHE_METRICS:
+        hits0, misses0 = _cache_counters(before, CACHE_METRICS[scenario])
+        hits1, misses1 = _cache_counters(after, CACHE_METRICS[scenario])
+        lookups = (hits1 - hits0) + (misses1 - misses0)
+        hit_rate = round((hits1 - hits0) / lookups, 4) if lookups else None
+
+    latencies.sort()
+    return ScenarioResult(
+        scenario=scenario,
+        requests=len(latencies),
+        errors=errors,
+        seconds=round(seconds, 3),
+        throughput_rps=round(len(latencies) / seconds, 1) if seconds else 0.0,
+        p50_ms=round(_percentile(latencies, 0.50) * 1000, 1),
+        p95_ms=round(_percentile(latencies, 0.95) * 1000, 1),
+        p99_ms=round(_percentile(latencies, 0.99) * 1000, 1),
+        upstream_calls=sum(v for k, v in upstream.items() if not k.endswith(":errors")),
+        upstream_errors=sum(v for k, v in upstream.items() if k.endswith(":errors")),
+        upstream_by_endpoint=upstream,
+        cache_hit_rate=hit_rate,
+    )
+
+
+def _start_app(args, fake_url: str) -> subprocess.Popen:
+    env = {**os.environ, "VBB_BASE_URL": fake_url, "PYTHONUNBUFFERED": "1"}
+    command = [
+        sys.executable, "-m", "uvicorn", args.app,
+        "--host", "127.0.0.1", "--port", str(args.app_port),
+        "--workers", str(args.workers), "--log-level", "warning",
+    ]
+    return subprocess.Popen(command, cwd=APP_DIR, env=env)
+
+
+async def _wait_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited with code {process.returncode}")
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.25)
+    raise TimeoutError("App did not become ready")
+
+
+def _print_report(results: list[ScenarioResult]):
+    header = f"{'scenario':<12}{'reqs':>7}{'err':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'upstream':>10}{'up/req':>8}{'hit rate':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        per_request = r.upstream_calls / r.requests if r.requests else 0
+        hit_rate = f"{r.cache_hit_rate:.1%}" if r.cache_hit_rate is not None else "n/a"
+        print(
+            f"{r.scenario:<12}{r.requests:>7}{r.errors:>6}{r.throughput_rps:>9.1f}{r.p50_ms:>9.1f}"
+            f"{r.p95_ms:>9.1f}{r.p99_ms:>9.1f}{r.upstream_calls:>10}{per_request:>8.3f}{hit_rate:>10}"
+        )
+    for r in results:
+        print(f"  {r.scenario} upstream: {json.dumps(r.upstream_by_endpoint, sort_keys=True)}")
+
+
+async def main(args):
+    settings = FakeSettings(args.latency_ms, args.jitter_ms, args.error_rate, args.fixtures, args.seed)
+    fake_server = uvicorn.Server(uvicorn.Config(
+        create_app(settings), host="127.0.0.1", port=args.fake_port, log_level="warning",
+    ))
+    fake_task = asyncio.create_task(fake_server.serve())
+    while not fake_server.started:
+        await asyncio.sleep(0.05)
+
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    process = _start_app(args, fake_url)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = []
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.app_port}", timeout=60, limits=limits) as app, \
+                httpx.AsyncClient(base_url=fake_url, timeout=10) as fake:
+            await _wait_ready(app, process, args.startup_timeout)
+            for scenario in args.scenarios.split(","):
+                print(f"🚆 Running {scenario}: {args.requests} requests at concurrency {args.concurrency}")
+                results.append(await run_scenario(scenario.strip(), args, app, fake))
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        fake_server.should_exit = True
+        await fake_task
+
+    _print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": [asdict(r) for r in results]}, f, indent=2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--stations", type=int, default=200, help="distinct station IDs in the request mix")
+    parser.add_argument("--zipf", type=float, default=1.1, help="popularity skew of the station mix")
+    parser.add_argument("--name-share", type=float, default=0.2, help="share of journeys given by station name")
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--jitter-ms", type=float, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--fixtures", help="directory with recorded fake_vbb fixtures")
+    parser.add_argument("--app", default="main:app")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--app-port", type=int, default=9301)
+    parser.add_argument("--fake-port", type=int, default=9300)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--metrics-flush-wait", type=float, default=6)
+    parser.add_argument("--keep-cache", action="store_true", help="do not clear transport keys between scenarios")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write results to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
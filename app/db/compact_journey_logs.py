@@ -0,0 +1,64 @@
+# app/db/compact_journey_logs.py
+"""
+One-off migration: fold legacy journey_logs documents (one per fetch,
+ObjectId keys) into content-addressed routes, and point user_logs at them.
+
+    cd app && python -m db.compact_journey_logs
+
+Safe to re-run; only documents without a `refs` counter are migrated.
+"""
+from pymongo import DeleteMany, UpdateMany, UpdateOne
+
+from db.journey_store import db, journey_logs, route_upsert, split_journey, storage_stats
+
+user_logs = db["user_logs"]
+
+BATCH_SIZE = 500
+
+
+def _collection_bytes() -> int:
+    return db.command("collStats", journey_logs.name).get("size", 0)
+
+
+def _migrate_batch(docs: list[dict]) -> int:
+    routes: list[UpdateOne] = []
+    user_updates: list[UpdateMany] = []
+    for doc in docs:
+        seen_at = doc["_id"].generation_time.replace(tzinfo=None)
+        journey_hash, route, instance = split_journey(doc)
+        routes.append(UpdateOne({"_id": journey_hash}, route_upsert(route, seen_at), upsert=True))
+        user_updates.append(UpdateMany(
+            {"journey_id": doc["_id"]},
+            {"$set": {"journey_hash": journey_hash, **instance}, "$unset": {"journey_id": ""}},
+        ))
+
+    # Routes first, so no user log ever points at a missing document
+    journey_logs.bulk_write(routes, ordered=False)
+    if user_updates:
+        user_logs.bulk_write(user_updates, ordered=False)
+    journey_logs.bulk_write([DeleteMany({"_id": {"$in": [d["_id"] for d in docs]}})])
+    return len(docs)
+
+
+def compact_journey_logs():
+    before = _collection_bytes()
+    migrated = 0
+    batch: list[dict] = []
+    for doc in journey_logs.find({"refs": {"$exists": False}, "legs": {"$exists": True}}):
+        batch.append(doc)
+        if len(batch) >= BATCH_SIZE:
+            migrated += _migrate_batch(batch)
+            batch = []
+            print(f"♻️ {migrated} journey logs migrated")
+    if batch:
+        migrated += _migrate_batch(batch)
+
+    after = _collection_bytes()
+    stats = storage_stats()
+    print(f"✅ Migrated {migrated} journey logs into {stats['routes']} routes")
+    print(f"💾 journey_logs: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB "
+          f"(dedup ratio {stats['dedup_ratio']}, {stats['saved_bytes'] / 1e6:.1f} MB saved overall)")
+
+
+if __name__ == "__main__":
+    compact_journey_logs()
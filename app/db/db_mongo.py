@@ -13,6 +13,9 @@ db = client["Explorix"]
 
 # -------- Collections --------
 station_logs = db["station_logs"]
+# Every VBB station, bulk-synced from the GTFS feed (transport/station_catalog.py)
+station_catalog = db["station_catalog"]
+catalog_versions = db["catalog_versions"]
 user_logs = db["user_logs"]
 journey_logs = db["journey_logs"]
 posts = db["posts"]
@@ -15,6 +15,13 @@ def get_cached_departure(key):
     return json.loads(val) if val else None
 
 
+def get_cached_departures(keys):
+    """One round trip for many keys; missing entries come back as None."""
+    if not keys:
+        return []
+    return [json.loads(val) if val else None for val in redis_client.mget(keys)]
+
+
 def _to_serializable(value):
     if isinstance(value, dict):
         return {str(k): _to_serializable(v) for k, v in value.items()}
@@ -0,0 +1,90 @@
+# db/journey_store.py
+import hashlib
+import json
+import os
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+load_dotenv()
+
+client = MongoClient(os.getenv("MONGO_URI"))
+db = client["Vbb_transport"]
+journey_logs = db["journey_logs"]
+
+# Per-run values; everything else describes the route and is stored once
+INSTANCE_FIELDS = ("departure", "arrival", "duration", "platform", "delay")
+# Never persisted: short-lived upstream handles and response-only flags
+TRANSIENT_FIELDS = ("_id", "refreshToken", "handle", "realtime", "stale")
+# Bookkeeping on stored routes, not part of a journey
+STORE_FIELDS = ("refs", "first_seen", "last_seen")
+# What makes two legs the same; the hash covers nothing else, so list and
+# full views of one journey (with or without stopovers) share a route.
+# Station IDs stay out: legacy logs never recorded them, and the migrated
+# routes must hash like the ones the live path writes
+LEG_IDENTITY_FIELDS = ("line", "mode", "origin", "destination")
+
+
+def split_journey(journey: dict) -> tuple[str, dict, dict]:
+    """
+    Split a formatted journey into (hash, route, instance). The route (lines,
+    stops, coordinates) is what repeats across users and days; the instance
+    holds the times of this particular run and goes on the user log. The
+    hash is taken over each leg's identity only.
+    """
+    skip = set(INSTANCE_FIELDS) | set(TRANSIENT_FIELDS)
+    route = {k: v for k, v in journey.items() if k not in skip}
+    route["legs"] = [
+        {
+            **{k: v for k, v in leg.items() if k not in ("departure", "arrival", "stopovers")},
+            "stopovers": [{"name": stop.get("name")} for stop in leg.get("stopovers") or []],
+        }
+        for leg in journey["legs"]
+    ]
+    instance = {k: journey.get(k) for k in INSTANCE_FIELDS}
+    instance["leg_times"] = [[leg.get("departure"), leg.get("arrival")] for leg in journey["legs"]]
+
+    identity = [{k: leg.get(k) for k in LEG_IDENTITY_FIELDS} for leg in journey["legs"]]
+    canonical = json.dumps(identity, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest(), route, instance
+
+
+def merge_journey(route: dict, instance: dict) -> dict:
+    """Inverse of split_journey, for whatever the instance recorded."""
+    journey = {k: v for k, v in route.items() if k not in STORE_FIELDS}
+    journey.update({k: instance.get(k) for k in INSTANCE_FIELDS})
+    leg_times = instance.get("leg_times") or []
+    journey["legs"] = [
+        {**leg, "departure": times[0], "arrival": times[1]} if times else dict(leg)
+        for leg, times in zip(route["legs"], leg_times + [None] * (len(route["legs"]) - len(leg_times)))
+    ]
+    return journey
+
+
+def route_upsert(route: dict, now) -> dict:
+    """Update document that stores a route on first sight and counts every later reference."""
+    return {
+        "$setOnInsert": {**route, "first_seen": now},
+        "$inc": {"refs": 1},
+        "$max": {"last_seen": now},
+    }
+
+
+def storage_stats() -> dict:
+    """Stored size of the deduplicated routes and what storing every reference would have cost."""
+    result = list(journey_logs.aggregate([
+        {"$match": {"refs": {"$exists": True}}},
+        {"$project": {"refs": 1, "size": {"$bsonSize": "$$ROOT"}}},
+        {"$group": {
+            "_id": None,
+            "routes": {"$sum": 1},
+            "references": {"$sum": "$refs"},
+            "stored_bytes": {"$sum": "$size"},
+            "saved_bytes": {"$sum": {"$multiply": [{"$subtract": ["$refs", 1]}, "$size"]}},
+        }},
+    ]))
+    stats = result[0] if result else {"routes": 0, "references": 0, "stored_bytes": 0, "saved_bytes": 0}
+    stats.pop("_id", None)
+    stats["legacy_documents"] = journey_logs.count_documents({"refs": {"$exists": False}})
+    stats["dedup_ratio"] = round(stats["references"] / stats["routes"], 2) if stats["routes"] else None
+    return stats
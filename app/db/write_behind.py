@@ -0,0 +1,231 @@
+# db/write_behind.py
+import asyncio
+import json
+import os
+
+from bson import json_util
+from dotenv import load_dotenv
+from pymongo import InsertOne, MongoClient, UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, PyMongoError
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # app/
+
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", 500))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", 2))
+WRITE_BEHIND_SPILL_PATH = os.getenv(
+    "WRITE_BEHIND_SPILL_PATH", os.path.join(BASE_DIR, "tmp", "write_behind.jsonl")
+)
+# Beyond this many queued writes (e.g. Mongo down for a long time) we spill to disk
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", 50_000))
+
+DUPLICATE_KEY = 11000
+
+client = MongoClient(os.getenv("MONGO_URI"))
+
+# Queued writes as plain records so they can be spilled and replayed:
+#   {"ns": "db.collection", "op": "insert", "doc": {...}}
+#   {"ns": "db.collection", "op": "upsert", "filter": {...}, "update": {...}}
+#   {"ns": "db.collection", "op": "update", "filter": {...}, "update": {...}}
+_inserts: list[dict] = []
+# Updates to the same document are merged while they wait
+_upserts: dict[tuple[str, str, str], dict] = {}
+_wake: asyncio.Event | None = None
+_flush_lock: asyncio.Lock | None = None
+# Batches handed to a writer thread; they finish even if their flush is cancelled
+_writing: set[asyncio.Task] = set()
+
+
+def pending() -> int:
+    return len(_inserts) + len(_upserts)
+
+
+def _signal_if_full():
+    if _wake is not None and pending() >= WRITE_BEHIND_BATCH_SIZE:
+        _wake.set()
+
+
+def enqueue_insert(collection: Collection, doc: dict):
+    _inserts.append({"ns": collection.full_name, "op": "insert", "doc": doc})
+    _signal_if_full()
+
+
+def _merge_update(current: dict, update: dict) -> dict:
+    merged = {op: dict(fields) for op, fields in current.items()}
+    for op, fields in update.items():
+        target = merged.setdefault(op, {})
+        for field, value in fields.items():
+            target[field] = target.get(field, 0) + value if op == "$inc" else value
+    return merged
+
+
+def _update_key(record: dict) -> tuple[str, str, str]:
+    return record["ns"], record["op"], json_util.dumps(record["filter"], sort_keys=True)
+
+
+def _enqueue_update(op: str, collection: Collection, filter_doc: dict, update: dict):
+    record = {"ns": collection.full_name, "op": op, "filter": filter_doc, "update": update}
+    key = _update_key(record)
+    existing = _upserts.get(key)
+    if existing:
+        existing["update"] = _merge_update(existing["update"], update)
+    else:
+        _upserts[key] = record
+    _signal_if_full()
+
+
+def enqueue_upsert(collection: Collection, filter_doc: dict, update: dict):
+    _enqueue_update("upsert", collection, filter_doc, update)
+
+
+def enqueue_update(collection: Collection, filter_doc: dict, update: dict):
+    """Like enqueue_upsert, but documents that do not exist are left alone."""
+    _enqueue_update("update", collection, filter_doc, update)
+
+
+def _requeue(records: list[dict]):
+    for record in records:
+        if record["op"] == "insert":
+            _inserts.append(record)
+        else:
+            key = _update_key(record)
+            if key in _upserts:
+                # A newer update arrived meanwhile; apply ours underneath it
+                _upserts[key]["update"] = _merge_update(record["update"], _upserts[key]["update"])
+            else:
+                _upserts[key] = record
+    if pending() > WRITE_BEHIND_MAX_PENDING:
+        spill()
+
+
+def _collection(ns: str) -> Collection:
+    db_name, collection_name = ns.split(".", 1)
+    return client[db_name][collection_name]
+
+
+def _to_request(record: dict):
+    if record["op"] == "insert":
+        return InsertOne(record["doc"])
+    return UpdateOne(record["filter"], record["update"], upsert=record["op"] == "upsert")
+
+
+def _write(records: list[dict]) -> list[dict]:
+    """Bulk-write records grouped by collection; returns the ones to retry."""
+    by_ns: dict[str, list[dict]] = {}
+    for record in records:
+        by_ns.setdefault(record["ns"], []).append(record)
+
+    failed: list[dict] = []
+    for ns, batch in by_ns.items():
+        try:
+            _collection(ns).bulk_write([_to_request(r) for r in batch], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                record = batch[error["index"]]
+                # A duplicate insert means an earlier attempt already landed; a
+                # duplicate upsert lost a race to create the document and is
+                # retried so its update still applies
+                if error.get("code") != DUPLICATE_KEY or record["op"] != "insert":
+                    failed.append(record)
+            if failed:
+                print(f"⚠️ {len(failed)} writes to {ns} failed, will retry")
+        except PyMongoError as e:
+            print(f"⚠️ Bulk write to {ns} failed, will retry:", e)
+            failed.extend(batch)
+    return failed
+
+
+def _take() -> list[dict]:
+    records = _inserts[:] + list(_upserts.values())
+    _inserts.clear()
+    _upserts.clear()
+    return records
+
+
+async def _write_batch(records: list[dict]):
+    failed = await asyncio.to_thread(_write, records)
+    if failed:
+        _requeue(failed)
+
+
+async def flush():
+    global _flush_lock
+    if _flush_lock is None:
+        _flush_lock = asyncio.Lock()
+    async with _flush_lock:
+        records = _take()
+        if not records:
+            return
+        # The writer thread cannot be stopped mid-batch, so a cancelled flush
+        # leaves it running; it requeues only what actually failed, and
+        # nothing is written twice
+        task = asyncio.create_task(_write_batch(records))
+        _writing.add(task)
+        task.add_done_callback(_writing.discard)
+        await asyncio.shield(task)
+
+
+async def run_flusher():
+    """Flush every WRITE_BEHIND_FLUSH_SECONDS, or sooner once a batch fills up."""
+    global _wake
+    _wake = asyncio.Event()
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=WRITE_BEHIND_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        try:
+            await flush()
+        except Exception as e:
+            print("⚠️ Write-behind flush failed:", e)
+
+
+def spill():
+    """Append everything still queued to the spill file for the next start to replay."""
+    records = _take()
+    if not records:
+        return
+    os.makedirs(os.path.dirname(WRITE_BEHIND_SPILL_PATH), exist_ok=True)
+    with open(WRITE_BEHIND_SPILL_PATH, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json_util.dumps(record) + "\n")
+    print(f"💾 Spilled {len(records)} pending writes to {WRITE_BEHIND_SPILL_PATH}")
+
+
+def replay_spill():
+    if not os.path.exists(WRITE_BEHIND_SPILL_PATH):
+        return
+    # Claim the file first so only one worker replays it
+    claimed = f"{WRITE_BEHIND_SPILL_PATH}.{os.getpid()}"
+    try:
+        os.replace(WRITE_BEHIND_SPILL_PATH, claimed)
+    except FileNotFoundError:
+        return
+    records = []
+    with open(claimed, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json_util.loads(line))
+            except json.JSONDecodeError:
+                print("⚠️ Skipping corrupt spill line")
+    _requeue(records)
+    os.remove(claimed)
+    print(f"💾 Replaying {len(records)} spilled writes")
+
+
+async def shutdown(timeout: float = 5):
+    """Last flush on the way out; whatever Mongo does not take in time is spilled."""
+    try:
+        await asyncio.wait_for(flush(), timeout=timeout)
+    except Exception as e:
+        print("⚠️ Final write-behind flush failed:", e)
+    if _writing:
+        # Let batches already in Mongo's hands report what failed before spilling
+        await asyncio.wait(set(_writing), timeout=timeout)
+    spill()
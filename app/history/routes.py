@@ -3,7 +3,8 @@ from bson import ObjectId
 
 from history.service import (
     log_user_journey,
-    get_user_history
+    get_user_history,
+    get_journey_storage_stats,
 )
 
 router = APIRouter(prefix="/history", tags=["User History"])
@@ -17,7 +18,9 @@ async def log_journey(request: Request):
         user_id=data["user_id"],
         from_station=data["from_station"],
         to_station=data["to_station"],
-        journey_id=data["journey_id"]
+        journey_id=data["journey_id"],
+        departure=data.get("departure"),
+        arrival=data.get("arrival"),
     )
 
     return {"message": "Journey logged"}
@@ -33,3 +36,8 @@ def user_history(user_id: str = Query(...)):
             log["_id"] = str(log["_id"])
 
     return {"logs": logs}
+
+
+@router.get("/journey-storage")
+def journey_storage():
+    return get_journey_storage_stats()
@@ -6,6 +6,8 @@ from bson import ObjectId
 from pymongo import MongoClient
 from dotenv import load_dotenv
 
+from db.journey_store import merge_journey, storage_stats
+
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
@@ -20,31 +22,47 @@ def log_user_journey(
     user_id: str,
     from_station: str,
     to_station: str,
-    journey_id: str
+    journey_id: str,
+    departure: str | None = None,
+    arrival: str | None = None,
 ):
-    user_logs.insert_one({
+    log = {
         "user_id": user_id,
         "from": from_station,
         "to": to_station,
         "timestamp": datetime.utcnow(),
-        "journey_id": ObjectId(journey_id)
-    })
+    }
+    # Journeys logged before content-addressing still use ObjectIds
+    if ObjectId.is_valid(journey_id) and len(journey_id) == 24:
+        log["journey_id"] = ObjectId(journey_id)
+    else:
+        log["journey_hash"] = journey_id
+        log["departure"] = departure
+        log["arrival"] = arrival
+    user_logs.insert_one(log)
 
 
 def get_user_history(user_id: str):
     logs = list(user_logs.find({"user_id": user_id}))
-    journey_ids = [log["journey_id"] for log in logs]
+    keys = [log.get("journey_hash") or log.get("journey_id") for log in logs]
 
-    journeys = journey_logs.find({"_id": {"$in": journey_ids}})
+    journeys = journey_logs.find({"_id": {"$in": [k for k in keys if k is not None]}})
     journeys_by_id = {j["_id"]: j for j in journeys}
 
     history = []
-    for log in logs:
-        journey = journeys_by_id.get(log["journey_id"])
-        if journey:
-            journey["viewed_at"] = log["timestamp"]
-            journey["from"] = log["from"]
-            journey["to"] = log["to"]
-            history.append(journey)
+    for log, key in zip(logs, keys):
+        stored = journeys_by_id.get(key)
+        if not stored:
+            continue
+        # Shared routes get this log's own times; legacy documents are complete already
+        journey = merge_journey(stored, log) if "journey_hash" in log else dict(stored)
+        journey["viewed_at"] = log["timestamp"]
+        journey["from"] = log["from"]
+        journey["to"] = log["to"]
+        history.append(journey)
 
     return history
+
+
+def get_journey_storage_stats():
+    return storage_stats()
@@ -11,6 +11,7 @@ from chat.routes import router as chat_router
 # from app.places.search_routes import router as search_router
 
 from transport.routes import router as transport_router
+from transport import background as transport_background
 from history.routes import router as history_router
 from social.routes import router as social_router
 from itinerary.routes import router as itinerary_router
@@ -63,6 +64,16 @@ app.include_router(post_save_router)
 app.include_router(uploads_router)
 
 
+# ---- Lifecycle ----
+@app.on_event("startup")
+async def startup():
+    await transport_background.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await transport_background.stop()
+
 
 
 # ---- Health check ----
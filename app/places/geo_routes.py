@@ -4,6 +4,7 @@ from sqlalchemy.sql import text
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.postgres import get_db
 from core.dependencies import get_current_user
+from transport.isochrone import ISOCHRONE_MAX_MINUTES, WALK_METERS_PER_SECOND, egress_rows, isochrone_stations
 import os
 import requests
 
@@ -106,6 +107,95 @@ async def nearby_features(
     return [dict(row._mapping) for row in result.fetchall()]
 
 
+@router.get("/isochrone")
+async def isochrone_features(
+    lat: float,
+    lon: float,
+    minutes: int = Query(30, ge=5, le=ISOCHRONE_MAX_MINUTES),
+    departure: str | None = None,
+    category: str | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user),  # 🔒 AUTH
+):
+    """Places reachable within `minutes` by public transport plus walking, quickest first."""
+    try:
+        isochrone = await isochrone_stations(lat, lon, minutes, departure)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    if isochrone is None:
+        raise HTTPException(status_code=503, detail="Offline timetable is not loaded (set GTFS_PATH).")
+
+    rows = egress_rows(isochrone)
+    # Each reached stop is one row; a place takes its quickest stop within walking range
+    sql = """
+    WITH reach AS (
+        SELECT *
+        FROM unnest(
+            CAST(:lons AS float8[]),
+            CAST(:lats AS float8[]),
+            CAST(:seconds AS int[]),
+            CAST(:radii AS float8[])
+        ) AS r(lon, lat, seconds, radius)
+    )
+    SELECT
+        p.id,
+        p.title,
+        p.category,
+        ST_Y(p.geo::geometry) AS latitude,
+        ST_X(p.geo::geometry) AS longitude,
+        ROUND(MIN(
+            r.seconds + ST_Distance(p.geo, ST_MakePoint(r.lon, r.lat)::geography) / :walk_speed
+        )) AS travel_seconds
+    FROM reach r
+    JOIN poi p
+      ON p.geo IS NOT NULL
+     AND ST_DWithin(p.geo, ST_MakePoint(r.lon, r.lat)::geography, r.radius)
+    WHERE TRUE
+    """
+
+    params = {
+        "lons": [row[0] for row in rows],
+        "lats": [row[1] for row in rows],
+        "seconds": [row[2] for row in rows],
+        "radii": [row[3] for row in rows],
+        "walk_speed": WALK_METERS_PER_SECOND,
+        "budget": minutes * 60,
+        "limit": limit,
+    }
+
+    canonical_categories, keyword_filters = _split_categories(category)
+    if canonical_categories:
+        sql += " AND p.main_category = ANY(:main_categories)"
+        params["main_categories"] = canonical_categories
+
+    if keyword_filters:
+        sql += " AND (" + " OR ".join(
+            [f"p.category ILIKE :cat{i}" for i in range(len(keyword_filters))]
+        ) + ")"
+        for i, token in enumerate(keyword_filters):
+            params[f"cat{i}"] = f"%{token}%"
+
+    sql += """
+    GROUP BY p.id
+    HAVING MIN(r.seconds + ST_Distance(p.geo, ST_MakePoint(r.lon, r.lat)::geography) / :walk_speed) <= :budget
+    ORDER BY travel_seconds, p.id
+    LIMIT :limit
+    """
+
+    result = await db.execute(text(sql), params)
+    return {
+        "origin": isochrone["origin"],
+        "departure": isochrone["departure"],
+        "minutes": minutes,
+        "reachable_stations": len(isochrone["stations"]),
+        "places": [
+            {**row._mapping, "travel_minutes": round(row.travel_seconds / 60)}
+            for row in result.fetchall()
+        ],
+    }
+
+
 @router.get("/route")
 async def route_to_place(
     origin_lat: float,
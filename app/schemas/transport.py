@@ -0,0 +1,7 @@
+# schemas/transport.py
+from pydantic import BaseModel, Field
+
+
+class JourneyRefreshBatchRequest(BaseModel):
+    tokens: list[str] = Field(..., min_length=1, max_length=50)
+    stopovers: bool = False
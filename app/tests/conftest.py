@@ -0,0 +1,71 @@
+import csv
+import os
+import sys
+
+import pytest
+
+# Tests import app modules the way main.py does (`from transport import ...`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transport.gtfs import build_timetable  # noqa: E402
+
+
+def _hhmmss(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}:00"
+
+
+def write_feed(path, stops: dict, lines: list[dict]):
+    """
+    Write a minimal GTFS feed running every day.
+
+    stops: {stop_id: (name, lat, lon)}
+    lines: {"name", "type", "stops", "first" (minutes after midnight),
+            "headway", "count", "ride" (minutes per hop)}
+    """
+    os.makedirs(path, exist_ok=True)
+
+    def table(name: str, header: list[str], rows):
+        with open(os.path.join(path, name), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    table("stops.txt", ["stop_id", "stop_name", "stop_lat", "stop_lon", "parent_station"], [
+        [stop_id, name, lat, lon, ""] for stop_id, (name, lat, lon) in stops.items()
+    ])
+    table("calendar.txt", [
+        "service_id", "monday", "tuesday", "wednesday", "thursday", "friday",
+        "saturday", "sunday", "start_date", "end_date",
+    ], [["daily", 1, 1, 1, 1, 1, 1, 1, "20200101", "20351231"]])
+    table("routes.txt", ["route_id", "route_short_name", "route_type"], [
+        [line["name"], line["name"], line.get("type", 3)] for line in lines
+    ])
+
+    trips, stop_times = [], []
+    for line in lines:
+        for i in range(line["count"]):
+            trip_id = f"{line['name']}-{i}"
+            trips.append([line["name"], "daily", trip_id, ""])
+            start = line["first"] + i * line["headway"]
+            for seq, stop_id in enumerate(line["stops"]):
+                at = _hhmmss(start + seq * line.get("ride", 5))
+                stop_times.append([trip_id, at, at, stop_id, seq + 1])
+    table("trips.txt", ["route_id", "service_id", "trip_id", "trip_headsign"], trips)
+    table("stop_times.txt", ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"], stop_times)
+    return path
+
+
+@pytest.fixture
+def feed_timetable(tmp_path):
+    """Build a Timetable from stops and lines as described in write_feed."""
+    def build(stops: dict, lines: list[dict]):
+        return build_timetable(str(write_feed(tmp_path / "gtfs", stops, lines)))
+    return build
+
+
+@pytest.fixture
+def fake_redis():
+    """In-memory Redis with Lua support; tests patch it into the modules they exercise."""
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return fakeredis.FakeRedis(decode_responses=True)
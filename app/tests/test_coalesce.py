@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from transport import coalesce
+
+
+@pytest.fixture
+def redis_store(fake_redis, monkeypatch):
+    monkeypatch.setattr(coalesce, "redis_client", fake_redis)
+    monkeypatch.setattr(coalesce, "_RELEASE_SCRIPT", fake_redis.register_script(coalesce._RELEASE_SCRIPT.script))
+    monkeypatch.setattr(coalesce, "POLL_INTERVAL_SECONDS", 0.01)
+    return fake_redis
+
+
+class Cache:
+    def __init__(self):
+        self.value = None
+        self.fetches = 0
+
+    def read(self):
+        return self.value
+
+    def write(self, value):
+        self.value = value
+
+    async def fetch(self):
+        self.fetches += 1
+        await asyncio.sleep(0.05)
+        return {"departures": self.fetches}
+
+
+def test_concurrent_callers_share_one_fetch(redis_store):
+    cache = Cache()
+
+    async def main():
+        return await asyncio.gather(*(
+            coalesce.single_flight("dep:1", cache.fetch, cache.read, cache.write) for _ in range(10)
+        ))
+
+    results = asyncio.run(main())
+
+    assert cache.fetches == 1
+    assert results == [{"departures": 1}] * 10
+    assert cache.value == {"departures": 1}
+    assert not redis_store.exists("lock:dep:1")
+    assert coalesce._inflight == {}
+
+
+def test_waits_for_another_workers_result(redis_store):
+    cache = Cache()
+    redis_store.set("lock:dep:2", "other-worker", px=5000)
+
+    async def other_worker():
+        await asyncio.sleep(0.05)
+        cache.write({"departures": "theirs"})
+        redis_store.delete("lock:dep:2")
+
+    async def main():
+        publisher = asyncio.create_task(other_worker())
+        result = await coalesce.single_flight("dep:2", cache.fetch, cache.read, cache.write)
+        await publisher
+        return result
+
+    assert asyncio.run(main()) == {"departures": "theirs"}
+    assert cache.fetches == 0
+
+
+def test_retakes_the_lock_when_the_owner_fails(redis_store):
+    cache = Cache()
+    redis_store.set("lock:dep:3", "other-worker", px=5000)
+
+    async def failing_owner():
+        await asyncio.sleep(0.03)
+        redis_store.delete("lock:dep:3")
+
+    async def main():
+        owner = asyncio.create_task(failing_owner())
+        result = await coalesce.single_flight("dep:3", cache.fetch, cache.read, cache.write)
+        await owner
+        return result
+
+    assert asyncio.run(main()) == {"departures": 1}
+    assert cache.fetches == 1
+
+
+def test_cancelled_caller_does_not_cancel_the_fetch(redis_store):
+    cache = Cache()
+
+    async def main():
+        first = asyncio.create_task(coalesce.single_flight("dep:4", cache.fetch, cache.read, cache.write))
+        second = asyncio.create_task(coalesce.single_flight("dep:4", cache.fetch, cache.read, cache.write))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == {"departures": 1}
+    assert cache.value == {"departures": 1}
+
+
+def test_release_leaves_a_lock_taken_by_someone_else(redis_store):
+    token = coalesce.try_lock("lock:dep:5")
+    assert token
+    assert coalesce.try_lock("lock:dep:5") is None
+
+    # Our lock expired and another worker took it over
+    redis_store.set("lock:dep:5", "other-worker")
+    coalesce.release_lock("lock:dep:5", token)
+    assert redis_store.get("lock:dep:5") == "other-worker"
+
+
+def test_refresh_if_owner_skips_when_locked(redis_store):
+    cache = Cache()
+    redis_store.set("lock:dep:6", "other-worker", px=5000)
+    assert asyncio.run(coalesce.refresh_if_owner("dep:6", cache.fetch, cache.write)) is None
+    assert cache.fetches == 0
+
+
+def test_redis_down_fetches_uncoordinated(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    server.connected = False
+    down = fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(coalesce, "redis_client", down)
+    monkeypatch.setattr(coalesce, "_RELEASE_SCRIPT", down.register_script(coalesce._RELEASE_SCRIPT.script))
+    cache = Cache()
+
+    result = asyncio.run(coalesce.single_flight("dep:7", cache.fetch, cache.read, cache.write))
+
+    assert result == {"departures": 1}
+    assert cache.value == {"departures": 1}
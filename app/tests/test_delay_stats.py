@@ -0,0 +1,69 @@
+import os
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+from transport import delay_stats
+
+
+@pytest.fixture
+def store(monkeypatch, tmp_path, fake_redis):
+    monkeypatch.setattr(delay_stats, "redis_client", fake_redis)
+    monkeypatch.setattr(delay_stats, "_RECORD_SCRIPT", fake_redis.register_script(delay_stats._RECORD_SCRIPT.script))
+    monkeypatch.setattr(delay_stats, "DELAY_STORE_PATH", str(tmp_path / "delays"))
+    monkeypatch.setattr(delay_stats, "_pending", {})
+    monkeypatch.setattr(delay_stats, "_segments", {})
+    return fake_redis
+
+
+def _departure(trip_id: str, delay: int | None, hours_ago: float = 1, **extra) -> dict:
+    planned = datetime.now(timezone.utc) - timedelta(hours=hours_ago)
+    return {"tripId": trip_id, "plannedWhen": planned.isoformat(), "delay": delay, "line": "S5", **extra}
+
+
+def test_departure_watched_twice_is_counted_once(store):
+    delay_stats.record_observations("900100003", [_departure("t1", 60), _departure("t2", 240)])
+    assert delay_stats.finalize() == 2
+    delay_stats.record_observations("900100003", [_departure("t1", 60)])
+    assert delay_stats.finalize() == 0
+
+    rollup = delay_stats.delay_rollup(line="S5", station_id="900100003")
+    assert rollup["observations"] == 2
+    assert rollup["histogram"] == {1: 1, 4: 1}
+    assert 0 < store.ttl("delays:line:S5:all") <= delay_stats.DELAY_ROLLUP_TTL_SECONDS
+
+
+def test_upcoming_departures_and_unknown_delays_wait_or_are_skipped(store):
+    delay_stats.record_observations("900100003", [
+        _departure("later", 60, hours_ago=-1),
+        _departure("no-realtime", None),
+        _departure("gone", None, cancelled=True),
+    ])
+    assert delay_stats.finalize() == 1
+    assert list(delay_stats._pending) == [("later", "900100003")]
+    assert delay_stats.delay_rollup(station_id="900100003")["cancelled"] == 1
+
+
+def test_prune_segments_drops_days_past_retention(store):
+    today = date(2026, 10, 19)
+    for day in ("2026-10-18", "2026-01-01", "not-a-day"):
+        os.makedirs(os.path.join(delay_stats.DELAY_STORE_PATH, day))
+
+    assert delay_stats.prune_segments(today) == 1
+    assert sorted(os.listdir(delay_stats.DELAY_STORE_PATH)) == ["2026-10-18", "not-a-day"]
+
+
+def test_failed_rollup_is_handed_back_not_requeued(store, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    server.connected = False
+    monkeypatch.setattr(delay_stats, "redis_client", fakeredis.FakeRedis(server=server))
+    delay_stats.record_observations("900100003", [_departure("t1", 60)])
+
+    due = delay_stats._take_due(datetime.now(timezone.utc).timestamp())
+    # _store may run in a thread: the retry goes back to the caller
+    assert delay_stats._store(due) == (0, due)
+    assert delay_stats._pending == {}
+
+    delay_stats._requeue(due)
+    assert list(delay_stats._pending) == [("t1", "900100003")]
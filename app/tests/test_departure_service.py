@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from db import db_redis
+from transport import coalesce, departure_service
+
+
+@pytest.fixture
+def redis_down(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    server.connected = False
+    down = fakeredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(db_redis, "redis_client", down)
+    monkeypatch.setattr(departure_service, "redis_client", down)
+    monkeypatch.setattr(coalesce, "redis_client", down)
+    monkeypatch.setattr(coalesce, "_RELEASE_SCRIPT", down.register_script(coalesce._RELEASE_SCRIPT.script))
+    return down
+
+
+def test_board_survives_redis_outage(redis_down, monkeypatch):
+    async def fetch(station_id, duration):
+        return [{"tripId": station_id, "when": f"2026-10-19T08:0{station_id[-1]}:00+02:00"}]
+
+    monkeypatch.setattr(departure_service, "_fetch_and_format_departures", fetch)
+
+    board = asyncio.run(departure_service.fetch_departure_board(["900000002", "900000001"]))
+
+    assert [s["station_id"] for s in board["stations"]] == ["900000002", "900000001"]
+    assert all("error" not in s for s in board["stations"])
+    assert [d["station_id"] for d in board["departures"]] == ["900000001", "900000002"]
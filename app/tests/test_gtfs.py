@@ -0,0 +1,31 @@
+from transport.gtfs import normalize_name
+
+STOPS = {
+    "900100003": ("S+U Alexanderplatz (Berlin)", 52.521, 13.411),
+    "900100001": ("S+U Friedrichstr. (Berlin)", 52.520, 13.387),
+    "900003201": ("S+U Berlin Hauptbahnhof", 52.525, 13.369),
+    "900100703": ("Alexanderstr. (Berlin)", 52.519, 13.417),
+}
+LINES = [
+    {"name": "S5", "stops": list(STOPS), "first": 8 * 60, "headway": 10, "count": 3, "type": 109},
+]
+
+
+def test_normalize_name_folds_case_and_diacritics():
+    assert normalize_name("  Görlitzer   Bahnhof ") == "gorlitzer bahnhof"
+    assert normalize_name("S+U Alexanderplatz") == "s u alexanderplatz"
+
+
+def test_find_station_by_id_and_exact_name(feed_timetable):
+    tt = feed_timetable(STOPS, LINES)
+    assert tt.find_station("900003201") == "900003201"
+    assert tt.find_station("s+u berlin hauptbahnhof") == "900003201"
+
+
+def test_find_station_word_prefix_prefers_shortest_name(feed_timetable):
+    tt = feed_timetable(STOPS, LINES)
+    assert tt.find_station("alexander") == "900100703"
+    assert tt.find_station("alexanderpl") == "900100003"
+    assert tt.find_station("hauptbahn") == "900003201"
+    assert tt.find_station("zoologischer garten") is None
+    assert tt.find_station("   ") is None
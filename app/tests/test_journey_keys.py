@@ -0,0 +1,48 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from transport.gtfs import BERLIN
+from transport.journey_keys import ALL_PRODUCTS, normalize_journey_request, parse_departure
+
+
+def test_equivalent_requests_share_a_key():
+    a = normalize_journey_request(" 900100003", "900023201 ", ["train", "BUS"], "2026-10-19T08:31:10")
+    b = normalize_journey_request("900100003", "900023201", ["BUS", "TRAIN", "bus"], "2026-10-19T08:34:59+02:00")
+    assert a.cache_key == b.cache_key
+    assert a.products == ("bus", "regional", "suburban")
+
+
+def test_departures_are_bucketed():
+    request = normalize_journey_request("a", "b", None, "2026-10-19T08:33:20")
+    expected = int(datetime(2026, 10, 19, 8, 30, tzinfo=BERLIN).timestamp())
+    assert request.departure_bucket == expected
+    assert request.departure == "2026-10-19T08:30:00+02:00"
+    assert request.rewritten
+
+
+def test_leave_now_and_all_products():
+    request = normalize_journey_request("a", "b", None, None)
+    assert request.products == ALL_PRODUCTS
+    assert request.departure_bucket is None
+    assert request.cache_key == "journeys:a:b:all:now"
+    assert not request.rewritten
+    # Unknown groups fall back to everything rather than to nothing
+    assert normalize_journey_request("a", "b", ["HOVERCRAFT"], None).products == ALL_PRODUCTS
+
+
+def test_compact_view_has_its_own_key():
+    full = normalize_journey_request("a", "b", None, None)
+    compact = normalize_journey_request("a", "b", None, None, stopovers=False)
+    assert compact.cache_key == full.cache_key + ":compact"
+
+
+def test_parse_departure():
+    assert parse_departure(None) is None
+    assert parse_departure("  ") is None
+    assert parse_departure("2026-10-19T08:30:00").tzinfo is BERLIN
+    assert parse_departure("2026-10-19T06:30:00Z") == datetime(2026, 10, 19, 6, 30, tzinfo=timezone.utc)
+    with pytest.raises(ValueError, match="Invalid departure time"):
+        parse_departure("half past eight")
+    with pytest.raises(ValueError):
+        normalize_journey_request("a", "b", None, "tomorrow")
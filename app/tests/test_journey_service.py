@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+from db import db_redis
+from transport import journey_service
+
+
+@pytest.fixture
+def redis_down(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    server.connected = False
+    down = fakeredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(db_redis, "redis_client", down)
+    monkeypatch.setattr(journey_service, "redis_client", down)
+    return down
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_redis_outage_searches_upstream(redis_down, monkeypatch, compact):
+    searched = []
+
+    async def search(params):
+        searched.append(params)
+        return [{"legs": [{"line": "U2", "origin": "Alexanderplatz", "destination": "Potsdamer Platz"}]}]
+
+    monkeypatch.setattr(journey_service, "_search_journeys", search)
+    monkeypatch.setattr(journey_service, "_log_journey", lambda journey, user_id: "hash")
+
+    result = asyncio.run(journey_service.fetch_journey("900100003", "900100020", compact=compact))
+
+    assert result["status"] == "success"
+    assert len(searched) == 1
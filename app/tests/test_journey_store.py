@@ -0,0 +1,82 @@
+import copy
+
+from db.journey_store import merge_journey, route_upsert, split_journey
+
+
+def _journey(departure="2026-10-19T08:30:00+02:00", stopovers=True) -> dict:
+    legs = [
+        {"line": "U2", "mode": "subway", "origin": "Alexanderplatz", "origin_id": "900100003",
+         "destination": "Potsdamer Platz", "destination_id": "900100020",
+         "departure": departure, "arrival": "2026-10-19T08:41:00+02:00",
+         "coordinates": [[13.41, 52.52], [13.37, 52.51]]},
+        {"line": "M41", "mode": "bus", "origin": "Potsdamer Platz", "origin_id": "900100020",
+         "destination": "Hauptbahnhof", "destination_id": "900003201",
+         "departure": "2026-10-19T08:45:00+02:00", "arrival": "2026-10-19T08:55:00+02:00"},
+    ]
+    if stopovers:
+        legs[0]["stopovers"] = [
+            {"name": "Spittelmarkt", "arrival": "2026-10-19T08:35:00+02:00", "platform": "1"},
+            {"name": "Mohrenstr.", "arrival": "2026-10-19T08:38:00+02:00", "platform": "1"},
+        ]
+    return {
+        "departure": departure, "arrival": "2026-10-19T08:55:00+02:00", "duration": 25,
+        "platform": "2", "delay": 0, "transfers": 1, "refreshToken": "abc", "stale": False,
+        "legs": legs,
+    }
+
+
+def test_hash_ignores_times_and_transient_fields():
+    first, _, _ = split_journey(_journey())
+    later = _journey(departure="2026-10-20T17:10:00+02:00")
+    later["refreshToken"] = "xyz"
+    later["delay"] = 120
+    assert split_journey(later)[0] == first
+
+
+def test_compact_and_full_views_share_a_route():
+    full, _, _ = split_journey(_journey(stopovers=True))
+    compact, _, _ = split_journey(_journey(stopovers=False))
+    assert compact == full
+
+
+def test_legacy_logs_hash_like_live_journeys():
+    legacy = _journey()
+    for leg in legacy["legs"]:
+        del leg["origin_id"], leg["destination_id"]
+    assert split_journey(legacy)[0] == split_journey(_journey())[0]
+
+
+def test_different_lines_hash_differently():
+    other = _journey()
+    other["legs"][1]["line"] = "M85"
+    assert split_journey(other)[0] != split_journey(_journey())[0]
+
+
+def test_route_drops_per_run_values():
+    _, route, instance = split_journey(_journey())
+    assert "refreshToken" not in route and "departure" not in route
+    assert route["legs"][0]["stopovers"] == [{"name": "Spittelmarkt"}, {"name": "Mohrenstr."}]
+    assert "departure" not in route["legs"][0]
+    assert instance["leg_times"][1] == ["2026-10-19T08:45:00+02:00", "2026-10-19T08:55:00+02:00"]
+
+
+def test_merge_restores_the_journey():
+    journey = _journey(stopovers=False)
+    _, route, instance = split_journey(copy.deepcopy(journey))
+    stored = route_upsert(route, "now")["$setOnInsert"]
+    stored["refs"] = 3
+
+    merged = merge_journey(stored, instance)
+
+    # Everything but the transient fields comes back; legs gain an empty stopover list
+    del journey["refreshToken"], journey["stale"]
+    for leg in journey["legs"]:
+        leg["stopovers"] = []
+    assert merged == journey
+
+
+def test_merge_tolerates_missing_leg_times():
+    _, route, _ = split_journey(_journey())
+    merged = merge_journey(route, {"departure": "x"})
+    assert merged["departure"] == "x"
+    assert [leg["line"] for leg in merged["legs"]] == ["U2", "M41"]
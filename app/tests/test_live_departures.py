@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import pytest
+
+from db import db_redis
+from transport import coalesce, live_departures
+from transport.departure_service import departure_key, store_departures
+
+
+@pytest.fixture
+def redis_store(fake_redis, monkeypatch):
+    monkeypatch.setattr(db_redis, "redis_client", fake_redis)
+    monkeypatch.setattr(coalesce, "redis_client", fake_redis)
+    monkeypatch.setattr(coalesce, "_RELEASE_SCRIPT", fake_redis.register_script(coalesce._RELEASE_SCRIPT.script))
+    return fake_redis
+
+
+def _poll(monkeypatch, upstream_rows):
+    calls = []
+
+    async def fetch(station_id, duration):
+        calls.append(station_id)
+        return upstream_rows
+
+    monkeypatch.setattr(live_departures, "_fetch_and_format_departures", fetch)
+
+    async def main():
+        poller = live_departures._StationPoller("900100003", 60)
+        poller.task.cancel()
+        return await poller._poll()
+
+    return asyncio.run(main()), calls
+
+
+def test_fresh_entry_is_served_from_cache(redis_store, monkeypatch):
+    store_departures("900100003", 60, [{"tripId": "cached"}])
+    rows, calls = _poll(monkeypatch, [{"tripId": "upstream"}])
+    assert rows == [{"tripId": "cached"}]
+    assert calls == []
+
+
+def test_long_lived_prefetch_entry_is_still_polled(redis_store, monkeypatch):
+    # The prefetcher keeps hot stations for up to ~135s; a long TTL is not freshness
+    entry = {"fetched_at": time.time() - 60, "departures": [{"tripId": "cached"}]}
+    db_redis.cache_departure(departure_key("900100003", 60), entry, ttl=135)
+    rows, calls = _poll(monkeypatch, [{"tripId": "upstream"}])
+    assert rows == [{"tripId": "upstream"}]
+    assert calls == ["900100003"]
+
+
+def test_diff_departures():
+    previous = {"a": {"when": "08:00", "delay": 0}, "b": {"when": "08:05"}}
+    current = {"a": {"when": "08:02", "delay": 120}, "c": {"when": "08:10"}}
+    assert live_departures.diff_departures(previous, current) == {
+        "changed": [{"when": "08:02", "delay": 120}],
+        "added": [{"when": "08:10"}],
+        "removed": ["b"],
+    }
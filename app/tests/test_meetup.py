@@ -0,0 +1,83 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from transport import meetup
+from transport.raptor import INF
+from transport.spatial_index import StopGrid
+
+STOPS = {
+    "900000001": ("Westend", 52.50, 13.30),
+    "900000002": ("Mitte", 52.50, 13.35),
+    "900000003": ("Ostende", 52.50, 13.40),
+    "900000004": ("Abseits", 52.60, 13.60),
+}
+
+# One line across town in each direction, 10 minutes per hop, every 10 minutes
+LINES = [
+    {"name": "E", "stops": ["900000001", "900000002", "900000003"], "first": 8 * 60, "headway": 10, "count": 12, "ride": 10},
+    {"name": "W", "stops": ["900000003", "900000002", "900000001"], "first": 8 * 60, "headway": 10, "count": 12, "ride": 10},
+]
+
+DEPARTURE = "2026-10-19T08:00:00"
+
+
+@pytest.fixture
+def town(feed_timetable, monkeypatch):
+    tt = feed_timetable(STOPS, LINES)
+    grid = StopGrid([
+        {"id": key, "name": tt.station_name(key), "lat": tt.stop_lat[stops[0]], "lon": tt.stop_lon[stops[0]]}
+        for key, stops in tt.station_stops.items()
+    ])
+    monkeypatch.setattr(meetup, "get_timetable", lambda: tt)
+    monkeypatch.setattr(meetup, "get_stop_grid", lambda: grid)
+    yield tt
+    meetup.shutdown_pool()
+
+
+def test_score_stations_objectives():
+    # Three stations, two origins: balanced, lopsided but short in total, out of reach
+    travel = np.array([[600, 60, 300], [600, 900, INF]])
+    minmax = meetup.score_stations(travel, "minmax")
+    total = meetup.score_stations(travel, "sum")
+    assert np.argmin(minmax) == 0
+    assert np.argmin(total) == 1
+    assert np.isinf(minmax[2]) and np.isinf(total[2])
+
+
+def test_travel_matrix_one_row_per_origin(town):
+    tt = town
+    keys, column = meetup._columns(tt)
+    origins = [tt.find_station("Westend"), tt.find_station("Ostende")]
+    service_date, depart_at = tt.to_service_time(meetup.parse_departure(DEPARTURE))
+
+    travel = meetup._travel_matrix(tt, origins, service_date, depart_at, column, len(keys))
+
+    mitte = keys.index(tt.find_station("Mitte"))
+    abseits = keys.index(tt.find_station("Abseits"))
+    assert travel.shape == (2, len(keys))
+    assert list(travel[:, mitte]) == [600, 600]
+    assert list(travel[:, abseits]) == [INF, INF]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_plan_meetup_meets_in_the_middle(town, monkeypatch, workers):
+    # 1 searches in a thread, 2 through the process pool; both must agree
+    monkeypatch.setattr(meetup, "MEETUP_WORKERS", workers)
+
+    result = asyncio.run(meetup.plan_meetup(["Westend", "Ostende"], DEPARTURE))
+
+    assert result["status"] == "success"
+    best = result["stations"][0]
+    assert best["name"] == "Mitte"
+    assert best["minutes_by_origin"] == [10, 10]
+    assert "Abseits" not in [s["name"] for s in result["stations"]]
+    assert (meetup._pool is not None) == (workers > 1)
+
+
+def test_plan_meetup_rejects_bad_input(town):
+    assert asyncio.run(meetup.plan_meetup(["Westend"]))["status"] == "error"
+    assert asyncio.run(meetup.plan_meetup(["Westend", "Nirgendwo"]))["status"] == "error"
+    with pytest.raises(ValueError):
+        asyncio.run(meetup.plan_meetup(["Westend", "Ostende"], "half past eight"))
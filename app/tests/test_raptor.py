@@ -0,0 +1,79 @@
+from datetime import date
+
+import pytest
+
+from transport.raptor import INF, reconstruct, run_raptor
+from transport.route_service import plan_journeys
+
+MONDAY = date(2026, 10, 19)
+
+STOPS = {
+    "900000001": ("Westend", 52.50, 13.30),
+    "900000002": ("Umsteig", 52.50, 13.35),
+    "900000003": ("Ostende", 52.50, 13.40),
+    "900000004": ("Abseits", 52.60, 13.60),
+}
+
+# A every 10 min from 08:00, 10 min to the interchange; B every 15 min from
+# 08:40, 12 min on. Only every third A actually gains anything.
+LINES = [
+    {"name": "A", "stops": ["900000001", "900000002"], "first": 8 * 60, "headway": 10, "count": 12, "ride": 10},
+    {"name": "B", "stops": ["900000002", "900000003"], "first": 8 * 60 + 40, "headway": 15, "count": 8, "ride": 12},
+]
+
+
+def _stop(tt, stop_id):
+    return tt.stop_index[stop_id]
+
+
+def test_earliest_arrival_with_one_transfer(feed_timetable):
+    tt = feed_timetable(STOPS, LINES)
+    start = _stop(tt, "900000001")
+    target = _stop(tt, "900000003")
+
+    result = run_raptor(tt, {start: 8 * 3600 + 3 * 60}, MONDAY, targets={target})
+
+    # 08:10 A -> 08:20, wait for the 08:40 B -> 08:52
+    assert result.arrivals[1][target] == INF
+    assert result.best[target] == 8 * 3600 + 52 * 60
+    legs = reconstruct(tt, result, target, len(result.arrivals) - 1)
+    trips = [leg for leg in legs if leg[0] == "trip"]
+    assert [tt.route_names[tt.pattern_route[leg[1]]] for leg in trips] == ["A", "B"]
+
+
+def test_unreachable_stop_stays_infinite(feed_timetable):
+    tt = feed_timetable(STOPS, LINES)
+    result = run_raptor(tt, {_stop(tt, "900000001"): 8 * 3600}, MONDAY)
+    assert result.best[_stop(tt, "900000004")] == INF
+
+
+def test_max_arrival_bounds_the_search(feed_timetable):
+    tt = feed_timetable(STOPS, LINES)
+    result = run_raptor(tt, {_stop(tt, "900000001"): 8 * 3600}, MONDAY, max_arrival=8 * 3600 + 30 * 60)
+    assert result.best[_stop(tt, "900000002")] == 8 * 3600 + 10 * 60
+    assert result.best[_stop(tt, "900000003")] == INF
+
+
+def test_allowed_products_filter_patterns(feed_timetable):
+    tt = feed_timetable(STOPS, LINES)
+    tram = 2  # PRODUCTS.index("tram"); both test lines are buses
+    result = run_raptor(tt, {_stop(tt, "900000001"): 8 * 3600}, MONDAY, allowed_products={tram})
+    assert result.best[_stop(tt, "900000002")] == INF
+
+
+def test_plan_journeys_drops_dominated_departures(feed_timetable):
+    tt = feed_timetable(STOPS, LINES)
+
+    journeys = plan_journeys(tt, "Westend", "Ostende", "2026-10-19T08:03:00", results=3)
+
+    times = [(j["departure"][11:16], j["arrival"][11:16]) for j in journeys]
+    # Leaving at 08:10 or 08:20 only means waiting longer for the same B
+    assert times == [("08:30", "08:52"), ("08:40", "09:07"), ("09:00", "09:22")]
+
+
+def test_plan_journeys_rejects_bad_input(feed_timetable):
+    tt = feed_timetable(STOPS, LINES)
+    with pytest.raises(LookupError):
+        plan_journeys(tt, "Nirgendwo", "Ostende")
+    with pytest.raises(ValueError):
+        plan_journeys(tt, "Westend", "Ostende", "half past eight")
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from transport import rate_limit
+
+
+@pytest.fixture
+def bucket(fake_redis, monkeypatch):
+    monkeypatch.setattr(rate_limit, "redis_client", fake_redis)
+    monkeypatch.setattr(rate_limit, "_TAKE_SCRIPT", fake_redis.register_script(rate_limit._TAKE_SCRIPT.script))
+    monkeypatch.setattr(rate_limit, "_waiting", {p: 0 for p in rate_limit.PRIORITIES})
+    # Ten tokens and practically no refill while a test runs
+    monkeypatch.setattr(rate_limit, "VBB_RATE_BURST", 10.0)
+    monkeypatch.setattr(rate_limit, "VBB_RATE_PER_SECOND", 0.01)
+    return fake_redis
+
+
+def _drain(name: str) -> int:
+    taken = 0
+    while rate_limit.try_acquire(name):
+        taken += 1
+    return taken
+
+
+def test_burst_is_shared_then_exhausted(bucket):
+    assert _drain("interactive") == 10
+    assert rate_limit._take("interactive") > 0
+
+
+def test_lower_priorities_leave_their_reserve(bucket):
+    # Background stops with half the burst left, live with a fifth
+    assert _drain("background") == 5
+    assert _drain("live") == 3
+    assert _drain("interactive") == 2
+
+
+def test_outranked_by_waiting_higher_priority(bucket):
+    rate_limit._waiting["interactive"] = 1
+    assert not rate_limit.try_acquire("background")
+    assert rate_limit.try_acquire("interactive")
+
+
+def test_pause_blocks_every_priority_and_is_never_shortened(bucket):
+    rate_limit.pause(5)
+    assert not rate_limit.try_acquire("interactive")
+    rate_limit.pause(1)
+    assert bucket.pttl(rate_limit.PAUSE_KEY) > 4000
+
+
+def test_acquire_takes_a_free_token(bucket):
+    async def main():
+        loop = asyncio.get_running_loop()
+        await rate_limit.acquire(loop.time() + 1, "interactive")
+
+    asyncio.run(main())
+    assert float(bucket.hget(rate_limit.BUCKET_KEY, "tokens")) == pytest.approx(9, abs=0.01)
+    assert rate_limit._waiting["interactive"] == 0
+
+
+def test_acquire_gives_up_before_the_deadline(bucket):
+    _drain("interactive")
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        await rate_limit.acquire(loop.time() + 1, "interactive")
+
+    with pytest.raises(rate_limit.RateLimited):
+        asyncio.run(main())
+    assert rate_limit._waiting["interactive"] == 0
+
+
+def test_priority_context():
+    assert rate_limit.current_priority() == "interactive"
+    with rate_limit.priority("background"):
+        assert rate_limit.current_priority() == "background"
+    assert rate_limit.current_priority() == "interactive"
+
+
+def test_redis_down_lets_calls_through(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    server.connected = False
+    down = fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(rate_limit, "redis_client", down)
+    monkeypatch.setattr(rate_limit, "_TAKE_SCRIPT", down.register_script(rate_limit._TAKE_SCRIPT.script))
+
+    assert rate_limit.try_acquire("background")
+    rate_limit.pause(1)
@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+from transport import resilience
+from transport.resilience import CircuitBreaker, UpstreamUnavailable, hedged
+
+
+def _fail(breaker: CircuitBreaker, times: int):
+    for _ in range(times):
+        breaker.acquire()
+        breaker.release(True, 0.1)
+
+
+def _expire(breaker: CircuitBreaker):
+    breaker.opened_at -= resilience.BREAKER_OPEN_SECONDS + 1
+
+
+def test_opens_at_the_error_threshold():
+    breaker = CircuitBreaker("departures")
+    # Not judged before BREAKER_MIN_CALLS outcomes, however bad they are
+    _fail(breaker, resilience.BREAKER_MIN_CALLS - 1)
+    assert breaker.state == "closed"
+    _fail(breaker, 1)
+    assert breaker.state == "open"
+    with pytest.raises(UpstreamUnavailable):
+        breaker.acquire()
+
+
+def test_stays_closed_below_the_error_rate():
+    breaker = CircuitBreaker("departures")
+    for i in range(resilience.BREAKER_WINDOW):
+        breaker.acquire()
+        breaker.release(i % 3 == 0, 0.1)
+    assert breaker.state == "closed"
+
+
+def test_slow_calls_open_it_too():
+    breaker = CircuitBreaker("journeys")
+    for _ in range(resilience.BREAKER_MIN_CALLS):
+        breaker.acquire()
+        breaker.release(False, resilience.BREAKER_SLOW_SECONDS)
+    assert breaker.state == "open"
+
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = CircuitBreaker("departures")
+    _fail(breaker, resilience.BREAKER_MIN_CALLS)
+    _expire(breaker)
+
+    breaker.acquire()
+    assert breaker.state == "half_open"
+    with pytest.raises(UpstreamUnavailable):
+        breaker.acquire()
+
+
+def test_successful_probe_closes():
+    breaker = CircuitBreaker("departures")
+    _fail(breaker, resilience.BREAKER_MIN_CALLS)
+    _expire(breaker)
+
+    breaker.acquire()
+    breaker.release(False, 0.2)
+
+    assert breaker.state == "closed"
+    assert not breaker.outcomes
+    breaker.acquire()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("departures")
+    _fail(breaker, resilience.BREAKER_MIN_CALLS)
+    _expire(breaker)
+
+    breaker.acquire()
+    breaker.release(True, 0.2)
+
+    assert breaker.state == "open"
+    with pytest.raises(UpstreamUnavailable):
+        breaker.acquire()
+
+
+def test_cancelled_probe_frees_the_slot():
+    breaker = CircuitBreaker("departures")
+    _fail(breaker, resilience.BREAKER_MIN_CALLS)
+    _expire(breaker)
+
+    breaker.acquire()
+    breaker.release(None, 0)
+
+    assert breaker.state == "half_open"
+    breaker.acquire()
+
+
+def _hedging_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("departures")
+    breaker.calls = 100
+    breaker.latencies.extend([0.02] * resilience.HEDGE_MIN_SAMPLES)
+    return breaker
+
+
+class Upstream:
+    """send() whose n-th copy answers after delays[n]; errors[n] makes it fail instead."""
+
+    def __init__(self, delays, errors=()):
+        self.delays = delays
+        self.errors = dict(errors)
+        self.started = 0
+        self.cancelled = []
+
+    async def send(self):
+        n = self.started
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delays[n])
+        except asyncio.CancelledError:
+            self.cancelled.append(n)
+            raise
+        if n in self.errors:
+            raise self.errors[n]
+        return f"response {n}"
+
+
+def test_hedge_takes_the_first_winner_and_cancels_the_loser():
+    breaker = _hedging_breaker()
+    upstream = Upstream([1.0, 0.01])
+
+    async def main():
+        response = await hedged(breaker, upstream.send)
+        await asyncio.sleep(0)
+        return response
+
+    assert asyncio.run(main()) == "response 1"
+    assert upstream.cancelled == [0]
+    assert breaker.hedges == 1
+
+
+def test_fast_answer_is_not_hedged():
+    breaker = _hedging_breaker()
+    upstream = Upstream([0.01, 0.01])
+    assert asyncio.run(hedged(breaker, upstream.send)) == "response 0"
+    assert upstream.started == 1
+
+
+def test_failed_hedge_waits_for_the_original():
+    breaker = _hedging_breaker()
+    upstream = Upstream([0.3, 0.01], errors={1: ValueError("hedge failed")})
+    assert asyncio.run(hedged(breaker, upstream.send)) == "response 0"
+
+
+def test_no_hedging_without_latency_history():
+    breaker = CircuitBreaker("departures")
+    upstream = Upstream([0.3, 0.01])
+    assert asyncio.run(hedged(breaker, upstream.send)) == "response 0"
+    assert upstream.started == 1
@@ -0,0 +1,61 @@
+import math
+
+from transport.spatial_index import CELL_METERS, METERS_PER_DEGREE, StopGrid
+
+LAT0 = 52.52
+LON0 = 13.40
+KX = math.cos(math.radians(LAT0)) * METERS_PER_DEGREE
+
+
+def _entry(i: int, east_m: float, north_m: float) -> dict:
+    return {"id": f"s{i}", "name": f"Stop {i}", "lat": LAT0 + north_m / METERS_PER_DEGREE, "lon": LON0 + east_m / KX}
+
+
+def _brute_force(entries, lat, lon, grid):
+    x, y = lon * grid.kx, lat * grid.ky
+    return sorted((math.hypot(e["lon"] * grid.kx - x, e["lat"] * grid.ky - y), i) for i, e in enumerate(entries))
+
+
+# A 3 km square of stops every 250 m, so queries cross several cell boundaries
+ENTRIES = [_entry(i * 13 + j, i * 250, j * 250) for i in range(13) for j in range(13)]
+
+
+def test_nearest_matches_brute_force():
+    grid = StopGrid(ENTRIES)
+    for east, north in [(0, 0), (1130, 870), (3000, 3000), (-400, 1500), (5200, -300)]:
+        lat, lon = LAT0 + north / METERS_PER_DEGREE, LON0 + east / KX
+        expected = _brute_force(ENTRIES, lat, lon, grid)[:5]
+        got = grid.nearest_ids(lat, lon, k=5)
+        assert [round(d, 6) for d, _ in got] == [round(d, 6) for d, _ in expected]
+
+
+def test_nearest_respects_max_distance():
+    grid = StopGrid(ENTRIES)
+    # 2 km west of the square: nothing within 1 km
+    lat, lon = LAT0, LON0 - 2000 / KX
+    assert grid.nearest_ids(lat, lon, k=3, max_distance_m=1000) == []
+    assert len(grid.nearest_ids(lat, lon, k=3, max_distance_m=2500)) == 3
+
+
+def test_within_returns_everything_inside_the_radius():
+    grid = StopGrid(ENTRIES)
+    lat, lon = LAT0 + 1500 / METERS_PER_DEGREE, LON0 + 1500 / KX
+    radius = 2.5 * CELL_METERS
+    expected = [(d, i) for d, i in _brute_force(ENTRIES, lat, lon, grid) if d <= radius]
+    got = grid.within_ids(lat, lon, radius)
+    assert sorted(i for _, i in got) == sorted(i for _, i in expected)
+    assert [d for d, _ in got] == sorted(d for d, _ in got)
+
+
+def test_nearest_returns_entries_with_distance():
+    grid = StopGrid(ENTRIES)
+    [hit] = grid.nearest(LAT0, LON0 + 260 / KX, k=1)
+    assert hit["id"] == "s13"
+    assert hit["distance_m"] == 10
+
+
+def test_empty_grid():
+    grid = StopGrid([])
+    assert len(grid) == 0
+    assert grid.nearest(LAT0, LON0) == []
+    assert grid.within_ids(LAT0, LON0, 1000) == []
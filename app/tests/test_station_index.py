@@ -0,0 +1,58 @@
+from transport.station_index import TOP_K, StationIndex
+
+ENTRIES = [
+    {"id": "900100003", "name": "S+U Alexanderplatz (Berlin)", "line": None, "popularity": 9.0},
+    {"id": "900100001", "name": "S+U Friedrichstr. (Berlin)", "line": None, "popularity": 8.0},
+    {"id": "900100703", "name": "Alexanderstr. (Berlin)", "line": None, "popularity": 2.0},
+    {"id": "900003201", "name": "S+U Berlin Hauptbahnhof", "line": None, "popularity": 10.0},
+    {"id": "900120003", "name": "S Ostkreuz Bhf (Berlin)", "line": None, "popularity": 7.0},
+    {"id": "900110011", "name": "Görlitzer Bahnhof (Berlin)", "line": None, "popularity": 3.0},
+]
+
+
+def _ids(results):
+    return [r["id"] for r in results]
+
+
+def test_word_prefixes_anywhere_in_the_name():
+    index = StationIndex(ENTRIES)
+    assert _ids(index.suggest("alexander")) == ["900100003", "900100703"]
+    assert _ids(index.suggest("ostkr")) == ["900120003"]
+    assert _ids(index.suggest("hauptbahnhof")) == ["900003201"]
+
+
+def test_ranked_by_popularity_and_limited():
+    index = StationIndex(ENTRIES)
+    assert _ids(index.suggest("berlin", limit=3)) == ["900003201", "900100003", "900100001"]
+    assert "popularity" not in index.suggest("berlin")[0]
+
+
+def test_umlauts_and_street_suffixes_in_any_spelling():
+    index = StationIndex(ENTRIES)
+    for query in ("görlitzer", "goerlitzer", "gorlitzer"):
+        assert _ids(index.suggest(query)) == ["900110011"]
+    for query in ("friedrichstrasse", "Friedrichstraße", "friedrichstr.", "friedrichs"):
+        assert _ids(index.suggest(query)) == ["900100001"]
+
+
+def test_words_in_any_order():
+    index = StationIndex(ENTRIES)
+    assert _ids(index.suggest("berlin alexanderplatz")) == ["900100003"]
+    assert index.suggest("alexanderplatz potsdam") == []
+    assert index.suggest("zoologischer") == []
+    assert index.suggest("  ") == []
+
+
+def test_find_prefers_exact_names_then_the_best_suggestion():
+    index = StationIndex(ENTRIES)
+    assert index.find("alexanderstr (berlin)") == "900100703"
+    assert index.find("alexander") == "900100003"
+    assert index.find("alexander", prefix=False) is None
+
+
+def test_top_k_is_cached_per_node():
+    entries = [{"id": str(i), "name": f"Teststation {i}", "popularity": i} for i in range(TOP_K + 5)]
+    index = StationIndex(entries)
+    results = index.suggest("teststation", limit=TOP_K + 5)
+    assert len(results) == TOP_K
+    assert results[0]["id"] == str(TOP_K + 4)
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import threading
+from datetime import datetime
+
+import pytest
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+from db import write_behind
+
+
+class FakeCollection:
+    """Records bulk writes; `errors` decides which requests of the next call fail."""
+
+    def __init__(self, full_name: str = "transport.journeys"):
+        self.full_name = full_name
+        self.written: list = []
+        self.errors: list[dict] = []
+        self.down = False
+        self.gate: threading.Event | None = None
+
+    def bulk_write(self, requests, ordered=True):
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.down:
+            raise AutoReconnect("mongo is down")
+        errors, self.errors = self.errors, []
+        failed = {e["index"] for e in errors}
+        self.written.extend(r for i, r in enumerate(requests) if i not in failed)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+@pytest.fixture
+def queue(monkeypatch, tmp_path):
+    collection = FakeCollection()
+    monkeypatch.setattr(write_behind, "_inserts", [])
+    monkeypatch.setattr(write_behind, "_upserts", {})
+    monkeypatch.setattr(write_behind, "_writing", set())
+    monkeypatch.setattr(write_behind, "_flush_lock", None)
+    monkeypatch.setattr(write_behind, "_wake", None)
+    monkeypatch.setattr(write_behind, "_collection", lambda ns: collection)
+    monkeypatch.setattr(write_behind, "WRITE_BEHIND_SPILL_PATH", str(tmp_path / "spill" / "write_behind.jsonl"))
+    return collection
+
+
+def test_updates_to_one_document_are_merged(queue):
+    write_behind.enqueue_upsert(queue, {"key": "a"}, {"$inc": {"hits": 1}, "$set": {"last": 1}})
+    write_behind.enqueue_upsert(queue, {"key": "a"}, {"$inc": {"hits": 2}, "$set": {"last": 2}})
+    write_behind.enqueue_upsert(queue, {"key": "b"}, {"$inc": {"hits": 1}})
+    # Same filter but no upsert: kept apart so it never creates the document
+    write_behind.enqueue_update(queue, {"key": "a"}, {"$inc": {"hits": 5}})
+
+    assert write_behind.pending() == 3
+    merged = next(r for r in write_behind._upserts.values() if r["op"] == "upsert" and r["filter"] == {"key": "a"})
+    assert merged["update"] == {"$inc": {"hits": 3}, "$set": {"last": 2}}
+
+
+def test_flush_writes_inserts_and_updates(queue):
+    write_behind.enqueue_insert(queue, {"_id": 1})
+    write_behind.enqueue_upsert(queue, {"key": "a"}, {"$inc": {"hits": 1}})
+    write_behind.enqueue_update(queue, {"key": "b"}, {"$inc": {"hits": 1}})
+
+    asyncio.run(write_behind.flush())
+
+    assert queue.written == [
+        InsertOne({"_id": 1}),
+        UpdateOne({"key": "a"}, {"$inc": {"hits": 1}}, upsert=True),
+        UpdateOne({"key": "b"}, {"$inc": {"hits": 1}}, upsert=False),
+    ]
+    assert write_behind.pending() == 0
+
+
+def test_requeued_update_applies_underneath_newer_ones(queue):
+    failed = {"ns": queue.full_name, "op": "upsert", "filter": {"key": "a"},
+              "update": {"$inc": {"hits": 2}, "$set": {"last": "old"}}}
+    write_behind.enqueue_upsert(queue, {"key": "a"}, {"$inc": {"hits": 1}, "$set": {"last": "new"}})
+
+    write_behind._requeue([failed])
+
+    [record] = write_behind._upserts.values()
+    assert record["update"] == {"$inc": {"hits": 3}, "$set": {"last": "new"}}
+
+
+def test_duplicate_keys_drop_inserts_but_retry_upserts(queue):
+    write_behind.enqueue_insert(queue, {"_id": 1})
+    write_behind.enqueue_insert(queue, {"_id": 2})
+    write_behind.enqueue_upsert(queue, {"key": "a"}, {"$inc": {"hits": 1}})
+    # Batches go out inserts first, then updates
+    queue.errors = [
+        {"index": 0, "code": write_behind.DUPLICATE_KEY},
+        {"index": 1, "code": 121},
+        {"index": 2, "code": write_behind.DUPLICATE_KEY},
+    ]
+
+    asyncio.run(write_behind.flush())
+
+    assert [r["doc"] for r in write_behind._inserts] == [{"_id": 2}]
+    assert [r["filter"] for r in write_behind._upserts.values()] == [{"key": "a"}]
+
+
+def test_outage_requeues_the_whole_batch(queue):
+    queue.down = True
+    write_behind.enqueue_insert(queue, {"_id": 1})
+    write_behind.enqueue_upsert(queue, {"key": "a"}, {"$inc": {"hits": 1}})
+
+    asyncio.run(write_behind.flush())
+
+    assert write_behind.pending() == 2
+
+
+def test_cancelled_flush_lets_the_batch_finish(queue):
+    queue.gate = threading.Event()
+    write_behind.enqueue_insert(queue, {"_id": 1})
+
+    async def main():
+        flushing = asyncio.create_task(write_behind.flush())
+        await asyncio.sleep(0.05)
+        flushing.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await flushing
+        queue.gate.set()
+        await asyncio.wait(set(write_behind._writing))
+
+    asyncio.run(main())
+
+    assert queue.written == [InsertOne({"_id": 1})]
+    assert write_behind.pending() == 0
+
+
+def test_spill_and_replay_round_trip(queue):
+    # Naive UTC, as Mongo hands datetimes back
+    at = datetime(2026, 10, 19, 8, 30)
+    write_behind.enqueue_insert(queue, {"_id": 1, "at": at})
+    write_behind.enqueue_upsert(queue, {"key": "a"}, {"$inc": {"hits": 2}})
+
+    write_behind.spill()
+    assert write_behind.pending() == 0
+    with open(write_behind.WRITE_BEHIND_SPILL_PATH, "a", encoding="utf-8") as f:
+        f.write("{not json\n")
+
+    write_behind.replay_spill()
+
+    assert write_behind._inserts[0]["doc"]["at"] == at
+    [record] = write_behind._upserts.values()
+    assert record["update"] == {"$inc": {"hits": 2}}
+    # The claimed copy is removed once its records are queued again
+    assert os.listdir(os.path.dirname(write_behind.WRITE_BEHIND_SPILL_PATH)) == []
+
+
+def test_shutdown_spills_what_mongo_did_not_take(queue):
+    queue.down = True
+    write_behind.enqueue_upsert(queue, {"key": "a"}, {"$inc": {"hits": 1}})
+
+    asyncio.run(write_behind.shutdown(timeout=1))
+
+    assert write_behind.pending() == 0
+    with open(write_behind.WRITE_BEHIND_SPILL_PATH, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
@@ -0,0 +1,62 @@
+# transport/background.py
+import asyncio
+
+from db import write_behind
+from transport import delay_stats, gtfs, live_departures, meetup, metrics, scheduled_departures, spatial_index, station_catalog, station_index
+from transport.habits import run_habits
+from transport.prefetch import run_prefetcher
+from transport.vbb_api import close_client
+
+_tasks: list[asyncio.Task] = []
+
+
+async def start():
+    write_behind.replay_spill()
+    _tasks.append(asyncio.create_task(write_behind.run_flusher()))
+    _tasks.append(asyncio.create_task(metrics.run_flusher()))
+    _tasks.append(asyncio.create_task(run_prefetcher()))
+    _tasks.append(asyncio.create_task(_load_offline_data()))
+    _tasks.append(asyncio.create_task(station_index.run_index_refresher()))
+    _tasks.append(asyncio.create_task(delay_stats.run_ingester()))
+    _tasks.append(asyncio.create_task(run_habits()))
+
+
+async def _load_offline_data():
+    # Parsing a full feed takes a while; routes report "not loaded" until it is done
+    try:
+        await asyncio.to_thread(gtfs.load_timetable)
+    except Exception as e:
+        # The catalog and station logs still back the indexes below
+        print("⚠️ GTFS load failed:", e)
+    try:
+        await asyncio.to_thread(station_catalog.sync_catalog_once)
+    except Exception as e:
+        print("⚠️ Station catalog sync failed:", e)
+    try:
+        await asyncio.to_thread(station_index.build_station_index)
+    except Exception as e:
+        print("⚠️ Station index build failed:", e)
+    try:
+        await asyncio.to_thread(spatial_index.build_stop_grid)
+    except Exception as e:
+        print("⚠️ Stop grid build failed:", e)
+    try:
+        await asyncio.to_thread(scheduled_departures.build_departure_index)
+    except Exception as e:
+        print("⚠️ Departure index build failed:", e)
+
+
+async def stop():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    live_departures.stop_all()
+    meetup.shutdown_pool()
+    try:
+        delay_stats.finalize()
+    except Exception as e:
+        print("⚠️ Final delay ingestion failed:", e)
+    await write_behind.shutdown()
+    metrics.flush()
+    await close_client()
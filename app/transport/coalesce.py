@@ -0,0 +1,146 @@
+# transport/coalesce.py
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable
+from uuid import uuid4
+
+import redis
+
+from db.db_redis import redis_client
+
+LOCK_TTL_MS = int(os.getenv("COALESCE_LOCK_TTL_MS", 10_000))
+WAIT_TIMEOUT_SECONDS = float(os.getenv("COALESCE_WAIT_TIMEOUT_SECONDS", 10))
+POLL_INTERVAL_SECONDS = 0.05
+
+# Delete the lock only if we still own it (it may have expired and been re-taken)
+_RELEASE_SCRIPT = redis_client.register_script(
+    """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+        return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+)
+
+# key -> running fetch task, shared by every coroutine in this worker
+_inflight: dict[str, asyncio.Task] = {}
+
+
+def try_lock(lock_key: str, ttl_ms: int = LOCK_TTL_MS) -> str | None:
+    """
+    Take the cross-worker lock for `lock_key`, returning the owner token or None.
+    If Redis is unreachable we behave as the owner so callers still make progress.
+    """
+    token = uuid4().hex
+    try:
+        return token if redis_client.set(lock_key, token, nx=True, px=ttl_ms) else None
+    except redis.RedisError as e:
+        print(f"⚠️ Redis lock unavailable for {lock_key}, fetching uncoordinated:", e)
+        return token
+
+
+def release_lock(lock_key: str, token: str):
+    try:
+        _RELEASE_SCRIPT(keys=[lock_key], args=[token])
+    except redis.RedisError as e:
+        print(f"⚠️ Could not release {lock_key}:", e)
+
+
+def _lock_held(lock_key: str) -> bool:
+    try:
+        return bool(redis_client.exists(lock_key))
+    except redis.RedisError:
+        return False
+
+
+async def _fetch_across_workers(
+    key: str,
+    fetch: Callable[[], Awaitable[Any]],
+    read_cached: Callable[[], Any],
+    write_cached: Callable[[Any], None],
+):
+    lock_key = f"lock:{key}"
+    deadline = time.monotonic() + WAIT_TIMEOUT_SECONDS
+
+    while True:
+        token = try_lock(lock_key)
+        if token:
+            try:
+                result = await fetch()
+                write_cached(result)
+                return result
+            finally:
+                release_lock(lock_key, token)
+
+        # Another worker owns the fetch: wait for it to publish into the cache
+        while _lock_held(lock_key) and time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            cached = read_cached()
+            if cached is not None:
+                return cached
+
+        cached = read_cached()
+        if cached is not None:
+            return cached
+
+        if time.monotonic() >= deadline:
+            # The owner is stuck; answering late is better than not at all
+            print(f"⚠️ Gave up waiting on {lock_key}, fetching directly")
+            result = await fetch()
+            write_cached(result)
+            return result
+        # Lock released without a result (owner failed): compete for it again
+
+
+def _forget(key: str, task: asyncio.Task):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    # Mark the outcome as observed even if every waiter went away
+    if not task.cancelled():
+        task.exception()
+
+
+async def single_flight(
+    key: str,
+    fetch: Callable[[], Awaitable[Any]],
+    read_cached: Callable[[], Any],
+    write_cached: Callable[[Any], None],
+):
+    """
+    Run `fetch` at most once per `key` across this worker's coroutines and,
+    through a Redis lock, across workers. Waiters receive the owner's result,
+    either directly or by reading it back from the cache it wrote.
+
+    The fetch runs in its own task so a disconnecting caller cannot cancel it
+    for everyone else.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(
+            _fetch_across_workers(key, fetch, read_cached, write_cached)
+        )
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _forget(key, t))
+    return await asyncio.shield(task)
+
+
+async def refresh_if_owner(
+    key: str,
+    fetch: Callable[[], Awaitable[Any]],
+    write_cached: Callable[[Any], None],
+):
+    """
+    Refresh-ahead for an entry that is still servable: only the caller that
+    wins the lock refetches, everyone else gets None and keeps the cached copy.
+    """
+    lock_key = f"lock:{key}"
+    token = try_lock(lock_key)
+    if not token:
+        return None
+    try:
+        result = await fetch()
+        write_cached(result)
+        return result
+    finally:
+        release_lock(lock_key, token)
@@ -0,0 +1,307 @@
+# transport/delay_stats.py
+import asyncio
+import json
+import math
+import os
+import shutil
+import time
+from array import array
+from datetime import date, datetime, timedelta
+
+import redis
+
+from db.db_redis import redis_client
+from transport import metrics
+from transport.gtfs import BERLIN
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # app/
+
+DELAY_STORE_PATH = os.getenv("DELAY_STORE_PATH", os.path.join(BASE_DIR, "tmp", "delays"))
+DELAY_INGEST_INTERVAL_SECONDS = float(os.getenv("DELAY_INGEST_INTERVAL_SECONDS", 30))
+# The last delay seen this long after the planned departure counts as final
+DELAY_FINALIZE_GRACE_SECONDS = 120
+DELAY_SEEN_TTL_SECONDS = 2 * 86400
+DELAY_MAX_PENDING = int(os.getenv("DELAY_MAX_PENDING", 50_000))
+# Raw day segments are deleted after this; rollups expire once nothing new
+# has been observed for them this long
+DELAY_RETENTION_DAYS = int(os.getenv("DELAY_RETENTION_DAYS", 90))
+DELAY_ROLLUP_TTL_SECONDS = int(os.getenv("DELAY_ROLLUP_TTL_SECONDS", 90 * 86400))
+
+# Histogram buckets are whole minutes, clamped to this range
+BUCKET_MIN_MINUTES = -5
+BUCKET_MAX_MINUTES = 60
+CANCELLED = "cancelled"
+
+# Column name -> array typecode; one file per column per segment
+COLUMNS = {
+    "planned": "I",        # planned departure, epoch seconds
+    "delay": "h",          # seconds, NO_DELAY when only the cancellation is known
+    "line": "I",           # index into the segment's lines.json
+    "station": "I",        # index into the segment's stations.json
+    "hour_of_week": "B",   # Monday 00:00 Berlin time = 0
+    "cancelled": "B",
+}
+NO_DELAY = -32768
+
+# (tripId, station) -> latest observation, until its departure is final
+_pending: dict[tuple[str, str], dict] = {}
+# Day the raw store was last pruned by this process
+_pruned_on: date | None = None
+
+# Mark the departure seen and count it in every rollup, or do nothing if
+# another worker already has; one step, so no observation is half-recorded
+# KEYS[1]: seen marker, KEYS[2..]: rollup hashes
+# ARGV: seen TTL, rollup TTL, histogram field
+_RECORD_SCRIPT = redis_client.register_script(
+    """
+    if not redis.call('set', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+        return 0
+    end
+    for i = 2, #KEYS do
+        redis.call('hincrby', KEYS[i], ARGV[3], 1)
+        redis.call('expire', KEYS[i], ARGV[2])
+    end
+    return 1
+    """
+)
+
+
+def hour_of_week(when: datetime) -> int:
+    local = when.astimezone(BERLIN)
+    return local.weekday() * 24 + local.hour
+
+
+def record_observations(station_id: str, departures: list[dict]):
+    """Remember the newest delay of each departure; cheap enough for every fetch."""
+    for dep in departures:
+        trip_id, planned = dep.get("tripId"), dep.get("plannedWhen")
+        if not trip_id or not planned:
+            continue
+        key = (trip_id, station_id)
+        observation = _pending.get(key)
+        if observation is None:
+            if len(_pending) >= DELAY_MAX_PENDING:
+                metrics.incr("delays:dropped")
+                continue
+            try:
+                planned_at = datetime.fromisoformat(planned)
+            except ValueError:
+                continue
+            observation = _pending[key] = {"line": dep.get("line"), "planned": planned_at}
+        observation["delay"] = dep.get("delay")
+        observation["cancelled"] = bool(dep.get("cancelled"))
+
+
+def _bucket(observation: dict) -> str:
+    if observation["cancelled"]:
+        return CANCELLED
+    minutes = math.floor(observation["delay"] / 60)
+    return str(min(max(minutes, BUCKET_MIN_MINUTES), BUCKET_MAX_MINUTES))
+
+
+def _rollup_keys(line: str, station_id: str, how: int) -> list[str]:
+    keys = []
+    for slot in (str(how), "all"):
+        keys.append(f"delays:line:{line}:{slot}")
+        keys.append(f"delays:station:{station_id}:{slot}")
+        keys.append(f"delays:line_station:{line}:{station_id}:{slot}")
+    return keys
+
+
+class _Segment:
+    """Append-only column files for one day, written by this process only."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.dictionaries = {name: self._load_dictionary(name) for name in ("lines", "stations")}
+        self.codes = {name: {v: i for i, v in enumerate(values)} for name, values in self.dictionaries.items()}
+
+    def _load_dictionary(self, name: str) -> list[str]:
+        path = os.path.join(self.directory, f"{name}.json")
+        if not os.path.exists(path):
+            return []
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _code(self, name: str, value: str) -> int:
+        code = self.codes[name].get(value)
+        if code is None:
+            code = self.codes[name][value] = len(self.dictionaries[name])
+            self.dictionaries[name].append(value)
+        return code
+
+    def append(self, rows: list[tuple[str, str, dict]]):
+        columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+        for _, station_id, obs in rows:
+            delay = obs["delay"]
+            columns["planned"].append(int(obs["planned"].timestamp()))
+            columns["delay"].append(NO_DELAY if delay is None else max(min(int(delay), 32767), -32767))
+            columns["line"].append(self._code("lines", obs["line"] or "N/A"))
+            columns["station"].append(self._code("stations", station_id))
+            columns["hour_of_week"].append(hour_of_week(obs["planned"]))
+            columns["cancelled"].append(int(obs["cancelled"]))
+
+        # Dictionaries first, so every code in the columns resolves
+        for name, values in self.dictionaries.items():
+            tmp = os.path.join(self.directory, f"{name}.json.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(values, f)
+            os.replace(tmp, os.path.join(self.directory, f"{name}.json"))
+        for name, values in columns.items():
+            with open(os.path.join(self.directory, f"{name}.col"), "ab") as f:
+                values.tofile(f)
+
+
+_segments: dict[str, _Segment] = {}
+
+
+def _segment_for(day: str) -> _Segment:
+    segment = _segments.get(day)
+    if segment is None:
+        # Older days are complete; only today's segment stays open
+        _segments.clear()
+        segment = _segments[day] = _Segment(os.path.join(DELAY_STORE_PATH, day, str(os.getpid())))
+    return segment
+
+
+def _take_due(now: float) -> list[tuple[tuple[str, str], dict]]:
+    """Remove and return every pending departure that has left."""
+    due = [
+        (key, obs) for key, obs in _pending.items()
+        if obs["planned"].timestamp() + DELAY_FINALIZE_GRACE_SECONDS <= now
+    ]
+    for key, _ in due:
+        del _pending[key]
+    # Nothing was learned about departures that never had realtime data
+    return [(key, obs) for key, obs in due if obs["delay"] is not None or obs["cancelled"]]
+
+
+def _store(due: list[tuple[tuple[str, str], dict]]) -> tuple[int, list[tuple[tuple[str, str], dict]]]:
+    """
+    Roll up and append departures taken by _take_due. Returns how many were
+    new and the ones to retry; may run in a thread, so it never touches
+    _pending itself.
+    """
+    if not due:
+        return 0, []
+    try:
+        # Several workers may have watched the same departure; the first one records it
+        pipe = redis_client.pipeline(transaction=False)
+        for (trip_id, station_id), obs in due:
+            _RECORD_SCRIPT(
+                keys=[
+                    f"delays:seen:{station_id}:{trip_id}",
+                    *_rollup_keys(obs["line"] or "N/A", station_id, hour_of_week(obs["planned"])),
+                ],
+                args=[DELAY_SEEN_TTL_SECONDS, DELAY_ROLLUP_TTL_SECONDS, _bucket(obs)],
+                client=pipe,
+            )
+        fresh = [(trip_id, station_id, obs) for ((trip_id, station_id), obs), new in zip(due, pipe.execute()) if new]
+    except redis.RedisError as e:
+        # Departures already recorded are marked seen, so retrying them all counts each once
+        print("⚠️ Delay rollup failed, retrying next round:", e)
+        return 0, due
+
+    by_day: dict[str, list] = {}
+    for row in fresh:
+        by_day.setdefault(row[2]["planned"].astimezone(BERLIN).date().isoformat(), []).append(row)
+    for day, rows in sorted(by_day.items()):
+        _segment_for(day).append(rows)
+
+    metrics.incr("delays:ingested", len(fresh))
+    metrics.incr("delays:duplicates", len(due) - len(fresh))
+    return len(fresh), []
+
+
+def _requeue(failed: list[tuple[tuple[str, str], dict]]):
+    for key, obs in failed:
+        _pending.setdefault(key, obs)
+
+
+def prune_segments(today: date) -> int:
+    """Delete raw day segments older than DELAY_RETENTION_DAYS; returns how many days went."""
+    if not os.path.isdir(DELAY_STORE_PATH):
+        return 0
+    cutoff = today - timedelta(days=DELAY_RETENTION_DAYS)
+    removed = 0
+    for name in os.listdir(DELAY_STORE_PATH):
+        try:
+            day = date.fromisoformat(name)
+        except ValueError:
+            continue
+        if day < cutoff:
+            shutil.rmtree(os.path.join(DELAY_STORE_PATH, name), ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def _prune_daily():
+    global _pruned_on
+    today = datetime.now(BERLIN).date()
+    if _pruned_on != today:
+        _pruned_on = today
+        removed = prune_segments(today)
+        if removed:
+            print(f"🧹 Pruned {removed} days of raw delay observations")
+
+
+def finalize(now: float | None = None) -> int:
+    """Store and roll up every departure that has left; returns how many were new."""
+    stored, failed = _store(_take_due(time.time() if now is None else now))
+    _requeue(failed)
+    return stored
+
+
+async def run_ingester():
+    while True:
+        await asyncio.sleep(DELAY_INGEST_INTERVAL_SECONDS)
+        try:
+            # Pending departures are only touched on the event loop; the Redis
+            # round trip and file writes happen in a thread
+            due = _take_due(time.time())
+            _, failed = await asyncio.to_thread(_store, due)
+            _requeue(failed)
+            await asyncio.to_thread(_prune_daily)
+        except Exception as e:
+            print("⚠️ Delay ingestion failed:", e)
+
+
+def _percentile(histogram: dict[int, int], total: int, q: float) -> int | None:
+    if not total:
+        return None
+    seen = 0
+    for minutes in sorted(histogram):
+        seen += histogram[minutes]
+        if seen >= q * total:
+            return minutes
+    return None
+
+
+def delay_rollup(line: str | None = None, station_id: str | None = None, hour: int | None = None) -> dict:
+    """p50/p90 delay in minutes for a line, a station or a line at a station."""
+    slot = "all" if hour is None else str(hour)
+    if line and station_id:
+        key = f"delays:line_station:{line}:{station_id}:{slot}"
+    elif line:
+        key = f"delays:line:{line}:{slot}"
+    elif station_id:
+        key = f"delays:station:{station_id}:{slot}"
+    else:
+        return {"status": "error", "message": "Give a line, a station_id or both."}
+
+    raw = redis_client.hgetall(key)
+    cancelled = int(raw.pop(CANCELLED, 0))
+    histogram = {int(minutes): int(count) for minutes, count in raw.items()}
+    observed = sum(histogram.values())
+    return {
+        "status": "success",
+        "line": line,
+        "station_id": station_id,
+        "hour_of_week": hour,
+        "observations": observed + cancelled,
+        "cancelled": cancelled,
+        "p50_delay_minutes": _percentile(histogram, observed, 0.5),
+        "p90_delay_minutes": _percentile(histogram, observed, 0.9),
+        "histogram": dict(sorted(histogram.items())),
+    }
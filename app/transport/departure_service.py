@@ -1,55 +1,189 @@
 # transport/departure_service.py
-import requests
-from db.db_redis import get_cached_departure, cache_departure, redis_client
-
-# Station IDs you want to cache
-CACHED_STATIONS = {"900100003", "900100026"}
-
-
-def fetch_departures(station_id: str, duration: int = 30):
-    key = f"departures:{station_id}"
-
-    if station_id in CACHED_STATIONS:
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import redis
+
+from db.db_redis import get_cached_departure, get_cached_departures, cache_departure, redis_client
+from transport.vbb_api import vbb_get
+from transport.coalesce import single_flight, refresh_if_owner
+from transport.hot_stations import record_request
+from transport.delay_stats import record_observations
+from transport.resilience import upstream_unavailable
+from transport.scheduled_departures import scheduled_departures
+from transport import metrics, rate_limit
+
+DEPARTURE_TTL_SECONDS = 60
+REFRESH_AHEAD_SECONDS = 10
+# Last good board per station, served when VBB is down and the cache has expired
+DEPARTURE_STALE_SECONDS = int(os.getenv("DEPARTURE_STALE_SECONDS", 1800))
+
+BOARD_MAX_STATIONS = 20
+# Upstream fetches one board request may have in flight at once
+BOARD_UPSTREAM_CONCURRENCY = int(os.getenv("BOARD_UPSTREAM_CONCURRENCY", 4))
+
+
+def departure_key(station_id: str, duration: int) -> str:
+    return f"departures:{station_id}:{duration}"
+
+
+def store_departures(station_id: str, duration: int, departures: list[dict], ttl: int = DEPARTURE_TTL_SECONDS):
+    # The TTL varies by writer (the prefetcher keeps hot stations longer), so
+    # freshness is read from fetched_at, never inferred from the TTL
+    entry = {"fetched_at": time.time(), "departures": departures}
+    cache_departure(departure_key(station_id, duration), entry, ttl=ttl)
+    cache_departure(f"departures:last:{station_id}:{duration}", departures, ttl=DEPARTURE_STALE_SECONDS)
+
+
+def _as_entry(value) -> dict | None:
+    if isinstance(value, list):
+        # Written before entries carried fetched_at; age unknown
+        return {"fetched_at": 0, "departures": value}
+    return value
+
+
+def read_departures(station_id: str, duration: int) -> dict | None:
+    """Cached {"fetched_at", "departures"} for a station, None on a miss."""
+    return _as_entry(get_cached_departure(departure_key(station_id, duration)))
+
+
+def _last_good_departures(station_id: str, duration: int) -> list[dict] | None:
+    try:
+        departures = get_cached_departure(f"departures:last:{station_id}:{duration}")
+    except redis.RedisError:
+        return None
+    if departures is None:
+        return None
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=1)
+    upcoming = []
+    for dep in departures:
+        try:
+            if datetime.fromisoformat(dep["when"]) < cutoff:
+                continue
+        except (KeyError, TypeError, ValueError):
+            pass
+        upcoming.append(dep)
+    return upcoming
+
+
+async def fetch_departures(station_id: str, duration: int = 30):
+    key = departure_key(station_id, duration)
+    record_request(station_id, duration)
+
+    def fetch():
+        return _fetch_and_format_departures(station_id, duration)
+
+    def read_cached():
+        try:
+            entry = read_departures(station_id, duration)
+        except redis.RedisError:
+            return None
+        return entry["departures"] if entry else None
+
+    def write_cached(value):
+        try:
+            store_departures(station_id, duration, value)
+        except redis.RedisError as e:
+            print(f"⚠️ Could not cache departures for {station_id}:", e)
+
+    try:
         ttl = redis_client.ttl(key)
-
-        if ttl > 0:
-            cached = get_cached_departure(key)
-            if cached:
-                if ttl < 10:
-                    print(f"⏳ TTL < 10s for {station_id}, refreshing cache...")
-                    try:
-                        fresh = _fetch_and_format_departures(station_id, duration)
-                        cache_departure(key, fresh, ttl=60)
+    except redis.RedisError as e:
+        # Redis down: go straight to the upstream and, failing that, the timetable
+        print("⚠️ Departure cache unavailable:", e)
+        ttl = -2
+    if ttl > 0:
+        cached = read_cached()
+        if cached is not None:
+            metrics.incr("departures_cache:hit")
+            if ttl < REFRESH_AHEAD_SECONDS:
+                # Only the lock owner refreshes, everyone else serves the cached copy
+                try:
+                    fresh = await refresh_if_owner(key, fetch, write_cached)
+                    if fresh is not None:
+                        print(f"⏳ TTL < {REFRESH_AHEAD_SECONDS}s for {station_id}, cache refreshed")
                         return fresh
-                    except Exception as e:
-                        print("⚠️ Refresh failed, falling back to cached data:", e)
-                        return cached
-                else:
-                    print(f"✅ Redis hit for {station_id}, TTL = {ttl}s")
-                    return cached
-
-    # No cache or not eligible: fetch fresh
-    fresh_departures = _fetch_and_format_departures(station_id, duration)
-
-    if station_id in CACHED_STATIONS:
-        cache_departure(key, fresh_departures, ttl=60)
-
-    return fresh_departures
-
-
-def _fetch_and_format_departures(station_id: str, duration: int):
-    # FIXED v6 endpoint
-    url = f"https://v6.vbb.transport.rest/stops/{station_id}/departures"
+                except Exception as e:
+                    print("⚠️ Refresh failed, falling back to cached data:", e)
+            return cached
+
+    # No usable cache: one upstream fetch per key, shared by all waiters
+    metrics.incr("departures_cache:miss")
+    try:
+        return await single_flight(key, fetch, read_cached, write_cached)
+    except Exception as e:
+        if upstream_unavailable(e):
+            fallback = _last_good_departures(station_id, duration)
+            if fallback is not None:
+                print(f"⚠️ VBB unavailable, serving last known departures for {station_id}:", e)
+                metrics.incr("departures_fallback:last_good")
+                return fallback
+        # Nothing realtime left: the static timetable, rows marked "scheduled"
+        scheduled = scheduled_departures(station_id, duration)
+        if scheduled is None:
+            raise
+        print(f"⚠️ No live departures for {station_id}, serving the timetable:", e)
+        metrics.incr("departures_fallback:scheduled")
+        return scheduled
+
+
+async def refresh_departures(station_id: str, duration: int, ttl: int):
+    """Background refresh used by the prefetcher; skipped if someone else holds the key."""
+    key = departure_key(station_id, duration)
+    with rate_limit.priority("background"):
+        return await refresh_if_owner(
+            key,
+            lambda: _fetch_and_format_departures(station_id, duration),
+            lambda value: store_departures(station_id, duration, value, ttl=ttl),
+        )
+
+
+async def fetch_departure_board(station_ids: list[str], duration: int = 60):
+    """
+    Departures for several stations at once: cached sections come from one
+    MGET, misses are fetched concurrently under BOARD_UPSTREAM_CONCURRENCY.
+    Returns per-station sections plus one board merged by `when`.
+    """
+    station_ids = list(dict.fromkeys(s.strip() for s in station_ids if s.strip()))[:BOARD_MAX_STATIONS]
+    try:
+        entries = get_cached_departures([departure_key(s, duration) for s in station_ids])
+    except redis.RedisError as e:
+        # Every section is a miss; fetch_departures copes with Redis being down
+        print("⚠️ Departure cache unavailable for the board:", e)
+        entries = [None] * len(station_ids)
+    cached = [entry["departures"] if entry else None for entry in map(_as_entry, entries)]
+    semaphore = asyncio.Semaphore(BOARD_UPSTREAM_CONCURRENCY)
+
+    async def section(station_id: str, departures):
+        if departures is not None:
+            record_request(station_id, duration)
+            metrics.incr("departures_cache:hit")
+            return {"station_id": station_id, "departures": departures}
+        try:
+            async with semaphore:
+                departures = await fetch_departures(station_id, duration)
+            return {"station_id": station_id, "departures": departures}
+        except Exception as e:
+            print(f"⚠️ Board section failed for {station_id}:", e)
+            return {"station_id": station_id, "departures": [], "error": str(e)}
+
+    sections = await asyncio.gather(*(section(s, c) for s, c in zip(station_ids, cached)))
+    board = sorted(
+        ({**dep, "station_id": sec["station_id"]} for sec in sections for dep in sec["departures"]),
+        key=lambda dep: dep["when"],
+    )
+    return {"stations": sections, "departures": board}
+
+
+async def _fetch_and_format_departures(station_id: str, duration: int):
     params = {
         "duration": duration,
         "language": "en"
     }
 
-
-    response = requests.get(url, params=params, headers={"User-Agent": "Explorix-App"})
-    response.raise_for_status()
-
-    raw = response.json()
+    raw = await vbb_get(f"/stops/{station_id}/departures", params=params)
 
     # NEW → v6 response wraps departures inside a dict
     departures_list = raw.get("departures", [])
@@ -60,16 +194,24 @@ def _fetch_and_format_departures(station_id: str, duration: int):
 
     departures = []
     for dep in departures_list:
-        if isinstance(dep, dict) and dep.get("when"):
+        if not isinstance(dep, dict):
+            continue
+        cancelled = bool(dep.get("cancelled"))
+        # Cancelled departures come without a realtime `when`; keep them at their planned slot
+        when = dep.get("when") or (dep.get("plannedWhen") if cancelled else None)
+        if when:
             departures.append({
                 "tripId": dep.get("tripId"),
                 "line": dep.get("line", {}).get("name", "N/A"),
                 "direction": dep.get("direction", "Unknown"),
-                "when": dep.get("when"),
+                "when": when,
                 "plannedWhen": dep.get("plannedWhen"),
                 "delay": dep.get("delay", 0),
                 "platform": dep.get("platform", "N/A"),
-                "mode": dep.get("line", {}).get("mode", "N/A")
+                "mode": dep.get("line", {}).get("mode", "N/A"),
+                "cancelled": cancelled,
+                "scheduled": False,
             })
 
+    record_observations(station_id, departures)
     return departures
@@ -0,0 +1,536 @@
+# transport/gtfs.py
+import csv
+import io
+import os
+import pickle
+import re
+import time
+import unicodedata
+import zipfile
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Path to a VBB GTFS feed, either the published zip or an unpacked directory
+GTFS_PATH = os.getenv("GTFS_PATH")
+# Optional compiled snapshot of the feed; rebuilt whenever the feed is newer
+GTFS_CACHE_PATH = os.getenv("GTFS_CACHE_PATH")
+
+BERLIN = ZoneInfo("Europe/Berlin")
+
+# Platforms sharing a parent station are assumed walkable in this time
+SAME_STATION_TRANSFER_SECONDS = 120
+
+# transport.rest product names, indexed by Timetable.pattern_product
+PRODUCTS = ("suburban", "subway", "tram", "bus", "ferry", "express", "regional", "other")
+
+# transport.rest station IDs are the 9-digit VBB numbers embedded in GTFS stop IDs
+_VBB_ID = re.compile(r"(?<!\d)(9\d{8})(?!\d)")
+# "Friedrichstr." as VBB abbreviates it, once punctuation is gone
+_STREET_ABBREVIATION = re.compile(r"str\b")
+
+
+def product_for_route_type(route_type: int) -> str:
+    """Map basic and extended GTFS route types onto transport.rest products."""
+    if route_type == 109:
+        return "suburban"
+    if route_type == 1 or 400 <= route_type < 500:
+        return "subway"
+    if route_type == 0 or 900 <= route_type < 1000:
+        return "tram"
+    if route_type in (3, 11) or 200 <= route_type < 300 or 700 <= route_type < 900:
+        return "bus"
+    if route_type == 4 or 1000 <= route_type < 1300:
+        return "ferry"
+    if route_type in (101, 102, 103):
+        return "express"
+    if route_type == 2 or 100 <= route_type < 200:
+        return "regional"
+    return "other"
+
+
+def normalize_name(name: str) -> str:
+    """
+    Case- and diacritic-insensitive form used for station name lookups.
+    Street suffixes are spelled out, so "Friedrichstr.", "Friedrichstraße"
+    and "friedrichstrasse" all normalise to "friedrichstrasse".
+    """
+    folded = unicodedata.normalize("NFKD", name.casefold().replace("ß", "ss"))
+    stripped = "".join(c for c in folded if not unicodedata.combining(c))
+    return _STREET_ABBREVIATION.sub("strasse", " ".join(re.sub(r"[^\w]+", " ", stripped).split()))
+
+
+def station_key(stop_id: str) -> str:
+    match = _VBB_ID.search(stop_id.replace(":", " "))
+    if match:
+        return match.group(1)
+    # Older VBB feeds used 12-digit IDs such as 900000100003 for 900100003
+    if len(stop_id) == 12 and stop_id.startswith("900000"):
+        return "900" + stop_id[6:]
+    return stop_id
+
+
+def parse_gtfs_time(value: str) -> int:
+    """'25:10:00' -> seconds after service-day midnight (may exceed 24h)."""
+    h, m, s = value.strip().split(":")
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+def _yyyymmdd(day: date) -> int:
+    return day.year * 10000 + day.month * 100 + day.day
+
+
+class Timetable:
+    """
+    Array-backed VBB timetable for in-process routing.
+
+    Stops, routes, trips, services and patterns are dense integer indexes.
+    A pattern is a run of trips of one route serving the same stop
+    sequence without overtaking, so the trips of a pattern are ordered by
+    departure at every stop. Per-pattern data is stored CSR-style:
+    `pattern_stops[pattern_stop_offset[p]:pattern_stop_offset[p + 1]]` lists
+    the stops of p, and its trips' times live in `arrival_times` and
+    `departure_times` from `pattern_time_offset[p]`, trip-major, one row of
+    len(stops) per trip.
+    """
+
+    def __init__(self):
+        # Stops
+        self.stop_ids: list[str] = []
+        self.stop_names: list[str] = []
+        self.stop_lat = array("d")
+        self.stop_lon = array("d")
+        self.stop_parent = array("i")
+        self.stop_index: dict[str, int] = {}
+        # transport.rest station ID -> boardable stop indexes
+        self.station_stops: dict[str, list[int]] = {}
+        # normalize_name(station name) -> transport.rest station ID
+        self.station_by_name: dict[str, str] = {}
+
+        # Routes and trips
+        self.route_names: list[str] = []
+        self.route_product = array("b")
+        self.trip_ids: list[str] = []
+        self.trip_route = array("i")
+        self.trip_service = array("i")
+        self.trip_headsign: list[str] = []
+
+        # Services
+        self.service_ids: list[str] = []
+        self.service_weekdays = array("b")
+        self.service_start = array("i")
+        self.service_end = array("i")
+        self.service_added: dict[int, set[int]] = {}
+        self.service_removed: dict[int, set[int]] = {}
+
+        # Patterns
+        self.pattern_route = array("i")
+        self.pattern_product = array("b")
+        self.pattern_stop_offset = array("i", [0])
+        self.pattern_stops = array("i")
+        self.pattern_trip_offset = array("i", [0])
+        self.pattern_trips = array("i")
+        self.pattern_time_offset = array("i", [0])
+        self.arrival_times = array("i")
+        self.departure_times = array("i")
+
+        # Stop -> (pattern, position in pattern)
+        self.stop_pattern_offset = array("i")
+        self.stop_pattern_ids = array("i")
+        self.stop_pattern_pos = array("i")
+
+        # Footpaths: stop -> (stop, seconds)
+        self.transfer_offset = array("i")
+        self.transfer_to = array("i")
+        self.transfer_seconds = array("i")
+
+        self.max_seconds = 0
+        self.feed_version: str | None = None
+        self._active_cache: dict[int, bytearray] = {}
+        self._suffixes: list[tuple[str, str]] | None = None
+
+    # ---------- Services ----------
+
+    def active_services(self, day: date) -> bytearray:
+        """Flags by service index for trips running on `day`, calendar exceptions included."""
+        key = _yyyymmdd(day)
+        flags = self._active_cache.get(key)
+        if flags is not None:
+            return flags
+
+        weekday_bit = 1 << day.weekday()
+        flags = bytearray(len(self.service_ids))
+        for s in range(len(self.service_ids)):
+            if self.service_start[s] <= key <= self.service_end[s] and self.service_weekdays[s] & weekday_bit:
+                flags[s] = 1
+        for s in self.service_added.get(key, ()):
+            flags[s] = 1
+        for s in self.service_removed.get(key, ()):
+            flags[s] = 0
+
+        if len(self._active_cache) > 16:
+            self._active_cache.clear()
+        self._active_cache[key] = flags
+        return flags
+
+    # ---------- Lookups ----------
+
+    def pattern_size(self, p: int) -> int:
+        return self.pattern_stop_offset[p + 1] - self.pattern_stop_offset[p]
+
+    def find_station(self, query: str) -> str | None:
+        """Resolve a transport.rest ID, GTFS stop ID or station name to a station ID."""
+        query = query.strip()
+        if query in self.station_stops:
+            return query
+        if query in self.stop_index:
+            return station_key(self.stop_ids[self.stop_index[query]])
+
+        name = normalize_name(query)
+        if not name:
+            return None
+        if name in self.station_by_name:
+            return self.station_by_name[name]
+        # Shortest name with a word starting with the query, e.g. "alexanderplatz" -> "s+u alexanderplatz"
+        suffixes = self._name_suffixes()
+        best = None
+        i = bisect_left(suffixes, (name,))
+        while i < len(suffixes) and suffixes[i][0].startswith(name):
+            candidate = suffixes[i][1]
+            if best is None or len(candidate) < len(best):
+                best = candidate
+            i += 1
+        return self.station_by_name[best] if best is not None else None
+
+    def _name_suffixes(self) -> list[tuple[str, str]]:
+        """(word suffix, station name) for every station name, sorted for prefix bisection."""
+        # Built on first use; snapshots pickled before it existed lack the attribute
+        suffixes = getattr(self, "_suffixes", None)
+        if suffixes is None:
+            suffixes = sorted(
+                (" ".join(words[w:]), name)
+                for name, words in ((n, n.split(" ")) for n in self.station_by_name)
+                for w in range(len(words))
+            )
+            self._suffixes = suffixes
+        return suffixes
+
+    def station_name(self, key: str) -> str | None:
+        stops = self.station_stops.get(key)
+        if not stops:
+            return None
+        stop = stops[0]
+        parent = self.stop_parent[stop]
+        return self.stop_names[parent if parent >= 0 else stop]
+
+    def to_service_time(self, when: datetime | None) -> tuple[date, int]:
+        """Split a moment into (service date, seconds after local midnight)."""
+        when = when or datetime.now(BERLIN)
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=BERLIN)
+        local = when.astimezone(BERLIN)
+        seconds = local.hour * 3600 + local.minute * 60 + local.second
+        return local.date(), seconds
+
+    @staticmethod
+    def to_datetime(service_date: date, seconds: int) -> datetime:
+        midnight = datetime(service_date.year, service_date.month, service_date.day, tzinfo=BERLIN)
+        return midnight + timedelta(seconds=seconds)
+
+
+# ---------- Feed reading ----------
+
+def _open_table(path: str, name: str):
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        if name not in archive.namelist():
+            return None
+        return io.TextIOWrapper(archive.open(name), encoding="utf-8-sig", newline="")
+    full = os.path.join(path, name)
+    if not os.path.exists(full):
+        return None
+    return open(full, encoding="utf-8-sig", newline="")
+
+
+def _read_table(path: str, name: str, required: bool = True):
+    """Yield (column index, row) pairs; the index maps column name -> position."""
+    handle = _open_table(path, name)
+    if handle is None:
+        if required:
+            raise FileNotFoundError(f"GTFS feed at {path} has no {name}")
+        return
+    with handle:
+        reader = csv.reader(handle)
+        header = next(reader, None) or []
+        columns = {c.strip(): i for i, c in enumerate(header)}
+        for row in reader:
+            if row:
+                yield columns, row
+
+
+def _col(columns: dict, row: list, name: str, default: str = "") -> str:
+    i = columns.get(name)
+    return row[i] if i is not None and i < len(row) else default
+
+
+def _load_stops(tt: Timetable, path: str):
+    parents: list[str] = []
+    for columns, row in _read_table(path, "stops.txt"):
+        stop_id = _col(columns, row, "stop_id")
+        tt.stop_index[stop_id] = len(tt.stop_ids)
+        tt.stop_ids.append(stop_id)
+        tt.stop_names.append(_col(columns, row, "stop_name"))
+        tt.stop_lat.append(float(_col(columns, row, "stop_lat") or 0))
+        tt.stop_lon.append(float(_col(columns, row, "stop_lon") or 0))
+        parents.append(_col(columns, row, "parent_station"))
+
+    for stop_id, parent in zip(tt.stop_ids, parents):
+        tt.stop_parent.append(tt.stop_index.get(parent, -1))
+
+    for i, stop_id in enumerate(tt.stop_ids):
+        parent = tt.stop_parent[i]
+        key = station_key(tt.stop_ids[parent] if parent >= 0 else stop_id)
+        tt.station_stops.setdefault(key, []).append(i)
+    _index_station_names(tt)
+
+
+def _index_station_names(tt: Timetable):
+    # Also rerun on snapshots, which may predate a change to normalize_name
+    tt.station_by_name = {}
+    tt._suffixes = None
+    for i in range(len(tt.stop_ids)):
+        parent = tt.stop_parent[i]
+        key = station_key(tt.stop_ids[parent] if parent >= 0 else tt.stop_ids[i])
+        tt.station_by_name.setdefault(normalize_name(tt.stop_names[parent if parent >= 0 else i]), key)
+
+
+def _load_calendar(tt: Timetable, path: str) -> dict[str, int]:
+    service_index: dict[str, int] = {}
+    days = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+    def service(service_id: str) -> int:
+        if service_id not in service_index:
+            service_index[service_id] = len(tt.service_ids)
+            tt.service_ids.append(service_id)
+            tt.service_weekdays.append(0)
+            tt.service_start.append(0)
+            tt.service_end.append(0)
+        return service_index[service_id]
+
+    for columns, row in _read_table(path, "calendar.txt", required=False):
+        s = service(_col(columns, row, "service_id"))
+        bits = 0
+        for i, day in enumerate(days):
+            if _col(columns, row, day) == "1":
+                bits |= 1 << i
+        tt.service_weekdays[s] = bits
+        tt.service_start[s] = int(_col(columns, row, "start_date") or 0)
+        tt.service_end[s] = int(_col(columns, row, "end_date") or 0)
+
+    for columns, row in _read_table(path, "calendar_dates.txt", required=False):
+        s = service(_col(columns, row, "service_id"))
+        day = int(_col(columns, row, "date"))
+        target = tt.service_added if _col(columns, row, "exception_type") == "1" else tt.service_removed
+        target.setdefault(day, set()).add(s)
+
+    return service_index
+
+
+def _load_trips(tt: Timetable, path: str, service_index: dict[str, int]) -> dict[str, int]:
+    route_index: dict[str, int] = {}
+    for columns, row in _read_table(path, "routes.txt"):
+        route_index[_col(columns, row, "route_id")] = len(tt.route_names)
+        tt.route_names.append(
+            _col(columns, row, "route_short_name") or _col(columns, row, "route_long_name")
+        )
+        tt.route_product.append(
+            PRODUCTS.index(product_for_route_type(int(_col(columns, row, "route_type") or 3)))
+        )
+
+    trip_index: dict[str, int] = {}
+    for columns, row in _read_table(path, "trips.txt"):
+        route = route_index.get(_col(columns, row, "route_id"))
+        service = service_index.get(_col(columns, row, "service_id"))
+        if route is None or service is None:
+            continue
+        trip_id = _col(columns, row, "trip_id")
+        trip_index[trip_id] = len(tt.trip_ids)
+        tt.trip_ids.append(trip_id)
+        tt.trip_route.append(route)
+        tt.trip_service.append(service)
+        tt.trip_headsign.append(_col(columns, row, "trip_headsign"))
+    return trip_index
+
+
+def _load_stop_times(tt: Timetable, path: str, trip_index: dict[str, int]):
+    """
+    Group stop_times into patterns. Rows are expected grouped by trip, as
+    VBB publishes them; a trip that reappears later in the file is dropped.
+    """
+    # (route, stop sequence) -> pattern candidates, each a list of
+    # (departure at first stop, trip, arrivals, departures)
+    candidates: dict[tuple, list] = {}
+    seen: set[int] = set()
+
+    def finish(trip: int, rows: list):
+        if len(rows) < 2:
+            return
+        rows.sort()
+        stops = tuple(r[1] for r in rows)
+        arrivals = [r[2] for r in rows]
+        departures = [r[3] for r in rows]
+        candidates.setdefault((tt.trip_route[trip], stops), []).append(
+            (departures[0], trip, arrivals, departures)
+        )
+
+    current = None
+    rows: list = []
+    for columns, row in _read_table(path, "stop_times.txt"):
+        trip = trip_index.get(_col(columns, row, "trip_id"))
+        stop = tt.stop_index.get(_col(columns, row, "stop_id"))
+        if trip is None or stop is None:
+            continue
+        if trip != current:
+            if current is not None:
+                finish(current, rows)
+                seen.add(current)
+            if trip in seen:
+                print(f"⚠️ GTFS trip {tt.trip_ids[trip]} is not contiguous in stop_times.txt, skipping")
+                current, rows = None, []
+                continue
+            current, rows = trip, []
+        arrival = _col(columns, row, "arrival_time") or _col(columns, row, "departure_time")
+        departure = _col(columns, row, "departure_time") or arrival
+        rows.append((
+            int(_col(columns, row, "stop_sequence")),
+            stop,
+            parse_gtfs_time(arrival),
+            parse_gtfs_time(departure),
+        ))
+    if current is not None:
+        finish(current, rows)
+
+    for (route, stops), trips in candidates.items():
+        trips.sort(key=lambda t: t[0])
+        # Split into overtaking-free patterns so every stop column stays sorted
+        patterns: list[list] = []
+        for trip in trips:
+            for pattern in patterns:
+                last = pattern[-1]
+                if all(a >= b for a, b in zip(trip[3], last[3])) and all(a >= b for a, b in zip(trip[2], last[2])):
+                    pattern.append(trip)
+                    break
+            else:
+                patterns.append([trip])
+        for pattern in patterns:
+            _add_pattern(tt, route, stops, pattern)
+
+
+def _add_pattern(tt: Timetable, route: int, stops: tuple, trips: list):
+    tt.pattern_route.append(route)
+    tt.pattern_product.append(tt.route_product[route])
+    tt.pattern_stops.extend(stops)
+    tt.pattern_stop_offset.append(len(tt.pattern_stops))
+    for _, trip, arrivals, departures in trips:
+        tt.pattern_trips.append(trip)
+        tt.arrival_times.extend(arrivals)
+        tt.departure_times.extend(departures)
+        tt.max_seconds = max(tt.max_seconds, arrivals[-1])
+    tt.pattern_trip_offset.append(len(tt.pattern_trips))
+    tt.pattern_time_offset.append(len(tt.arrival_times))
+
+
+def _index_stop_patterns(tt: Timetable):
+    by_stop: list[list[tuple[int, int]]] = [[] for _ in tt.stop_ids]
+    for p in range(len(tt.pattern_route)):
+        start = tt.pattern_stop_offset[p]
+        for pos in range(tt.pattern_size(p)):
+            by_stop[tt.pattern_stops[start + pos]].append((p, pos))
+
+    for entries in by_stop:
+        tt.stop_pattern_offset.append(len(tt.stop_pattern_ids))
+        for p, pos in entries:
+            tt.stop_pattern_ids.append(p)
+            tt.stop_pattern_pos.append(pos)
+    tt.stop_pattern_offset.append(len(tt.stop_pattern_ids))
+
+
+def _load_transfers(tt: Timetable, path: str):
+    footpaths: list[dict[int, int]] = [{} for _ in tt.stop_ids]
+
+    def add(a: int, b: int, seconds: int):
+        if a != b and seconds < footpaths[a].get(b, 1 << 30):
+            footpaths[a][b] = seconds
+
+    for stops in tt.station_stops.values():
+        if len(stops) > 1:
+            for a in stops:
+                for b in stops:
+                    add(a, b, SAME_STATION_TRANSFER_SECONDS)
+
+    for columns, row in _read_table(path, "transfers.txt", required=False):
+        a = tt.stop_index.get(_col(columns, row, "from_stop_id"))
+        b = tt.stop_index.get(_col(columns, row, "to_stop_id"))
+        if a is None or b is None or _col(columns, row, "transfer_type") == "3":
+            continue
+        add(a, b, int(_col(columns, row, "min_transfer_time") or 0))
+
+    for paths in footpaths:
+        tt.transfer_offset.append(len(tt.transfer_to))
+        for b, seconds in paths.items():
+            tt.transfer_to.append(b)
+            tt.transfer_seconds.append(seconds)
+    tt.transfer_offset.append(len(tt.transfer_to))
+
+
+def build_timetable(path: str) -> Timetable:
+    started = time.monotonic()
+    tt = Timetable()
+    _load_stops(tt, path)
+    service_index = _load_calendar(tt, path)
+    trip_index = _load_trips(tt, path, service_index)
+    _load_stop_times(tt, path, trip_index)
+    _index_stop_patterns(tt)
+    _load_transfers(tt, path)
+    tt.feed_version = datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds")
+    print(
+        f"🚆 GTFS loaded in {time.monotonic() - started:.1f}s: {len(tt.stop_ids)} stops, "
+        f"{len(tt.trip_ids)} trips, {len(tt.pattern_route)} patterns"
+    )
+    return tt
+
+
+# ---------- Process-wide instance ----------
+
+_timetable: Timetable | None = None
+
+
+def get_timetable() -> Timetable | None:
+    """The loaded timetable, or None when no feed is configured or it is still loading."""
+    return _timetable
+
+
+def load_timetable(path: str | None = GTFS_PATH, cache_path: str | None = GTFS_CACHE_PATH) -> Timetable | None:
+    global _timetable
+    if not path or not os.path.exists(path):
+        print("⚠️ GTFS_PATH not set or missing, offline timetable disabled")
+        return None
+
+    if cache_path and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        with open(cache_path, "rb") as f:
+            _timetable = pickle.load(f)
+        _index_station_names(_timetable)
+        print(f"🚆 GTFS snapshot loaded from {cache_path}")
+        return _timetable
+
+    tt = build_timetable(path)
+    if cache_path:
+        with open(cache_path, "wb") as f:
+            pickle.dump(tt, f, protocol=pickle.HIGHEST_PROTOCOL)
+    _timetable = tt
+    return tt
@@ -0,0 +1,197 @@
+# transport/habits.py
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+import redis
+from pymongo.errors import PyMongoError
+
+from db.db_redis import redis_client
+from transport import hot_stations, metrics, rate_limit
+from transport.coalesce import try_lock
+from transport.delay_stats import hour_of_week
+from transport.gtfs import BERLIN
+from transport.journey_service import prewarm_journey, user_collection
+from utils.resolve import UNKNOWN_STATION_ID, get_station_id
+
+# How far back a habit may be observed, and on how many different days
+HABIT_LOOKBACK_DAYS = int(os.getenv("HABIT_LOOKBACK_DAYS", 28))
+HABIT_MIN_DAYS = int(os.getenv("HABIT_MIN_DAYS", 2))
+HABIT_MINE_INTERVAL_SECONDS = int(os.getenv("HABIT_MINE_INTERVAL_SECONDS", 6 * 3600))
+# Journeys are warmed this long before a habit's usual minute; well inside
+# the journey cache's fresh window, so they are still fresh when looked up
+HABIT_LEAD_SECONDS = int(os.getenv("HABIT_LEAD_SECONDS", 120))
+# Usual minutes are rounded to this step, so nearby habits share one warm-up
+HABIT_MINUTE_STEP = 5
+HABIT_MAX_PER_SLOT = int(os.getenv("HABIT_MAX_PER_SLOT", 100))
+HABIT_PREWARM_CONCURRENCY = int(os.getenv("HABIT_PREWARM_CONCURRENCY", 2))
+HABIT_TICK_SECONDS = 60
+
+# Departure boards of habitual origins are handed to the prefetcher at this
+# rate; with its 15 min half-life they stay warm for about an hour
+HABIT_BOOST_RATE_PER_MIN = 4.0
+HABIT_BOARD_DURATION = 60
+
+MINE_LOCK_KEY = "lock:habits:mine"
+SLOT_KEY = "habits:slot:{how}"  # hash "from_id|to_id|minute" -> users with that habit
+
+
+def _slot_key(how: int) -> str:
+    return SLOT_KEY.format(how=how)
+
+
+def _mine_logs(since: datetime) -> list[dict]:
+    """
+    (user, from, to, hour of week) seen on at least HABIT_MIN_DAYS different
+    days, with the average minute past the hour it was looked up at.
+    """
+    local_time = {"date": "$timestamp", "timezone": "Europe/Berlin"}
+    return list(user_collection.aggregate([
+        {"$match": {"timestamp": {"$gte": since}, "user_id": {"$ne": None}}},
+        {"$project": {
+            "user_id": 1, "from": 1, "to": 1, "from_id": 1, "to_id": 1,
+            # $dayOfWeek is 1 for Sunday; Monday 00:00 is hour 0 like delay_stats.hour_of_week
+            "how": {"$add": [
+                {"$multiply": [{"$mod": [{"$add": [{"$dayOfWeek": local_time}, 5]}, 7]}, 24]},
+                {"$hour": local_time},
+            ]},
+            "minute": {"$minute": local_time},
+            "day": {"$dateToString": {"format": "%Y-%m-%d", **local_time}},
+        }},
+        {"$group": {
+            "_id": {"user": "$user_id", "from": "$from", "to": "$to", "how": "$how"},
+            "from_id": {"$max": "$from_id"},
+            "to_id": {"$max": "$to_id"},
+            "days": {"$addToSet": "$day"},
+            "minute": {"$avg": "$minute"},
+        }},
+        {"$match": {f"days.{HABIT_MIN_DAYS - 1}": {"$exists": True}}},
+    ], allowDiskUse=True))
+
+
+async def _station(station_id: str | None, name: str | None) -> str | None:
+    # Logs from before station IDs were recorded only have the name
+    if station_id:
+        return station_id
+    if not name:
+        return None
+    resolved = await get_station_id(name)
+    return None if resolved == UNKNOWN_STATION_ID else resolved
+
+
+async def mine_habits() -> int:
+    """Rebuild the hour-of-week habit table from user_logs; returns how many habits were found."""
+    since = datetime.utcnow() - timedelta(days=HABIT_LOOKBACK_DAYS)
+    rows = await asyncio.to_thread(_mine_logs, since)
+
+    slots: dict[int, dict[str, int]] = {}
+    for row in rows:
+        key = row["_id"]
+        with rate_limit.priority("background"):
+            from_id = await _station(row.get("from_id"), key.get("from"))
+            to_id = await _station(row.get("to_id"), key.get("to"))
+        if not from_id or not to_id or from_id == to_id:
+            continue
+        minute = int(row["minute"] / HABIT_MINUTE_STEP + 0.5) * HABIT_MINUTE_STEP
+        how = int(key["how"])
+        if minute >= 60:
+            how, minute = (how + 1) % 168, 0
+        trips = slots.setdefault(how, {})
+        trip = f"{from_id}|{to_id}|{minute}"
+        trips[trip] = trips.get(trip, 0) + 1
+
+    # Replace the whole table at once, so a slot is never half old, half new
+    pipe = redis_client.pipeline(transaction=True)
+    for how in range(168):
+        pipe.delete(_slot_key(how))
+    for how, trips in slots.items():
+        busiest = sorted(trips.items(), key=lambda t: -t[1])[:HABIT_MAX_PER_SLOT]
+        pipe.hset(_slot_key(how), mapping=dict(busiest))
+    pipe.execute()
+
+    found = sum(len(t) for t in slots.values())
+    metrics.gauge("habits:trips", found)
+    print(f"🔮 Habits mined: {found} recurring trips over {len(slots)} hours of the week")
+    return found
+
+
+async def prewarm_slot(how: int, minute: int) -> int:
+    """Warm departures and journeys for every habit at one minute of one hour of the week."""
+    trips = []
+    for field in redis_client.hgetall(_slot_key(how)):
+        parts = field.split("|")
+        if len(parts) == 3 and parts[2] == str(minute):
+            trips.append(f"{parts[0]}|{parts[1]}")
+    if not trips:
+        return 0
+    semaphore = asyncio.Semaphore(HABIT_PREWARM_CONCURRENCY)
+
+    for origin in {trip.split("|", 1)[0] for trip in trips}:
+        # The prefetcher keeps boards fresh; it just needs to know they will be wanted
+        hot_stations.boost(origin, HABIT_BOARD_DURATION, HABIT_BOOST_RATE_PER_MIN)
+
+    async def warm(trip: str) -> bool:
+        from_id, to_id = trip.split("|", 1)
+        async with semaphore:
+            try:
+                return await prewarm_journey(from_id, to_id)
+            except Exception as e:
+                metrics.incr("habits:prewarm_errors")
+                print(f"⚠️ Habit prewarm failed for {trip}:", e)
+                return False
+
+    warmed = sum(await asyncio.gather(*(warm(t) for t in trips)))
+    metrics.incr("habits:prewarmed", warmed)
+    return warmed
+
+
+# Last habit minute this worker has gone through
+_last_minute: datetime | None = None
+
+
+def _due_minutes(upcoming: datetime) -> list[datetime]:
+    """Habit minutes up to `upcoming` not yet handled, so a late tick skips none."""
+    upcoming = upcoming.replace(second=0, microsecond=0)
+    start = upcoming
+    if _last_minute is not None and timedelta(0) < upcoming - _last_minute <= timedelta(minutes=15):
+        start = _last_minute + timedelta(minutes=1)
+    due = []
+    minute = start
+    while minute <= upcoming:
+        if minute.minute % HABIT_MINUTE_STEP == 0:
+            due.append(minute)
+        minute += timedelta(minutes=1)
+    return due
+
+
+async def habits_tick():
+    global _last_minute
+    # At most one mining run per interval across workers; the lock simply expires
+    if try_lock(MINE_LOCK_KEY, HABIT_MINE_INTERVAL_SECONDS * 1000):
+        try:
+            await mine_habits()
+        except PyMongoError as e:
+            print("⚠️ Habit mining failed:", e)
+
+    upcoming = datetime.now(BERLIN) + timedelta(seconds=HABIT_LEAD_SECONDS)
+    for minute in _due_minutes(upcoming):
+        how = hour_of_week(minute)
+        # One worker warms each habit minute
+        window_key = f"habits:warmed:{minute.date().isoformat()}:{how}:{minute.minute}"
+        if redis_client.set(window_key, 1, nx=True, ex=2 * 3600):
+            started = time.time()
+            warmed = await prewarm_slot(how, minute.minute)
+            if warmed:
+                print(f"🔮 Prewarmed {warmed} habitual journeys for {minute:%a %H:%M} in {time.time() - started:.1f}s")
+    _last_minute = upcoming.replace(second=0, microsecond=0)
+
+
+async def run_habits():
+    """Mine habits now and then; warm each habitual trip just before its usual minute."""
+    while True:
+        await asyncio.sleep(HABIT_TICK_SECONDS)
+        try:
+            await habits_tick()
+        except redis.RedisError as e:
+            print("⚠️ Habit tick skipped:", e)
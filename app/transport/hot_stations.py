@@ -0,0 +1,91 @@
+# transport/hot_stations.py
+import math
+import os
+import time
+from collections import Counter
+
+import redis
+
+from db.db_redis import redis_client
+
+HOT_KEY = "departures:hot"
+EPOCH_KEY = "departures:hot:epoch"
+
+HALF_LIFE_SECONDS = float(os.getenv("PREFETCH_HALF_LIFE_SECONDS", 900))
+# Rebase long before 2 ** (age / half-life) gets anywhere near float overflow
+REBASE_AFTER_HALF_LIVES = 32
+
+# Requests seen by this worker since the last flush, keyed "station_id:duration"
+_local_hits: Counter = Counter()
+
+
+def record_request(station_id: str, duration: int):
+    _local_hits[f"{station_id}:{duration}"] += 1
+
+
+def _epoch() -> float:
+    now = time.time()
+    redis_client.set(EPOCH_KEY, now, nx=True)
+    return float(redis_client.get(EPOCH_KEY) or now)
+
+
+def _decay_factor(epoch: float, now: float) -> float:
+    return 2 ** (-(now - epoch) / HALF_LIFE_SECONDS)
+
+
+def flush_hits():
+    """
+    Fold local hits into the shared sorted set using forward decay: a hit at
+    time t weighs 2^((t - epoch) / half_life), so old hits fade relative to
+    new ones without ever rewriting existing scores.
+    """
+    if not _local_hits:
+        return
+    hits = dict(_local_hits)
+    _local_hits.clear()
+    try:
+        weight = 1 / _decay_factor(_epoch(), time.time())
+        pipe = redis_client.pipeline(transaction=False)
+        for member, count in hits.items():
+            pipe.zincrby(HOT_KEY, count * weight, member)
+        pipe.execute()
+    except redis.RedisError as e:
+        print("⚠️ Could not record station hits:", e)
+
+
+def _rate_per_min(score: float, factor: float) -> float:
+    # A steady rate r (per second) converges to a decayed count of r * half_life / ln 2
+    return score * factor * math.log(2) / HALF_LIFE_SECONDS * 60
+
+
+def boost(station_id: str, duration: int, rate_per_min: float):
+    """Count a station as if it had been asked for at `rate_per_min`; fades like real hits."""
+    member = f"{station_id}:{duration}"
+    score = rate_per_min / 60 * HALF_LIFE_SECONDS / math.log(2) / _decay_factor(_epoch(), time.time())
+    redis_client.zincrby(HOT_KEY, score, member)
+
+
+def top(n: int) -> list[tuple[str, float]]:
+    """The `n` busiest station:duration pairs with their request rate per minute."""
+    factor = _decay_factor(_epoch(), time.time())
+    return [
+        (member, _rate_per_min(score, factor))
+        for member, score in redis_client.zrevrange(HOT_KEY, 0, n - 1, withscores=True)
+    ]
+
+
+def drop_cold(min_rate_per_min: float) -> int:
+    factor = _decay_factor(_epoch(), time.time())
+    min_score = min_rate_per_min / 60 * HALF_LIFE_SECONDS / math.log(2) / factor
+    return redis_client.zremrangebyscore(HOT_KEY, "-inf", f"({min_score}")
+
+
+def rebase_if_needed():
+    epoch = _epoch()
+    now = time.time()
+    if now - epoch < REBASE_AFTER_HALF_LIVES * HALF_LIFE_SECONDS:
+        return
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.zunionstore(HOT_KEY, {HOT_KEY: _decay_factor(epoch, now)})
+    pipe.set(EPOCH_KEY, now)
+    pipe.execute()
@@ -0,0 +1,129 @@
+# transport/isochrone.py
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from db.db_redis import cache_departure, get_cached_departure
+from transport import metrics
+from transport.coalesce import single_flight
+from transport.gtfs import BERLIN, Timetable, get_timetable
+from transport.journey_keys import parse_departure
+from transport.raptor import INF, run_raptor
+from transport.spatial_index import StopGrid, get_stop_grid
+
+# About 4.5 km/h
+WALK_METERS_PER_SECOND = 1.25
+# Furthest we walk to the first stop, and from the last stop to a place
+ACCESS_WALK_METERS = int(os.getenv("ISOCHRONE_ACCESS_WALK_METERS", 800))
+EGRESS_WALK_METERS = int(os.getenv("ISOCHRONE_EGRESS_WALK_METERS", 1000))
+ISOCHRONE_MAX_MINUTES = 90
+ISOCHRONE_ROUNDS = 4
+
+# Requests starting within one bucket from (nearly) the same spot share a search
+ISOCHRONE_BUCKET_SECONDS = int(os.getenv("ISOCHRONE_BUCKET_SECONDS", 300))
+ISOCHRONE_CACHE_SECONDS = int(os.getenv("ISOCHRONE_CACHE_SECONDS", 600))
+# ~150-200 m in Berlin; origins are snapped to this grid before searching
+ORIGIN_SNAP_DEGREES = 0.002
+
+
+def reachable_stations(tt: Timetable, grid: StopGrid, lat: float, lon: float, minutes: int, depart: datetime) -> list[dict]:
+    """
+    Every station reachable from a point within `minutes`: walk to the
+    stations around it, then a one-to-all RAPTOR bounded by the deadline.
+    Rows are {id, name, lat, lon, seconds}, quickest first.
+    """
+    service_date, depart_at = tt.to_service_time(depart)
+    budget = minutes * 60
+    deadline = depart_at + budget
+
+    sources: dict[int, int] = {}
+    for distance, i in grid.within_ids(lat, lon, min(ACCESS_WALK_METERS, budget * WALK_METERS_PER_SECOND)):
+        reached = depart_at + int(distance / WALK_METERS_PER_SECOND)
+        for stop in tt.station_stops.get(grid.entries[i]["id"], ()):
+            if reached < sources.get(stop, INF):
+                sources[stop] = reached
+    if not sources:
+        return []
+
+    best = run_raptor(tt, sources, service_date, max_rounds=ISOCHRONE_ROUNDS, max_arrival=deadline).best
+    stations = []
+    for key, stops in tt.station_stops.items():
+        arrival = min(best[s] for s in stops)
+        i = grid.by_id.get(key)
+        if arrival >= deadline or i is None:
+            continue
+        entry = grid.entries[i]
+        stations.append({
+            "id": key,
+            "name": entry["name"],
+            "lat": entry["lat"],
+            "lon": entry["lon"],
+            "seconds": arrival - depart_at,
+        })
+    stations.sort(key=lambda s: s["seconds"])
+    return stations
+
+
+def _snap(value: float) -> float:
+    return round(round(value / ORIGIN_SNAP_DEGREES) * ORIGIN_SNAP_DEGREES, 6)
+
+
+async def isochrone_stations(lat: float, lon: float, minutes: int, departure: str | None = None) -> dict | None:
+    """
+    Cached reachable stations for an origin, minutes and departure bucket;
+    None when the timetable or stop grid is not loaded. Popular spots are
+    searched once per bucket across all workers. Raises ValueError for an
+    unparseable departure.
+    """
+    when = parse_departure(departure)
+    tt, grid = get_timetable(), get_stop_grid()
+    if tt is None or grid is None:
+        return None
+
+    epoch = int(when.timestamp()) if when else int(time.time())
+    bucket = epoch - epoch % ISOCHRONE_BUCKET_SECONDS
+    # Searched from the middle of the bucket, so nobody is off by more than half of it
+    depart = datetime.fromtimestamp(bucket + ISOCHRONE_BUCKET_SECONDS // 2, BERLIN)
+    origin_lat, origin_lon = _snap(lat), _snap(lon)
+    key = f"isochrone:{origin_lat}:{origin_lon}:{minutes}:{bucket}"
+
+    cached = get_cached_departure(key)
+    if cached is not None:
+        metrics.incr("isochrone_cache:hit")
+        return cached
+    metrics.incr("isochrone_cache:miss")
+
+    async def compute():
+        started = time.perf_counter()
+        stations = await asyncio.to_thread(reachable_stations, tt, grid, origin_lat, origin_lon, minutes, depart)
+        metrics.observe("isochrone:search_seconds", time.perf_counter() - started)
+        return {
+            "origin": {"lat": origin_lat, "lon": origin_lon},
+            "departure": depart.isoformat(),
+            "minutes": minutes,
+            "stations": stations,
+        }
+
+    return await single_flight(
+        key,
+        compute,
+        lambda: get_cached_departure(key),
+        lambda value: cache_departure(key, value, ttl=ISOCHRONE_CACHE_SECONDS),
+    )
+
+
+def egress_rows(isochrone: dict) -> list[tuple[float, float, int, float]]:
+    """
+    (lon, lat, seconds, walk radius) for the origin and every reached
+    station: a place counts as reachable if it is within the remaining
+    walking budget of one of them.
+    """
+    budget = isochrone["minutes"] * 60
+    origin = isochrone["origin"]
+    rows = [(origin["lon"], origin["lat"], 0, min(budget * WALK_METERS_PER_SECOND, EGRESS_WALK_METERS))]
+    for s in isochrone["stations"]:
+        radius = min((budget - s["seconds"]) * WALK_METERS_PER_SECOND, EGRESS_WALK_METERS)
+        if radius > 0:
+            rows.append((s["lon"], s["lat"], s["seconds"], radius))
+    return rows
@@ -0,0 +1,118 @@
+# transport/journey_keys.py
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from transport import metrics
+from transport.gtfs import BERLIN
+
+# Departures within one bucket share a cache entry and a single upstream search
+JOURNEY_TIME_BUCKET_SECONDS = int(os.getenv("JOURNEY_TIME_BUCKET_SECONDS", 300))
+
+# products[] filter groups -> transport.rest products; the offline planner
+# reads the same table so a filter means the same thing on both paths
+PRODUCT_MAP = {
+    "BUS": ["bus"],
+    "TRAM": ["tram"],
+    "TRAIN": ["regional", "suburban"],
+    "ICE": ["express"],
+    "ALL": ["bus", "tram", "regional", "suburban", "express"]
+}
+ALL_PRODUCTS = tuple(sorted(PRODUCT_MAP["ALL"]))
+
+
+@dataclass(frozen=True)
+class JourneyRequest:
+    """A journey search reduced to what actually changes the upstream answer."""
+    from_id: str
+    to_id: str
+    # Sorted transport.rest product names
+    products: tuple[str, ...]
+    # Start of the departure bucket (epoch seconds), None for "leave now"
+    departure_bucket: int | None
+    # Whether normalising changed anything compared with the raw request
+    rewritten: bool = False
+    # False for the compact list view, which leaves stopovers out
+    stopovers: bool = True
+
+    @property
+    def cache_key(self) -> str:
+        products = "all" if self.products == ALL_PRODUCTS else ",".join(self.products)
+        when = "now" if self.departure_bucket is None else str(self.departure_bucket)
+        view = "" if self.stopovers else ":compact"
+        return f"journeys:{self.from_id}:{self.to_id}:{products}:{when}{view}"
+
+    @property
+    def departure(self) -> str | None:
+        if self.departure_bucket is None:
+            return None
+        return datetime.fromtimestamp(self.departure_bucket, BERLIN).isoformat()
+
+
+def parse_departure(value: str | None) -> datetime | None:
+    """
+    ISO departure time, Berlin local if it has no offset; None for "leave
+    now". Raises ValueError for anything else rather than quietly planning
+    from now.
+    """
+    if not value or not value.strip():
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid departure time: {value!r}") from None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=BERLIN)
+
+
+def normalize_journey_request(
+    from_id: str,
+    to_id: str,
+    products: list[str] | None,
+    departure: str | None,
+    stopovers: bool = True,
+) -> JourneyRequest:
+    modes = set()
+    for p in products or ["ALL"]:
+        modes.update(PRODUCT_MAP.get(p.upper(), []))
+    canonical_products = tuple(sorted(modes or ALL_PRODUCTS))
+
+    raw_products = [p.upper() for p in products or []]
+    rewritten = raw_products != sorted(set(raw_products))
+
+    bucket = None
+    parsed = parse_departure(departure)
+    if parsed is not None:
+        epoch = int(parsed.timestamp())
+        bucket = epoch - epoch % JOURNEY_TIME_BUCKET_SECONDS
+        rewritten = rewritten or bucket != epoch
+    return JourneyRequest(
+        from_id=from_id.strip(),
+        to_id=to_id.strip(),
+        products=canonical_products,
+        departure_bucket=bucket,
+        rewritten=rewritten,
+        stopovers=stopovers,
+    )
+
+
+def _time_dimension(request: JourneyRequest) -> str:
+    if request.departure_bucket is None:
+        return "now"
+    ahead = request.departure_bucket - datetime.now(timezone.utc).timestamp()
+    if ahead < 0:
+        return "past"
+    if ahead < 3600:
+        return "within_1h"
+    if ahead < 86400:
+        return "within_1d"
+    return "later"
+
+
+def record_lookup(request: JourneyRequest, hit: bool):
+    """Hit/miss per key dimension, to see which part of the key fragments the cache."""
+    outcome = "hit" if hit else "miss"
+    products = "all" if request.products == ALL_PRODUCTS else "+".join(request.products)
+    metrics.incr(f"journey_cache:{outcome}")
+    metrics.incr(f"journey_cache:products={products}:{outcome}")
+    metrics.incr(f"journey_cache:time={_time_dimension(request)}:{outcome}")
+    metrics.incr(f"journey_cache:normalized={'rewritten' if request.rewritten else 'as_sent'}:{outcome}")
@@ -1,12 +1,25 @@
 # transport/journey_service.py
-import requests
+import asyncio
+import hashlib
+import time
+from dataclasses import replace
 from pymongo import MongoClient
 from dotenv import load_dotenv
 from datetime import datetime
 import os
-from db.db_redis import cache_departure, get_cached_departure
+import redis
+from db.db_mongo import station_catalog
+from db.db_redis import cache_departure, get_cached_departure, get_cached_departures, redis_client
+from db.write_behind import enqueue_insert, enqueue_update, enqueue_upsert
+from db.journey_store import route_upsert, split_journey
 from utils.resolve import get_station_id
-from bson import ObjectId
+from transport.vbb_api import vbb_get
+from transport.refresh_service import refresh_journey
+from transport.coalesce import refresh_if_owner, single_flight
+from transport.route_service import plan_offline
+from transport.resilience import upstream_unavailable
+from transport.journey_keys import JourneyRequest, normalize_journey_request, record_lookup
+from transport import metrics, rate_limit
 
 load_dotenv()
 
@@ -14,139 +27,393 @@ MONGO_URI = os.getenv("MONGO_URI")
 client = MongoClient(MONGO_URI)
 db = client["Vbb_transport"]
 journey_collection = db["journey_logs"]
-station_collection = db["station_logs"]
 user_collection = db["user_logs"]
 
-def fetch_journey(from_station: str, to_station: str, products: list[str] = None, date: str = None, user_id: str = None, departure: str = None):
-    from_id = get_station_id(from_station) if not from_station.isdigit() else from_station
-    to_id = get_station_id(to_station) if not to_station.isdigit() else to_station
-
-    cache_key = f"{from_id}:{to_id}:{','.join(products or [])}:{date or ''}"
-    cached = get_cached_departure(cache_key)
-    if cached:
-        print("✅ Cache hit:", cache_key)
-        return {"status": "cached", "journeys": cached}
-
-    url = "https://v6.vbb.transport.rest/journeys"
-    params = {
-        "from": from_id,
-        "to": to_id,
-        "stopovers": True,
+# Served as-is while fresh, served and revalidated in the background while stale
+JOURNEY_FRESH_SECONDS = 300
+JOURNEY_STALE_SECONDS = 900
+
+# Realtime fields a refreshToken refresh may change
+REALTIME_JOURNEY_FIELDS = ("departure", "arrival", "duration", "platform", "delay")
+REALTIME_LEG_FIELDS = ("departure", "arrival", "stopovers")
+
+# Stopovers fetched on demand for one journey; realtime data, so kept briefly
+STOPOVERS_TTL_SECONDS = 120
+
+# Batch refresh: repeated tokens within this window are answered from cache
+REFRESH_CACHE_SECONDS = 30
+REFRESH_BATCH_CONCURRENCY = int(os.getenv("REFRESH_BATCH_CONCURRENCY", 4))
+
+# Keeps fire-and-forget revalidations referenced until they finish
+_revalidations: set[asyncio.Task] = set()
+
+async def fetch_journey(from_station: str, to_station: str, products: list[str] = None, date: str = None, user_id: str = None, departure: str = None, compact: bool = False):
+    from_id = await get_station_id(from_station) if not from_station.isdigit() else from_station
+    to_id = await get_station_id(to_station) if not to_station.isdigit() else to_station
+
+    request = normalize_journey_request(from_id, to_id, products, date or departure, stopovers=not compact)
+    cache_key = request.cache_key
+    params = _journey_params(request)
+
+    entry = _read_cached_entry(cache_key)
+    if entry is None and compact:
+        # A full entry for the same search answers the list view too
+        full = _read_cached_entry(replace(request, stopovers=True).cache_key)
+        if isinstance(full, dict):
+            entry = {**full, "journeys": [_compact_journey(j) for j in full["journeys"]]}
+    record_lookup(request, hit=isinstance(entry, dict))
+    if isinstance(entry, dict):
+        if time.time() - entry["fetched_at"] < JOURNEY_FRESH_SECONDS:
+            print("✅ Cache hit:", cache_key)
+            return {"status": "cached", "journeys": entry["journeys"]}
+
+        print("♻️ Stale cache hit, revalidating:", cache_key)
+        _schedule_revalidation(cache_key, entry, params)
+        return {"status": "cached", "stale": True, "journeys": entry["journeys"]}
+
+    try:
+        all_journeys = await _search_journeys(params)
+
+        if not all_journeys:
+            return {"status": "error", "message": "No journey found"}
+
+        # Logged through the write-behind queue, the response never waits on Mongo
+        all_journeys[0]["_id"] = _log_journey(all_journeys[0], user_id)
+
+        try:
+            _cache_journeys(cache_key, all_journeys)
+        except redis.RedisError as e:
+            print(f"⚠️ Could not cache journeys for {cache_key}:", e)
+        return {"status": "success", "journeys": all_journeys}
+
+    except Exception as e:
+        if upstream_unavailable(e):
+            fallback = await _offline_journeys(from_id, to_id, products, request.departure)
+            if fallback:
+                print("🗓️ VBB unavailable, answering from the offline timetable:", e)
+                return {"status": "scheduled", "journeys": fallback}
+        return {"status": "error", "message": str(e)}
+
+
+def _read_cached_entry(cache_key: str) -> dict | None:
+    # Redis down is a miss: the search goes upstream instead of failing
+    try:
+        return get_cached_departure(cache_key)
+    except redis.RedisError as e:
+        print("⚠️ Journey cache unavailable:", e)
+        return None
+
+
+async def prewarm_journey(from_id: str, to_id: str) -> bool:
+    """
+    Fill the "leave now" cache entry for a trip ahead of its usual time,
+    without logging it as a lookup. Returns False if it was fresh already
+    or another worker is on it.
+    """
+    request = normalize_journey_request(from_id, to_id, None, None)
+    cache_key = request.cache_key
+    entry = get_cached_departure(cache_key)
+    if isinstance(entry, dict) and time.time() - entry["fetched_at"] < JOURNEY_FRESH_SECONDS / 2:
+        return False
+    params = _journey_params(request)
+    with rate_limit.priority("background"):
+        journeys = await refresh_if_owner(
+            cache_key,
+            lambda: _full_revalidation(params),
+            lambda value: _cache_journeys(cache_key, value),
+        )
+    return journeys is not None
+
+
+async def _offline_journeys(from_id: str, to_id: str, products: list[str] | None, departure: str | None) -> list[dict] | None:
+    try:
+        return await plan_offline(from_id, to_id, departure, products)
+    except Exception as e:
+        print("⚠️ Offline planner failed:", e)
+        return None
+
+
+def _journey_params(request: JourneyRequest) -> dict:
+    return {
+        "from": request.from_id,
+        "to": request.to_id,
+        "stopovers": request.stopovers,
         "results": 5,
         "language": "en",
         "duration": 90,
-        "departure": departure,
+        "departure": request.departure,
+        "products[]": list(request.products),
+    }
+
+
+async def _search_journeys(params: dict) -> list[dict]:
+    data = await vbb_get("/journeys", params=params)
+    return [_shape_journey(journey, params["stopovers"]) for journey in data.get("journeys") or []]
+
+
+def journey_handle(refresh_token: str) -> str:
+    """Short stable ID for a journey, used to fetch its stopovers later."""
+    return hashlib.sha1(refresh_token.encode()).hexdigest()[:16]
+
+
+def _shape_journey(journey: dict, stopovers: bool) -> dict:
+    formatted = _format_journey(journey)
+    return formatted if stopovers else _compact_journey(formatted)
+
+
+def _compact_journey(journey: dict) -> dict:
+    """List-view journey: leg summaries only, stopovers via the journey handle."""
+    return {
+        **journey,
+        "legs": [{k: v for k, v in leg.items() if k != "stopovers"} for leg in journey["legs"]],
     }
 
-    # Normalize products → default to ALL
-    if not products:
-        products = ["ALL"]
 
-    PRODUCT_MAP = {
-        "BUS": ["bus"],
-        "TRAM": ["tram"],
-        "TRAIN": ["regional", "suburban"],
-        "ICE": ["express"],
-        "ALL": ["bus", "tram", "regional", "suburban", "express"]
+def _station_id(stop: dict | None) -> str | None:
+    # Legs start and end at a stop (platform); the catalog is keyed by its station
+    stop = stop or {}
+    return (stop.get("station") or stop).get("id")
+
+
+def _format_journey(journey: dict) -> dict:
+    legs_info = []
+    total_changes = len(journey["legs"]) - 1
+
+    for leg in journey["legs"]:
+        origin_loc = leg.get("origin", {}).get("location", {}) or {}
+        dest_loc = leg.get("destination", {}).get("location", {}) or {}
+        legs_info.append({
+            "line": leg.get("line", {}).get("name"),
+            "mode": leg.get("line", {}).get("mode"),
+            "departure": leg.get("departure"),
+            "arrival": leg.get("arrival"),
+            "origin": leg.get("origin", {}).get("name"),
+            "destination": leg.get("destination", {}).get("name"),
+            "origin_id": _station_id(leg.get("origin")),
+            "destination_id": _station_id(leg.get("destination")),
+            "origin_lat": origin_loc.get("latitude"),
+            "origin_lng": origin_loc.get("longitude"),
+            "destination_lat": dest_loc.get("latitude"),
+            "destination_lng": dest_loc.get("longitude"),
+            "stopovers": [
+                {
+                    "name": stop.get("stop", {}).get("name"),
+                    "arrival": stop.get("arrival"),
+                    "departure": stop.get("departure"),
+                    "platform": stop.get("platform"),
+                }
+                for stop in leg.get("stopovers", [])
+            ]
+        })
+
+    # ✅ Extract key info from first and last legs
+    first_leg = journey["legs"][0]
+    last_leg = journey["legs"][-1]
+    first_origin_loc = first_leg.get("origin", {}).get("location", {}) or {}
+    last_dest_loc = last_leg.get("destination", {}).get("location", {}) or {}
+
+    return {
+        "from": first_leg.get("origin", {}).get("name"),
+        "to": last_leg.get("destination", {}).get("name"),
+        "departure": first_leg.get("departure"),
+        "arrival": last_leg.get("arrival"),
+        "duration": journey.get("duration"),
+        "line": first_leg.get("line", {}).get("name"),
+        "mode": first_leg.get("line", {}).get("mode"),
+        "platform": first_leg.get("platform"),
+        "delay": first_leg.get("delay", 0),
+        "changes": total_changes,
+        "from_lat": first_origin_loc.get("latitude"),
+        "from_lng": first_origin_loc.get("longitude"),
+        "to_lat": last_dest_loc.get("latitude"),
+        "to_lng": last_dest_loc.get("longitude"),
+        "refreshToken": journey.get("refreshToken"),
+        "handle": journey_handle(journey["refreshToken"]) if journey.get("refreshToken") else None,
+        "legs": legs_info
     }
 
-    for p in products:
-        modes = PRODUCT_MAP.get(p.upper())
-        if modes:
-            for mode in modes:
-                params.setdefault("products[]", []).append(mode)
 
+def _cache_journeys(cache_key: str, journeys: list[dict]):
+    ttl = JOURNEY_FRESH_SECONDS + JOURNEY_STALE_SECONDS
+    cache_departure(cache_key, {"fetched_at": time.time(), "journeys": journeys}, ttl=ttl)
+    # Handles stay resolvable for as long as the journeys may be served
+    pipe = redis_client.pipeline(transaction=False)
+    for journey in journeys:
+        if journey.get("handle") and journey.get("refreshToken"):
+            pipe.setex(f"journey:handle:{journey['handle']}", ttl, journey["refreshToken"])
+    pipe.execute()
+
+
+def _apply_realtime(target: dict, fresh: dict):
+    """Copy refreshed times and delays onto a cached journey, keeping its identity."""
+    if len(target["legs"]) != len(fresh["legs"]):
+        target.update({k: v for k, v in fresh.items() if k != "_id"})
+        return
+    for field in REALTIME_JOURNEY_FIELDS:
+        target[field] = fresh.get(field)
+    for cached_leg, fresh_leg in zip(target["legs"], fresh["legs"]):
+        for field in REALTIME_LEG_FIELDS:
+            if field in fresh_leg:
+                cached_leg[field] = fresh_leg[field]
 
-    if date:
-        params["departure"] = date
 
+def _has_departed(journeys: list[dict]) -> bool:
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        first = datetime.fromisoformat(journeys[0]["departure"])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return True
+    return first.timestamp() < time.time()
 
-        if not data.get("journeys"):
-            return {"status": "error", "message": "No journey found"}
 
-        all_journeys = []
-
-        for journey in data["journeys"]:
-            legs_info = []
-            total_changes = len(journey["legs"]) - 1
-
-            for leg in journey["legs"]:
-                origin_loc = leg.get("origin", {}).get("location", {}) or {}
-                dest_loc = leg.get("destination", {}).get("location", {}) or {}
-                legs_info.append({
-                    "line": leg.get("line", {}).get("name"),
-                    "mode": leg.get("line", {}).get("mode"),
-                    "departure": leg.get("departure"),
-                    "arrival": leg.get("arrival"),
-                    "origin": leg.get("origin", {}).get("name"),
-                    "destination": leg.get("destination", {}).get("name"),
-                    "origin_lat": origin_loc.get("latitude"),
-                    "origin_lng": origin_loc.get("longitude"),
-                    "destination_lat": dest_loc.get("latitude"),
-                    "destination_lng": dest_loc.get("longitude"),
-                    "stopovers": [
-                        {
-                            "name": stop.get("stop", {}).get("name"),
-                            "arrival": stop.get("arrival"),
-                            "departure": stop.get("departure"),
-                            "platform": stop.get("platform"),
-                        }
-                        for stop in leg.get("stopovers", [])
-                    ]
-                })
-
-            # ✅ Extract key info from first and last legs
-            first_leg = journey["legs"][0]
-            last_leg = journey["legs"][-1]
-            first_origin_loc = first_leg.get("origin", {}).get("location", {}) or {}
-            last_dest_loc = last_leg.get("destination", {}).get("location", {}) or {}
-
-            all_journeys.append({
-                "from": first_leg.get("origin", {}).get("name"),
-                "to": last_leg.get("destination", {}).get("name"),
-                "departure": first_leg.get("departure"),
-                "arrival": last_leg.get("arrival"),
-                "duration": journey.get("duration"),
-                "line": first_leg.get("line", {}).get("name"),
-                "mode": first_leg.get("line", {}).get("mode"),
-                "platform": first_leg.get("platform"),
-                "delay": first_leg.get("delay", 0),
-                "changes": total_changes,
-                "from_lat": first_origin_loc.get("latitude"),
-                "from_lng": first_origin_loc.get("longitude"),
-                "to_lat": last_dest_loc.get("latitude"),
-                "to_lng": last_dest_loc.get("longitude"),
-                "legs": legs_info
-            })
-
-        if all_journeys:
-            result = journey_collection.insert_one(all_journeys[0])
-            inserted_id = str(result.inserted_id)
-            all_journeys[0]["_id"] = inserted_id
-
-            if user_id:
-                user_collection.insert_one({
-                    "user_id": user_id,
-                    "from": all_journeys[0]["legs"][0]["origin"],
-                    "to": all_journeys[0]["legs"][-1]["destination"],
-                    "timestamp": datetime.utcnow(),
-                    "journey_id": ObjectId(inserted_id)
-                })
-
-            for leg in all_journeys[0]["legs"]:
-                for station_name in [leg["origin"], leg["destination"]]:
-                    station_collection.update_one(
-                        {"station_id": station_name},
-                        {"$set": {"name": station_name, "line": leg["line"]}},
-                        upsert=True
-                    )
-
-        cache_departure(cache_key, all_journeys, ttl=300)
-        return {"status": "success", "journeys": all_journeys}
+async def _revalidate(entry: dict, params: dict) -> list[dict]:
+    """
+    Refresh each cached journey through its refreshToken, which is much
+    cheaper upstream than a search. Fall back to a full /journeys search
+    when tokens are missing or rejected, or when a "leave now" result has
+    already departed and would only show the past.
+    """
+    journeys = entry["journeys"]
+    tokens = [j.get("refreshToken") for j in journeys]
+    leave_now = params.get("departure") is None
+
+    if not all(tokens) or (leave_now and _has_departed(journeys)):
+        return await _full_revalidation(params)
+
+    stopovers = params["stopovers"]
+    refreshed = await asyncio.gather(*(refresh_journey(t, stopovers) for t in tokens), return_exceptions=True)
+    if any(isinstance(r, Exception) or not r.get("journey") for r in refreshed):
+        return await _full_revalidation(params)
+
+    for journey, data in zip(journeys, refreshed):
+        _apply_realtime(journey, _shape_journey(data["journey"], stopovers))
+    return journeys
+
+
+async def _full_revalidation(params: dict) -> list[dict]:
+    journeys = await _search_journeys(params)
+    if not journeys:
+        # Keep serving the stale copy rather than caching an empty answer
+        raise RuntimeError("No journey found")
+    return journeys
+
+
+def _schedule_revalidation(cache_key: str, entry: dict, params: dict):
+    async def run():
+        try:
+            # Only one worker revalidates a key; the rest keep serving the stale copy
+            with rate_limit.priority("background"):
+                await refresh_if_owner(
+                    cache_key,
+                    lambda: _revalidate(entry, params),
+                    lambda journeys: _cache_journeys(cache_key, journeys),
+                )
+        except Exception as e:
+            print(f"⚠️ Journey revalidation failed for {cache_key}:", e)
 
+    task = asyncio.create_task(run())
+    _revalidations.add(task)
+    task.add_done_callback(_revalidations.discard)
+
+
+async def fetch_journey_stopovers(handle: str):
+    """Stopovers of every leg of one journey, refreshed through its refreshToken."""
+    key = f"journey:stopovers:{handle}"
+    cached = get_cached_departure(key)
+    if cached is not None:
+        return {"status": "cached", "handle": handle, "legs": cached}
+
+    token = redis_client.get(f"journey:handle:{handle}")
+    if not token:
+        return {"status": "error", "message": "Unknown or expired journey handle"}
+
+    async def fetch():
+        data = await refresh_journey(token)
+        return [
+            {k: leg[k] for k in ("line", "mode", "origin", "destination", "stopovers")}
+            for leg in _format_journey(data["journey"])["legs"]
+        ]
+
+    try:
+        legs = await single_flight(
+            key,
+            fetch,
+            lambda: get_cached_departure(key),
+            lambda value: cache_departure(key, value, ttl=STOPOVERS_TTL_SECONDS),
+        )
     except Exception as e:
         return {"status": "error", "message": str(e)}
+    return {"status": "success", "handle": handle, "legs": legs}
+
+
+async def refresh_journeys(tokens: list[str], stopovers: bool = False):
+    """
+    Refresh many saved journeys at once, in the same format fetch_journey
+    returns. Tokens refreshed in the last REFRESH_CACHE_SECONDS come from
+    cache; the rest go upstream at most REFRESH_BATCH_CONCURRENCY at a time.
+    """
+    tokens = list(dict.fromkeys(t for t in tokens if t))
+    view = "full" if stopovers else "compact"
+    keys = [f"journey:refreshed:{journey_handle(t)}:{view}" for t in tokens]
+    cached = get_cached_departures(keys)
+    semaphore = asyncio.Semaphore(REFRESH_BATCH_CONCURRENCY)
+
+    def write_cached(key: str, journey: dict):
+        cache_departure(key, journey, ttl=REFRESH_CACHE_SECONDS)
+        redis_client.setex(
+            f"journey:handle:{journey['handle']}",
+            JOURNEY_FRESH_SECONDS + JOURNEY_STALE_SECONDS,
+            journey["refreshToken"],
+        )
+
+    async def refresh_one(token: str, key: str, journey: dict | None) -> dict:
+        if journey is not None:
+            metrics.incr("journey_refresh_cache:hit")
+            return {"refreshToken": token, "status": "cached", "journey": journey}
+        metrics.incr("journey_refresh_cache:miss")
+
+        async def fetch():
+            async with semaphore:
+                data = await refresh_journey(token, stopovers)
+            return _shape_journey(data["journey"], stopovers)
+
+        try:
+            journey = await single_flight(
+                key,
+                fetch,
+                lambda: get_cached_departure(key),
+                lambda value: write_cached(key, value),
+            )
+        except Exception as e:
+            return {"refreshToken": token, "status": "error", "message": str(e)}
+        return {"refreshToken": token, "status": "success", "journey": journey}
+
+    results = await asyncio.gather(*(refresh_one(t, k, c) for t, k, c in zip(tokens, keys, cached)))
+    return {"status": "success", "journeys": results}
+
+
+def _log_journey(journey: dict, user_id: str | None) -> str:
+    """Store the route once under its content hash; the user log keeps this run's times."""
+    journey_hash, route, instance = split_journey(journey)
+    now = datetime.utcnow()
+    enqueue_upsert(journey_collection, {"_id": journey_hash}, route_upsert(route, now))
+
+    if user_id:
+        enqueue_insert(user_collection, {
+            "user_id": user_id,
+            "from": journey["legs"][0]["origin"],
+            "to": journey["legs"][-1]["destination"],
+            "from_id": journey["legs"][0].get("origin_id"),
+            "to_id": journey["legs"][-1].get("destination_id"),
+            "timestamp": now,
+            "journey_hash": journey_hash,
+            **instance,
+        })
+
+    # Popularity for autocomplete, on the synced catalog entry of each station;
+    # stations the catalog does not know yet are not counted
+    for leg in journey["legs"]:
+        for station_id in (leg.get("origin_id"), leg.get("destination_id")):
+            if station_id:
+                enqueue_update(station_catalog, {"_id": station_id}, {"$inc": {"hits": 1}})
+
+    return journey_hash
@@ -0,0 +1,174 @@
+# transport/live_departures.py
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import Request, WebSocket, WebSocketDisconnect
+
+from transport import metrics, rate_limit
+from transport.coalesce import refresh_if_owner
+from transport.departure_service import (
+    _fetch_and_format_departures,
+    departure_key,
+    read_departures,
+    store_departures,
+)
+
+LIVE_POLL_SECONDS = float(os.getenv("LIVE_POLL_SECONDS", 15))
+LIVE_KEEPALIVE_SECONDS = 20
+# Messages buffered per subscriber before a slow client is resynced with a snapshot
+LIVE_QUEUE_SIZE = 20
+
+# Row fields whose change is pushed to subscribers
+WATCHED_FIELDS = ("when", "delay", "platform", "cancelled")
+
+
+def _row_key(row: dict) -> str:
+    return row.get("tripId") or f"{row.get('line')}|{row.get('plannedWhen')}"
+
+
+def diff_departures(previous: dict[str, dict], current: dict[str, dict]) -> dict:
+    """Rows keyed by tripId in, only what a client has to apply out."""
+    return {
+        "changed": [
+            row for key, row in current.items()
+            if key in previous and any(row.get(f) != previous[key].get(f) for f in WATCHED_FIELDS)
+        ],
+        "added": [row for key, row in current.items() if key not in previous],
+        "removed": [key for key in previous if key not in current],
+    }
+
+
+class _StationPoller:
+    """One upstream poll loop per station, fanned out to every subscriber queue."""
+
+    def __init__(self, station_id: str, duration: int):
+        self.station_id = station_id
+        self.duration = duration
+        self.key = departure_key(station_id, duration)
+        self.subscribers: set[asyncio.Queue] = set()
+        self.rows: dict[str, dict] | None = None
+        self.task = asyncio.create_task(self._run())
+
+    def snapshot_message(self) -> dict:
+        return {"type": "snapshot", "station_id": self.station_id, "departures": list(self.rows.values())}
+
+    async def _poll(self) -> list[dict] | None:
+        # Fresh enough if /departures traffic or another worker refreshed it this interval
+        cached = read_departures(self.station_id, self.duration)
+        if cached is not None and time.time() - cached["fetched_at"] < LIVE_POLL_SECONDS:
+            return cached["departures"]
+        with rate_limit.priority("live"):
+            fresh = await refresh_if_owner(
+                self.key,
+                lambda: _fetch_and_format_departures(self.station_id, self.duration),
+                lambda value: store_departures(self.station_id, self.duration, value),
+            )
+        if fresh is None:
+            # Someone else holds the refresh lock; their result lands in the cache
+            cached = read_departures(self.station_id, self.duration)
+            return cached["departures"] if cached else None
+        return fresh
+
+    async def _run(self):
+        while True:
+            try:
+                rows = await self._poll()
+                metrics.incr("live:polls")
+            except Exception as e:
+                print(f"⚠️ Live poll failed for {self.station_id}:", e)
+                metrics.incr("live:poll_errors")
+                rows = None
+            if rows is not None:
+                self._publish(rows)
+            await asyncio.sleep(LIVE_POLL_SECONDS)
+
+    def _publish(self, rows: list[dict]):
+        current = {_row_key(row): row for row in rows}
+        previous, self.rows = self.rows, current
+        if previous is None:
+            self._broadcast(self.snapshot_message())
+            return
+        diff = diff_departures(previous, current)
+        if any(diff.values()):
+            self._broadcast({"type": "update", "station_id": self.station_id, **diff})
+
+    def _broadcast(self, message: dict):
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Too far behind for diffs to apply; start it over from the full board
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self.snapshot_message())
+            metrics.incr("live:pushes")
+
+
+_pollers: dict[tuple[str, int], _StationPoller] = {}
+
+
+def _update_gauges():
+    metrics.gauge("live:pollers", len(_pollers))
+    metrics.gauge("live:subscribers", sum(len(p.subscribers) for p in _pollers.values()))
+
+
+@asynccontextmanager
+async def subscribe(station_id: str, duration: int = 60):
+    """Queue of snapshot/update messages for one station while the context is open."""
+    key = (station_id, duration)
+    poller = _pollers.get(key)
+    if poller is None:
+        poller = _pollers[key] = _StationPoller(station_id, duration)
+    queue: asyncio.Queue = asyncio.Queue(LIVE_QUEUE_SIZE)
+    poller.subscribers.add(queue)
+    if poller.rows is not None:
+        queue.put_nowait(poller.snapshot_message())
+    _update_gauges()
+    try:
+        yield queue
+    finally:
+        poller.subscribers.discard(queue)
+        if not poller.subscribers and _pollers.get(key) is poller:
+            poller.task.cancel()
+            del _pollers[key]
+        _update_gauges()
+
+
+async def serve_websocket(websocket: WebSocket, station_id: str, duration: int = 60):
+    await websocket.accept()
+    async with subscribe(station_id, duration) as updates:
+
+        async def forward():
+            while True:
+                await websocket.send_json(await updates.get())
+
+        sender = asyncio.create_task(forward())
+        try:
+            # Nothing is expected from the client; this only notices the disconnect
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
+
+
+async def event_stream(request: Request, station_id: str, duration: int = 60):
+    """Server-sent events, same messages as the WebSocket."""
+    async with subscribe(station_id, duration) as updates:
+        while not await request.is_disconnected():
+            try:
+                message = await asyncio.wait_for(updates.get(), timeout=LIVE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+
+def stop_all():
+    for poller in _pollers.values():
+        poller.task.cancel()
+    _pollers.clear()
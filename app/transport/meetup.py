@@ -0,0 +1,250 @@
+# transport/meetup.py
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
+
+from transport import metrics
+from transport.gtfs import Timetable, get_timetable
+from transport.journey_keys import parse_departure
+from transport.raptor import INF, run_raptor
+from transport.spatial_index import StopGrid, get_stop_grid
+
+MEETUP_MAX_ORIGINS = 10
+# Nobody is expected to travel longer than this to meet; also bounds each search
+MEETUP_MAX_MINUTES = int(os.getenv("MEETUP_MAX_MINUTES", 90))
+MEETUP_ROUNDS = 4
+MEETUP_POI_RADIUS_METERS = 500
+MEETUP_POIS_PER_STATION = 5
+# Processes running the per-origin searches side by side; below 2 they run
+# one after another in a thread instead
+MEETUP_WORKERS = int(os.getenv("MEETUP_WORKERS", min(4, os.cpu_count() or 1)))
+
+# minmax: the longest trip of the group is as short as possible (fairest)
+# sum: the group spends the least time travelling in total
+OBJECTIVES = ("minmax", "sum")
+
+# Timetable -> stop index -> column in the station vectors, built once per feed
+_station_columns: dict[int, tuple[list[str], np.ndarray]] = {}
+
+# (id of the timetable its workers hold, pool)
+_pool: tuple[int, ProcessPoolExecutor] | None = None
+# The timetable inside a pool worker, handed over once when the worker starts
+_worker_timetable: Timetable | None = None
+
+
+def _columns(tt: Timetable) -> tuple[list[str], np.ndarray]:
+    cached = _station_columns.get(id(tt))
+    if cached is None:
+        keys = list(tt.station_stops)
+        column = np.full(len(tt.stop_ids), -1, dtype=np.int64)
+        for c, key in enumerate(keys):
+            column[tt.station_stops[key]] = c
+        _station_columns.clear()
+        cached = _station_columns[id(tt)] = (keys, column)
+    return cached
+
+
+def _travel_seconds(tt: Timetable, origin: str, service_date, depart_at: int, column: np.ndarray, n_stations: int) -> np.ndarray:
+    """One-to-all search from one station, reduced to seconds to every station (INF if out of range)."""
+    result = run_raptor(
+        tt,
+        {stop: depart_at for stop in tt.station_stops[origin]},
+        service_date,
+        max_rounds=MEETUP_ROUNDS,
+        max_arrival=depart_at + MEETUP_MAX_MINUTES * 60,
+    )
+    best = np.asarray(result.best, dtype=np.int64)
+    served = column >= 0
+    per_station = np.full(n_stations, INF, dtype=np.int64)
+    # A station is reached when its first platform is
+    np.minimum.at(per_station, column[served], best[served])
+    return np.where(per_station < INF, per_station - depart_at, INF)
+
+
+def _travel_matrix(tt: Timetable, origins: list[str], service_date, depart_at: int, column: np.ndarray, n_stations: int) -> np.ndarray:
+    """(origins x stations) travel seconds, one one-to-all search per origin."""
+    return np.vstack([
+        _travel_seconds(tt, origin, service_date, depart_at, column, n_stations)
+        for origin in origins
+    ])
+
+
+def _init_worker(tt: Timetable):
+    global _worker_timetable
+    _worker_timetable = tt
+
+
+def _worker_travel_seconds(origin: str, service_date, depart_at: int) -> np.ndarray:
+    tt = _worker_timetable
+    keys, column = _columns(tt)
+    return _travel_seconds(tt, origin, service_date, depart_at, column, len(keys))
+
+
+def _get_pool(tt: Timetable) -> ProcessPoolExecutor | None:
+    """Worker pool holding `tt`, replaced when the feed is reloaded; None if disabled."""
+    global _pool
+    if MEETUP_WORKERS < 2:
+        return None
+    if _pool is not None and _pool[0] == id(tt):
+        return _pool[1]
+    shutdown_pool()
+    pool = ProcessPoolExecutor(MEETUP_WORKERS, initializer=_init_worker, initargs=(tt,))
+    _pool = (id(tt), pool)
+    return pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool[1].shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def _travel_matrix_parallel(tt: Timetable, origins: list[str], service_date, depart_at: int, column: np.ndarray, n_stations: int) -> np.ndarray:
+    """
+    Like _travel_matrix, one process per origin. The searches are pure
+    Python and hold the GIL, so only processes make them overlap.
+    """
+    pool = _get_pool(tt)
+    if pool is not None:
+        loop = asyncio.get_running_loop()
+        try:
+            return np.vstack(await asyncio.gather(*(
+                loop.run_in_executor(pool, _worker_travel_seconds, origin, service_date, depart_at)
+                for origin in origins
+            )))
+        except BrokenProcessPool as e:
+            # A worker died (e.g. out of memory); start over with a fresh pool next time
+            print("⚠️ Meetup worker pool broke, searching in-process:", e)
+            shutdown_pool()
+    return await asyncio.to_thread(_travel_matrix, tt, origins, service_date, depart_at, column, n_stations)
+
+
+def score_stations(travel: np.ndarray, objective: str) -> np.ndarray:
+    """
+    Score per station from an (origins x stations) matrix of travel seconds,
+    lower is better; INF where any origin cannot get there in time. The
+    other objective breaks ties.
+    """
+    reachable = (travel < INF).all(axis=0)
+    worst = travel.max(axis=0)
+    total = travel.sum(axis=0)
+    n = travel.shape[0]
+    if objective == "sum":
+        # Mean in seconds, the longest trip as a sub-second tie-break
+        score = total / n + worst / (MEETUP_MAX_MINUTES * 60 * 10)
+    else:
+        score = worst + total / (n * MEETUP_MAX_MINUTES * 60 * 10)
+    return np.where(reachable, score, np.inf)
+
+
+async def plan_meetup(
+    origins: list[str],
+    departure: str | None = None,
+    objective: str = "minmax",
+    results: int = 5,
+) -> dict:
+    """
+    Best stations for a group starting at `origins` to meet at, on the
+    offline timetable. Raises ValueError for an unparseable departure.
+    """
+    when = parse_departure(departure)
+    tt, grid = get_timetable(), get_stop_grid()
+    if tt is None or grid is None:
+        return {"status": "error", "message": "Offline timetable is not loaded (set GTFS_PATH)."}
+    if objective not in OBJECTIVES:
+        return {"status": "error", "message": f"objective must be one of {', '.join(OBJECTIVES)}"}
+    if not 2 <= len(origins) <= MEETUP_MAX_ORIGINS:
+        return {"status": "error", "message": f"Give between 2 and {MEETUP_MAX_ORIGINS} origins."}
+
+    keys = []
+    for origin in origins:
+        key = tt.find_station(origin)
+        if key is None:
+            return {"status": "error", "message": f"Unknown station: {origin}"}
+        keys.append(key)
+
+    started = time.perf_counter()
+    station_keys, column = _columns(tt)
+    service_date, depart_at = tt.to_service_time(when)
+    travel = await _travel_matrix_parallel(tt, keys, service_date, depart_at, column, len(station_keys))
+    scores = score_stations(travel, objective)
+
+    candidates = np.flatnonzero(np.isfinite(scores))
+    best = candidates[np.argsort(scores[candidates], kind="stable")]
+    stations = []
+    for c in best:
+        entry = _grid_entry(grid, station_keys[c])
+        if entry is None:
+            continue
+        stations.append({
+            **entry,
+            "max_minutes": round(int(travel[:, c].max()) / 60),
+            "total_minutes": round(int(travel[:, c].sum()) / 60),
+            "minutes_by_origin": [round(int(s) / 60) for s in travel[:, c]],
+        })
+        if len(stations) >= results:
+            break
+
+    metrics.observe("meetup:seconds", time.perf_counter() - started)
+    if not stations:
+        return {"status": "error", "message": f"No station reachable by everyone within {MEETUP_MAX_MINUTES} minutes."}
+    return {
+        "status": "success",
+        "origins": [{"query": o, "id": k, "name": tt.station_name(k)} for o, k in zip(origins, keys)],
+        "departure": tt.to_datetime(service_date, depart_at).isoformat(),
+        "objective": objective,
+        "stations": stations,
+    }
+
+
+def _grid_entry(grid: StopGrid, key: str) -> dict | None:
+    i = grid.by_id.get(key)
+    return dict(grid.entries[i]) if i is not None else None
+
+
+async def attach_places(db: AsyncSession, stations: list[dict], per_station: int = MEETUP_POIS_PER_STATION):
+    """Closest POIs around each meeting station, one query for all of them."""
+    if not stations:
+        return
+    sql = """
+    SELECT s.station_id, p.*
+    FROM unnest(
+        CAST(:ids AS text[]),
+        CAST(:lons AS float8[]),
+        CAST(:lats AS float8[])
+    ) AS s(station_id, lon, lat)
+    CROSS JOIN LATERAL (
+        SELECT
+            id,
+            title,
+            category,
+            ST_Y(geo::geometry) AS latitude,
+            ST_X(geo::geometry) AS longitude,
+            ROUND(ST_Distance(geo, ST_MakePoint(s.lon, s.lat)::geography)) AS distance_m
+        FROM poi
+        WHERE geo IS NOT NULL
+          AND ST_DWithin(geo, ST_MakePoint(s.lon, s.lat)::geography, :radius)
+        ORDER BY distance_m
+        LIMIT :per_station
+    ) p
+    """
+    result = await db.execute(text(sql), {
+        "ids": [s["id"] for s in stations],
+        "lons": [s["lon"] for s in stations],
+        "lats": [s["lat"] for s in stations],
+        "radius": MEETUP_POI_RADIUS_METERS,
+        "per_station": per_station,
+    })
+    by_station: dict[str, list[dict]] = {s["id"]: [] for s in stations}
+    for row in result.fetchall():
+        place = dict(row._mapping)
+        by_station[place.pop("station_id")].append(place)
+    for station in stations:
+        station["places"] = by_station[station["id"]]
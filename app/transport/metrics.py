@@ -0,0 +1,104 @@
+# transport/metrics.py
+import asyncio
+import time
+from collections import Counter
+
+import redis
+
+from db.db_redis import redis_client
+
+METRICS_KEY = "transport:metrics"
+FLUSH_INTERVAL_SECONDS = 5
+
+# Per-worker deltas, folded into one Redis hash so every worker reports together
+_pending: Counter = Counter()
+_gauges: dict[str, float] = {}
+
+
+def incr(name: str, amount: float = 1):
+    _pending[name] += amount
+
+
+def observe(name: str, value: float):
+    """Record one sample; the snapshot exposes its count, sum and mean."""
+    _pending[f"{name}:count"] += 1
+    _pending[f"{name}:sum"] += value
+
+
+def gauge(name: str, value: float):
+    """Point-in-time value; the last write from any worker wins."""
+    _gauges[name] = value
+
+
+def flush():
+    if not _pending and not _gauges:
+        return
+    deltas = dict(_pending)
+    gauges = dict(_gauges)
+    _pending.clear()
+    _gauges.clear()
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for name, amount in deltas.items():
+            pipe.hincrbyfloat(METRICS_KEY, name, amount)
+        if gauges:
+            pipe.hset(METRICS_KEY, mapping=gauges)
+        pipe.hsetnx(METRICS_KEY, "since", time.time())
+        pipe.execute()
+    except redis.RedisError as e:
+        print("⚠️ Metrics flush failed, keeping deltas:", e)
+        _pending.update(deltas)
+
+
+async def run_flusher(interval: float = FLUSH_INTERVAL_SECONDS):
+    while True:
+        await asyncio.sleep(interval)
+        flush()
+
+
+def ratio(hits: float, misses: float) -> float | None:
+    total = hits + misses
+    return round(hits / total, 4) if total else None
+
+
+def snapshot() -> dict:
+    flush()
+    raw = {k: float(v) for k, v in redis_client.hgetall(METRICS_KEY).items()}
+    since = raw.pop("since", None)
+    uptime = time.time() - since if since else None
+
+    counters = {}
+    for name, value in sorted(raw.items()):
+        base, _, part = name.rpartition(":")
+        if part == "count" and f"{base}:sum" in raw:
+            counters[base] = {
+                "count": int(value),
+                "mean": round(raw[f"{base}:sum"] / value, 4) if value else None,
+            }
+        elif part != "sum" or f"{base}:count" not in raw:
+            counters[name] = value
+
+    hit_rates = {}
+    for name, value in counters.items():
+        if name.endswith(":hit"):
+            base = name[:-len(":hit")]
+            hit_rates[base] = ratio(value, counters.get(f"{base}:miss", 0))
+
+    rates = {}
+    if uptime:
+        for name, value in counters.items():
+            if name.startswith("vbb_calls") and isinstance(value, float):
+                rates[name] = round(value / uptime * 60, 3)
+
+    return {
+        "since": since,
+        "metrics": counters,
+        "hit_rates": hit_rates,
+        "upstream_calls_per_min": rates,
+    }
+
+
+def reset():
+    _pending.clear()
+    _gauges.clear()
+    redis_client.delete(METRICS_KEY)
@@ -0,0 +1,105 @@
+# transport/prefetch.py
+import asyncio
+import math
+import os
+import time
+
+import redis
+
+from db.db_redis import redis_client
+from transport import hot_stations, metrics
+from transport.coalesce import try_lock
+from transport.departure_service import refresh_departures
+
+LEADER_KEY = "lock:departures:prefetcher"
+
+PREFETCH_TOP_N = int(os.getenv("PREFETCH_TOP_N", 50))
+PREFETCH_TICK_SECONDS = float(os.getenv("PREFETCH_TICK_SECONDS", 5))
+PREFETCH_MIN_INTERVAL_SECONDS = float(os.getenv("PREFETCH_MIN_INTERVAL_SECONDS", 20))
+PREFETCH_MAX_INTERVAL_SECONDS = float(os.getenv("PREFETCH_MAX_INTERVAL_SECONDS", 120))
+# Stations asked for less often than this (requests per minute) stop being prefetched
+PREFETCH_COLD_RATE_PER_MIN = float(os.getenv("PREFETCH_COLD_RATE_PER_MIN", 0.2))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", 4))
+# Prefetched entries outlive their refresh interval by this much so they never lapse
+PREFETCH_TTL_GRACE_SECONDS = 15
+
+# Leader-only schedule: "station_id:duration" -> when the next refresh is due
+_next_due: dict[str, float] = {}
+_leader_token: str | None = None
+
+
+def refresh_interval(rate_per_min: float) -> float:
+    """
+    Busy stations are refreshed more often: one request a minute gets a
+    60s cycle, nine a minute 20s, and quiet stations stretch towards the max.
+    """
+    if rate_per_min <= 0:
+        return PREFETCH_MAX_INTERVAL_SECONDS
+    interval = 60 / math.sqrt(rate_per_min)
+    return min(max(interval, PREFETCH_MIN_INTERVAL_SECONDS), PREFETCH_MAX_INTERVAL_SECONDS)
+
+
+def _is_leader() -> bool:
+    """One worker prefetches at a time; leadership lapses if it stops ticking."""
+    global _leader_token
+    ttl_ms = int(PREFETCH_TICK_SECONDS * 3 * 1000)
+    if _leader_token and redis_client.get(LEADER_KEY) == _leader_token:
+        redis_client.pexpire(LEADER_KEY, ttl_ms)
+        return True
+    _leader_token = try_lock(LEADER_KEY, ttl_ms)
+    return _leader_token is not None
+
+
+async def _prefetch_one(member: str, interval: float, due_at: float, semaphore: asyncio.Semaphore):
+    station_id, duration = member.rsplit(":", 1)
+    async with semaphore:
+        try:
+            await refresh_departures(
+                station_id,
+                int(duration),
+                ttl=int(interval + PREFETCH_TTL_GRACE_SECONDS),
+            )
+            metrics.incr("prefetch:runs")
+            metrics.observe("prefetch:lag_seconds", time.time() - due_at)
+        except Exception as e:
+            metrics.incr("prefetch:errors")
+            print(f"⚠️ Prefetch failed for {member}:", e)
+    _next_due[member] = time.time() + interval
+
+
+async def prefetch_tick():
+    hot_stations.rebase_if_needed()
+    dropped = hot_stations.drop_cold(PREFETCH_COLD_RATE_PER_MIN)
+    if dropped:
+        metrics.incr("prefetch:dropped", dropped)
+
+    hot = hot_stations.top(PREFETCH_TOP_N)
+    now = time.time()
+
+    tracked = {member for member, _ in hot}
+    for member in list(_next_due):
+        if member not in tracked:
+            del _next_due[member]
+    metrics.gauge("prefetch:tracked", len(tracked))
+
+    semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+    jobs = []
+    for member, rate in hot:
+        due_at = _next_due.get(member, now)
+        if due_at <= now:
+            jobs.append(_prefetch_one(member, refresh_interval(rate), due_at, semaphore))
+    await asyncio.gather(*jobs)
+
+
+async def run_prefetcher():
+    """Every worker publishes its request counts; the leader keeps the top-N warm."""
+    while True:
+        await asyncio.sleep(PREFETCH_TICK_SECONDS)
+        hot_stations.flush_hits()
+        try:
+            if _is_leader():
+                await prefetch_tick()
+            else:
+                _next_due.clear()
+        except redis.RedisError as e:
+            print("⚠️ Prefetch tick skipped:", e)
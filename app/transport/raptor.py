@@ -0,0 +1,206 @@
+# transport/raptor.py
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from transport.gtfs import Timetable
+
+INF = 1 << 30
+MAX_ROUNDS = 6
+
+
+@dataclass
+class RaptorResult:
+    """
+    Round-by-round earliest arrivals. `arrivals[k][s]` is the best arrival at
+    stop s using at most k trips; `labels[k]` says how each stop improved in
+    round k, either ("trip", pattern, trip, day_offset, board_pos, alight_pos)
+    or ("walk", from_stop, seconds).
+    """
+    service_date: date
+    arrivals: list[list[int]]
+    labels: list[dict[int, tuple]] = field(default_factory=list)
+
+    @property
+    def best(self) -> list[int]:
+        return self.arrivals[-1]
+
+
+def _service_days(tt: Timetable, service_date: date, depart_at: int):
+    """(seconds offset, active service flags) for the days whose trips can be boarded."""
+    days = [(0, tt.active_services(service_date))]
+    # Trips of yesterday's service day that run past midnight
+    if depart_at + 86400 <= tt.max_seconds:
+        days.append((-86400, tt.active_services(service_date - timedelta(days=1))))
+    return days
+
+
+def _earliest_trip(tt: Timetable, p: int, pos: int, t: int, days) -> tuple[int, int] | None:
+    """First running trip of pattern p leaving position `pos` at or after t."""
+    n = tt.pattern_size(p)
+    first = tt.pattern_trip_offset[p]
+    count = tt.pattern_trip_offset[p + 1] - first
+    base = tt.pattern_time_offset[p] + pos
+    dep = tt.departure_times
+    trips = tt.pattern_trips
+    trip_service = tt.trip_service
+
+    best = None
+    for offset, active in days:
+        target = t - offset
+        column = _Column(dep, base, n, count)
+        k = bisect_left(column, target)
+        while k < count:
+            if active[trip_service[trips[first + k]]]:
+                departs = dep[base + k * n] + offset
+                if best is None or departs < best[0]:
+                    best = (departs, k, offset)
+                break
+            k += 1
+    return (best[1], best[2]) if best else None
+
+
+class _Column:
+    """Read-only view of one stop's departures down a pattern, for bisect."""
+    __slots__ = ("values", "base", "stride", "count")
+
+    def __init__(self, values, base, stride, count):
+        self.values, self.base, self.stride, self.count = values, base, stride, count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, k):
+        return self.values[self.base + k * self.stride]
+
+
+def run_raptor(
+    tt: Timetable,
+    sources: dict[int, int],
+    service_date: date,
+    targets: set[int] | None = None,
+    max_rounds: int = MAX_ROUNDS,
+    allowed_products: set[int] | None = None,
+    max_arrival: int = INF,
+) -> RaptorResult:
+    """
+    RAPTOR earliest-arrival search from `sources` (stop -> departure seconds).
+
+    Without `targets` it runs one-to-all; with them, arrivals no better than
+    the best known target arrival are pruned. `max_arrival` bounds the
+    search horizon, which isochrone queries rely on.
+    """
+    n_stops = len(tt.stop_ids)
+    depart_at = min(sources.values())
+    days = _service_days(tt, service_date, depart_at)
+
+    best = [INF] * n_stops
+    current = [INF] * n_stops
+    marked: set[int] = set()
+    labels0: dict[int, tuple] = {}
+    for stop, t in sources.items():
+        current[stop] = best[stop] = t
+        marked.add(stop)
+
+    _relax_footpaths(tt, current, best, labels0, marked, max_arrival)
+    arrivals = [current[:]]
+    labels = [labels0]
+
+    arr = tt.arrival_times
+    dep = tt.departure_times
+    pattern_stops = tt.pattern_stops
+
+    for _ in range(max_rounds):
+        previous = arrivals[-1]
+        round_labels: dict[int, tuple] = {}
+
+        # Earliest marked position per pattern
+        queue: dict[int, int] = {}
+        for stop in marked:
+            for i in range(tt.stop_pattern_offset[stop], tt.stop_pattern_offset[stop + 1]):
+                p = tt.stop_pattern_ids[i]
+                if allowed_products is not None and tt.pattern_product[p] not in allowed_products:
+                    continue
+                pos = tt.stop_pattern_pos[i]
+                if pos < queue.get(p, INF):
+                    queue[p] = pos
+        marked = set()
+
+        target_best = min((best[s] for s in targets), default=INF) if targets else INF
+        bound = min(target_best, max_arrival)
+
+        for p, start in queue.items():
+            n = tt.pattern_size(p)
+            stop_base = tt.pattern_stop_offset[p]
+            time_base = tt.pattern_time_offset[p]
+            trip = None
+            board_pos = 0
+            for pos in range(start, n):
+                stop = pattern_stops[stop_base + pos]
+                if trip is not None:
+                    k, offset = trip
+                    t_arr = arr[time_base + k * n + pos] + offset
+                    if t_arr < best[stop] and t_arr < bound:
+                        current[stop] = best[stop] = t_arr
+                        round_labels[stop] = ("trip", p, k, offset, board_pos, pos)
+                        marked.add(stop)
+                # Can we catch an earlier trip here?
+                reached = previous[stop]
+                if reached < INF:
+                    if trip is None or reached <= dep[time_base + trip[0] * n + pos] + trip[1]:
+                        candidate = _earliest_trip(tt, p, pos, reached, days)
+                        if candidate is not None and candidate != trip:
+                            trip = candidate
+                            board_pos = pos
+
+        _relax_footpaths(tt, current, best, round_labels, marked, max_arrival)
+        arrivals.append(current[:])
+        labels.append(round_labels)
+        if not marked:
+            break
+
+    return RaptorResult(service_date=service_date, arrivals=arrivals, labels=labels)
+
+
+def _relax_footpaths(tt: Timetable, current, best, labels, marked: set[int], max_arrival: int):
+    """One walking hop from every stop improved by a trip in this round."""
+    for stop in list(marked):
+        reached = current[stop]
+        for i in range(tt.transfer_offset[stop], tt.transfer_offset[stop + 1]):
+            to = tt.transfer_to[i]
+            t = reached + tt.transfer_seconds[i]
+            if t < best[to] and t < max_arrival:
+                current[to] = best[to] = t
+                labels[to] = ("walk", stop, tt.transfer_seconds[i])
+                marked.add(to)
+
+
+def reconstruct(tt: Timetable, result: RaptorResult, stop: int, rounds: int) -> list[tuple]:
+    """
+    Walk labels back from `stop` as reached with at most `rounds` trips.
+    Returns legs in travel order, each ("trip", pattern, trip, offset,
+    board_pos, alight_pos) or ("walk", from_stop, to_stop, depart, arrive).
+    """
+    legs = []
+    k = rounds
+    while True:
+        # The stop may have been settled in an earlier round
+        while k > 0 and stop not in result.labels[k]:
+            k -= 1
+        label = result.labels[k].get(stop)
+        if label is None:
+            break
+        if label[0] == "walk":
+            _, from_stop, seconds = label
+            arrive = result.arrivals[k][stop]
+            legs.append(("walk", from_stop, stop, arrive - seconds, arrive))
+            stop = from_stop
+            continue
+        legs.append(label)
+        _, p, _, _, board_pos, _ = label
+        stop = tt.pattern_stops[tt.pattern_stop_offset[p] + board_pos]
+        k -= 1
+        if k < 0:
+            break
+    legs.reverse()
+    return legs
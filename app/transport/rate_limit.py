@@ -0,0 +1,142 @@
+# transport/rate_limit.py
+import asyncio
+import contextvars
+import os
+import random
+from contextlib import contextmanager
+
+import redis
+
+from db.db_redis import redis_client
+from transport import metrics
+from transport.resilience import UpstreamUnavailable
+
+# One bucket for every worker: transport.rest counts requests per client, not per process
+VBB_RATE_PER_SECOND = float(os.getenv("VBB_RATE_PER_SECOND", 1.5))
+VBB_RATE_BURST = float(os.getenv("VBB_RATE_BURST", 20))
+BUCKET_KEY = "ratelimit:vbb:bucket"
+PAUSE_KEY = "ratelimit:vbb:pause"
+# Pause applied to every worker after a 429 without a usable Retry-After
+PAUSE_ON_429_SECONDS = 2.0
+MAX_SLEEP_SECONDS = 0.5
+
+# Highest first. A priority may only take a token while more than its share
+# of the burst is left, so lower priorities run dry before higher ones do.
+PRIORITIES = ("interactive", "live", "background")
+RESERVED_SHARE = {"interactive": 0.0, "live": 0.2, "background": 0.5}
+
+# Priority of the upstream calls made from the current task
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("vbb_priority", default="interactive")
+# Requests of each priority waiting for a token in this worker
+_waiting = {p: 0 for p in PRIORITIES}
+
+# Returns 0 if a token was taken, else milliseconds until one could be
+_TAKE_SCRIPT = redis_client.register_script(
+    """
+    local rate, burst, reserve = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local paused = redis.call('pttl', KEYS[2])
+    if paused > 0 then
+        return paused
+    end
+    local clock = redis.call('time')
+    local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+    local state = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+    local wait = 0
+    if tokens >= reserve + 1 then
+        tokens = tokens - 1
+    else
+        wait = math.ceil((reserve + 1 - tokens) * 1000 / rate)
+    end
+    redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('pexpire', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+    return wait
+    """
+)
+
+
+class RateLimited(UpstreamUnavailable):
+    """No token within the call's deadline; callers fall back as for an outage."""
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+@contextmanager
+def priority(name: str):
+    """Run the upstream calls made inside the block (and tasks it starts) at `name`."""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _take(name: str) -> int:
+    reserve = RESERVED_SHARE[name] * VBB_RATE_BURST
+    try:
+        return int(_TAKE_SCRIPT(
+            keys=[BUCKET_KEY, PAUSE_KEY],
+            args=[VBB_RATE_PER_SECOND, VBB_RATE_BURST, reserve],
+        ))
+    except redis.RedisError as e:
+        # Without Redis there is nothing to coordinate on; let the call through
+        print("⚠️ Rate limiter unavailable, calling VBB ungoverned:", e)
+        return 0
+
+
+def _outranked(name: str) -> bool:
+    return any(_waiting[p] for p in PRIORITIES[:PRIORITIES.index(name)])
+
+
+def try_acquire(name: str | None = None) -> bool:
+    """Take a token only if one is free right now (used for hedges)."""
+    name = name or current_priority()
+    if _outranked(name) or _take(name):
+        metrics.incr(f"ratelimit:{name}:skipped")
+        return False
+    metrics.incr(f"ratelimit:{name}:granted")
+    return True
+
+
+async def acquire(deadline: float, name: str | None = None):
+    """
+    Wait for a token from the shared bucket. Higher priorities waiting in
+    this worker go first; across workers the reserved shares keep
+    background work from draining the bucket. Raises RateLimited as soon
+    as the expected wait would overrun `deadline` (event loop time).
+    """
+    name = name or current_priority()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    _waiting[name] += 1
+    try:
+        while True:
+            wait_ms = MAX_SLEEP_SECONDS * 1000 if _outranked(name) else _take(name)
+            if not wait_ms:
+                metrics.incr(f"ratelimit:{name}:granted")
+                metrics.observe(f"ratelimit:{name}:wait_seconds", loop.time() - started)
+                return
+            wait = wait_ms / 1000
+            if loop.time() + wait >= deadline:
+                metrics.incr(f"ratelimit:{name}:rejected")
+                raise RateLimited(f"VBB rate limit: no {name} slot within the deadline")
+            # Jitter so waiting workers do not all retry on the same tick
+            await asyncio.sleep(min(wait, MAX_SLEEP_SECONDS) * random.uniform(1.0, 1.2))
+    finally:
+        _waiting[name] -= 1
+
+
+def pause(seconds: float | None):
+    """Stop every worker from calling VBB for a while, after upstream said 429."""
+    ms = int((seconds or PAUSE_ON_429_SECONDS) * 1000)
+    try:
+        # Never shorten a pause another worker already set
+        if redis_client.pttl(PAUSE_KEY) < ms:
+            redis_client.set(PAUSE_KEY, 1, px=ms)
+        metrics.incr("ratelimit:paused")
+    except redis.RedisError as e:
+        print("⚠️ Could not pause VBB calls:", e)
@@ -1,13 +1,13 @@
 # transport/refresh_service.py
-import requests
+from urllib.parse import quote
 
-def refresh_journey(refresh_token: str):
-    url = "https://v6.vbb.transport.rest/journeys"
+from transport.vbb_api import vbb_get
+
+
+async def refresh_journey(refresh_token: str, stopovers: bool = True):
     params = {
-        "refreshToken": refresh_token,
-        "stopovers": True,
+        "stopovers": stopovers,
         "language": "en"
     }
-    response = requests.get(url, params=params)
-    response.raise_for_status()
-    return response.json()
+    # v6 exposes refreshes as /journeys/:ref, the token must be path-escaped
+    return await vbb_get(f"/journeys/{quote(refresh_token, safe='')}", params=params)
@@ -0,0 +1,177 @@
+# transport/resilience.py
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+import httpx
+
+from transport import metrics
+
+# Outcomes of the last BREAKER_WINDOW calls decide whether a breaker trips
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", 20))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 10))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", 0.5))
+BREAKER_SLOW_SECONDS = float(os.getenv("BREAKER_SLOW_SECONDS", 4))
+BREAKER_SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", 0.8))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", 30))
+
+# A second copy of a request goes out once the first outlives the p95 latency
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY_SECONDS = 0.1
+# Upper bound on extra upstream load from hedging, as a share of calls
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", 0.1))
+LATENCY_SAMPLES = 200
+
+
+class UpstreamUnavailable(httpx.TransportError):
+    """Raised without touching the network while a breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-worker breaker for one kind of upstream call.
+
+    Closed: calls go through and their outcomes are tracked. It opens when
+    too many of the recent calls failed or were slow, rejects everything
+    for BREAKER_OPEN_SECONDS, then lets a single probe through (half-open)
+    whose outcome closes or re-opens it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probing = False
+        # (failed, slow) per finished call
+        self.outcomes: deque[tuple[bool, bool]] = deque(maxlen=BREAKER_WINDOW)
+        # Seconds per successful request, hedges included
+        self.latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.calls = 0
+        self.hedges = 0
+
+    def acquire(self):
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < BREAKER_OPEN_SECONDS:
+                metrics.incr(f"breaker:{self.name}:rejected")
+                raise UpstreamUnavailable(f"VBB {self.name} circuit open")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.probing:
+                metrics.incr(f"breaker:{self.name}:rejected")
+                raise UpstreamUnavailable(f"VBB {self.name} circuit half-open, probe in flight")
+            self.probing = True
+        self.calls += 1
+
+    def release(self, failed: bool | None, seconds: float):
+        """Outcome of an acquired call; None when it was cancelled before finishing."""
+        if self.state == "half_open":
+            self.probing = False
+            if failed is True:
+                self._open()
+            elif failed is False:
+                self._close()
+            return
+        if failed is None:
+            return
+        self.outcomes.append((failed, seconds >= BREAKER_SLOW_SECONDS))
+        if self.state == "closed" and len(self.outcomes) >= BREAKER_MIN_CALLS:
+            errors = sum(f for f, _ in self.outcomes) / len(self.outcomes)
+            slow = sum(s for _, s in self.outcomes) / len(self.outcomes)
+            if errors >= BREAKER_ERROR_RATE or slow >= BREAKER_SLOW_RATE:
+                self._open()
+
+    def _open(self):
+        if self.state != "open":
+            print(f"⚠️ VBB {self.name} circuit opened")
+            metrics.incr(f"breaker:{self.name}:opened")
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        metrics.gauge(f"breaker:{self.name}:open", 1)
+
+    def _close(self):
+        print(f"✅ VBB {self.name} circuit closed")
+        self.state = "closed"
+        self.outcomes.clear()
+        metrics.gauge(f"breaker:{self.name}:open", 0)
+
+    def hedge_delay(self) -> float | None:
+        """p95 latency budget before hedging, or None when a hedge is not allowed."""
+        if self.state != "closed" or len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        if self.hedges >= self.calls * HEDGE_MAX_RATIO:
+            return None
+        ordered = sorted(self.latencies)
+        return max(ordered[int(len(ordered) * HEDGE_PERCENTILE)], HEDGE_MIN_DELAY_SECONDS)
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def upstream_unavailable(error: Exception) -> bool:
+    """True for failures a fallback should cover: open breaker, network, 429 and 5xx."""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def endpoint_name(path: str) -> str:
+    """departures, journeys, refresh, locations, ... for a transport.rest path."""
+    parts = path.strip("/").split("/")
+    if parts[0] == "stops" and len(parts) > 2:
+        return parts[-1]
+    if parts[0] == "journeys" and len(parts) > 1:
+        return "refresh"
+    return parts[0]
+
+
+def breaker_for(path: str) -> CircuitBreaker:
+    name = endpoint_name(path)
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+async def hedged(breaker: CircuitBreaker, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+    """
+    Run send(); if it is still pending after the breaker's p95 budget, race
+    a second send() and keep whichever answers first. The loser is cancelled.
+    """
+
+    async def timed():
+        started = time.monotonic()
+        response = await send()
+        breaker.latencies.append(time.monotonic() - started)
+        return response
+
+    delay = breaker.hedge_delay()
+    first = asyncio.ensure_future(timed())
+    tasks = {first}
+    try:
+        if delay is None:
+            return await first
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return first.result()
+
+        breaker.hedges += 1
+        metrics.incr(f"vbb_hedges:{breaker.name}")
+        second = asyncio.ensure_future(timed())
+        tasks.add(second)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        metrics.incr(f"vbb_hedges:{breaker.name}:won")
+                    return task.result()
+        # Both copies failed; surface the original error
+        return first.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
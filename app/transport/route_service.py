@@ -1,43 +1,237 @@
-# services/route_service.py
-from db.db_neo4j import get_neo4j_session
+# transport/route_service.py
+import asyncio
+from datetime import date, datetime
 
-def find_shortest_route(start_station_name: str, end_station_name: str):
-    """
-    Fallback-safe route finder.
-    If Neo4j is disabled, returns a simple demo response instead of erroring out.
-    """
-    session = get_neo4j_session()
-    if not session:
-        # Neo4j is disabled, return fallback response
+from transport.gtfs import PRODUCTS, Timetable, get_timetable, station_key
+from transport.journey_keys import PRODUCT_MAP, parse_departure
+from transport.raptor import INF, reconstruct, run_raptor
+
+OFFLINE_RESULTS = 3
+
+
+def _allowed_products(products: list[str] | None) -> set[int] | None:
+    if not products or any(p.upper() == "ALL" for p in products):
+        return None
+    names = set()
+    for p in products:
+        names.update(PRODUCT_MAP.get(p.upper(), []))
+    return {PRODUCTS.index(n) for n in names} or None
+
+
+def _stop_summary(tt: Timetable, stop: int) -> dict:
+    parent = tt.stop_parent[stop]
+    return {
+        "id": station_key(tt.stop_ids[parent if parent >= 0 else stop]),
+        "name": tt.stop_names[parent if parent >= 0 else stop],
+        "lat": tt.stop_lat[stop],
+        "lng": tt.stop_lon[stop],
+    }
+
+
+def _format_leg(tt: Timetable, service_date: date, leg: tuple) -> dict:
+    if leg[0] == "walk":
+        _, from_stop, to_stop, depart, arrive = leg
+        origin, destination = _stop_summary(tt, from_stop), _stop_summary(tt, to_stop)
         return {
-            "status": "Neo4j disabled",
-            "message": f"Using fallback route logic between {start_station_name} and {end_station_name}.",
-            "route": [start_station_name, "Demo Stop", end_station_name]
+            "line": None,
+            "mode": "walking",
+            "departure": tt.to_datetime(service_date, depart).isoformat(),
+            "arrival": tt.to_datetime(service_date, arrive).isoformat(),
+            "origin": origin["name"],
+            "destination": destination["name"],
+            "origin_id": origin["id"],
+            "destination_id": destination["id"],
+            "origin_lat": origin["lat"],
+            "origin_lng": origin["lng"],
+            "destination_lat": destination["lat"],
+            "destination_lng": destination["lng"],
+            "stopovers": [],
         }
 
-    # If Neo4j were enabled, you could re-enable the query below
-    try:
-        query = """
-        MATCH path = shortestPath(
-            (start:Station {name: $start})-[:CONNECTED*]->(end:Station {name: $end})
+    _, p, k, offset, board_pos, alight_pos = leg
+    n = tt.pattern_size(p)
+    stop_base = tt.pattern_stop_offset[p]
+    time_base = tt.pattern_time_offset[p] + k * n
+    stops = [tt.pattern_stops[stop_base + i] for i in range(board_pos, alight_pos + 1)]
+    origin, destination = _stop_summary(tt, stops[0]), _stop_summary(tt, stops[-1])
+
+    def at(i: int, times) -> str:
+        return tt.to_datetime(service_date, times[time_base + i] + offset).isoformat()
+
+    return {
+        "line": tt.route_names[tt.pattern_route[p]],
+        "mode": PRODUCTS[tt.pattern_product[p]],
+        "departure": at(board_pos, tt.departure_times),
+        "arrival": at(alight_pos, tt.arrival_times),
+        "origin": origin["name"],
+        "destination": destination["name"],
+        "origin_id": origin["id"],
+        "destination_id": destination["id"],
+        "origin_lat": origin["lat"],
+        "origin_lng": origin["lng"],
+        "destination_lat": destination["lat"],
+        "destination_lng": destination["lng"],
+        "stopovers": [
+            {
+                "name": _stop_summary(tt, stop)["name"],
+                "arrival": at(board_pos + i, tt.arrival_times),
+                "departure": at(board_pos + i, tt.departure_times),
+                "platform": None,
+            }
+            for i, stop in enumerate(stops)
+        ],
+    }
+
+
+def _format_journey(legs: list[dict]) -> dict:
+    """Same shape as journey_service produces, flagged as timetable-only."""
+    rides = [leg for leg in legs if leg["mode"] != "walking"] or legs
+    first, last = legs[0], legs[-1]
+    departure = datetime.fromisoformat(first["departure"])
+    arrival = datetime.fromisoformat(last["arrival"])
+    return {
+        "from": first["origin"],
+        "to": last["destination"],
+        "departure": first["departure"],
+        "arrival": last["arrival"],
+        "duration": int((arrival - departure).total_seconds() // 60),
+        "line": rides[0]["line"],
+        "mode": rides[0]["mode"],
+        "platform": None,
+        "delay": 0,
+        "changes": max(len(rides) - 1, 0),
+        "from_lat": first["origin_lat"],
+        "from_lng": first["origin_lng"],
+        "to_lat": last["destination_lat"],
+        "to_lng": last["destination_lng"],
+        "refreshToken": None,
+        "handle": None,
+        "realtime": False,
+        "legs": legs,
+    }
+
+
+def _dominates(a: dict, b: dict) -> bool:
+    """a leaves no earlier, arrives no later and changes no more often than b."""
+    return (
+        datetime.fromisoformat(a["departure"]) >= datetime.fromisoformat(b["departure"])
+        and datetime.fromisoformat(a["arrival"]) <= datetime.fromisoformat(b["arrival"])
+        and a["changes"] <= b["changes"]
+    )
+
+
+def _pareto_journeys(journeys: list[dict]) -> list[dict]:
+    """Range-RAPTOR filter: drop every journey another one dominates."""
+    kept = []
+    for i, journey in enumerate(journeys):
+        if not any(
+            j != i and _dominates(other, journey) and (not _dominates(journey, other) or j < i)
+            for j, other in enumerate(journeys)
+        ):
+            kept.append(journey)
+    return kept
+
+
+def plan_journeys(
+    tt: Timetable,
+    from_station: str,
+    to_station: str,
+    departure: str | None = None,
+    products: list[str] | None = None,
+    results: int = OFFLINE_RESULTS,
+) -> list[dict]:
+    """
+    Offline journeys between two stations from the GTFS timetable. Each
+    RAPTOR run yields the Pareto set of (arrival, transfers); later
+    departures are found by re-running just after the previous best one,
+    and journeys beaten by a later departure are dropped. Raises
+    LookupError for unknown stations, ValueError for an unparseable
+    departure.
+    """
+    when = parse_departure(departure)
+    from_key = tt.find_station(from_station)
+    to_key = tt.find_station(to_station)
+    if not from_key or not to_key:
+        raise LookupError(f"Unknown station: {from_station if not from_key else to_station}")
+
+    origins = tt.station_stops[from_key]
+    targets = set(tt.station_stops[to_key])
+    allowed = _allowed_products(products)
+    service_date, depart_at = tt.to_service_time(when)
+
+    journeys: list[dict] = []
+    seen: set[tuple] = set()
+    for _ in range(results * 4):
+        # One search beyond `results`, which may still beat the last one kept
+        if len(_pareto_journeys(journeys)) > results:
+            break
+        result = run_raptor(
+            tt,
+            {stop: depart_at for stop in origins},
+            service_date,
+            targets=targets,
+            allowed_products=allowed,
         )
-        UNWIND nodes(path) AS station
-        RETURN station.name AS station_name
-        """
-        start = start_station_name.strip()
-        end = end_station_name.strip()
-        print(f"Looking up route: {start} → {end}")
-
-        result = session.run(query, start=start, end=end)
-        path_stations = [record["station_name"] for record in result]
-        print("Result:", path_stations)
-
-        if not path_stations:
-            return {"status": "error", "message": "No route found between the specified stations."}
-        return {"status": "success", "route": path_stations}
-
-    except Exception as e:
+
+        found = []
+        previous_best = INF
+        for k, arrivals in enumerate(result.arrivals):
+            target = min(targets, key=lambda s: arrivals[s])
+            if arrivals[target] < previous_best:
+                previous_best = arrivals[target]
+                legs = reconstruct(tt, result, target, k)
+                if any(leg[0] == "trip" for leg in legs):
+                    found.append(legs)
+        if not found:
+            break
+
+        first_departure = INF
+        for legs in found:
+            formatted = [_format_leg(tt, service_date, leg) for leg in legs]
+            signature = tuple((leg["line"], leg["departure"]) for leg in formatted)
+            if signature not in seen:
+                seen.add(signature)
+                journeys.append(_format_journey(formatted))
+            first_trip = next(leg for leg in legs if leg[0] == "trip")
+            _, p, k, offset, board_pos, _ = first_trip
+            n = tt.pattern_size(p)
+            first_departure = min(
+                first_departure,
+                tt.departure_times[tt.pattern_time_offset[p] + k * n + board_pos] + offset,
+            )
+        depart_at = first_departure + 60
+
+    journeys = _pareto_journeys(journeys)
+    journeys.sort(key=lambda j: (j["arrival"], j["changes"]))
+    return journeys[:results]
+
+
+async def plan_offline(
+    from_station: str,
+    to_station: str,
+    departure: str | None = None,
+    products: list[str] | None = None,
+    results: int = OFFLINE_RESULTS,
+) -> list[dict] | None:
+    """Run the planner off the event loop; None when no timetable is loaded."""
+    tt = get_timetable()
+    if tt is None:
+        return None
+    return await asyncio.to_thread(plan_journeys, tt, from_station, to_station, departure, products, results)
+
+
+async def find_shortest_route(start_station_name: str, end_station_name: str, departure: str | None = None):
+    """Route between two stations on the locally loaded GTFS timetable."""
+    try:
+        journeys = await plan_offline(start_station_name.strip(), end_station_name.strip(), departure)
+    except (LookupError, ValueError) as e:
         return {"status": "error", "message": str(e)}
 
-    finally:
-        session.close()
+    if journeys is None:
+        return {"status": "error", "message": "Offline timetable is not loaded (set GTFS_PATH)."}
+    if not journeys:
+        return {"status": "error", "message": "No route found between the specified stations."}
+
+    best = journeys[0]
+    route = [best["legs"][0]["origin"]] + [leg["destination"] for leg in best["legs"]]
+    return {"status": "success", "route": route, "journeys": journeys}
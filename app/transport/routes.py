@@ -1,59 +1,151 @@
 # transport/routes.py
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket
+from fastapi.responses import StreamingResponse
 from typing import Optional
 
-from transport.journey_service import fetch_journey
+from transport.journey_keys import parse_departure
+from transport.journey_service import fetch_journey, fetch_journey_stopovers, refresh_journeys
 from transport.refresh_service import refresh_journey
-from transport.departure_service import fetch_departures
+from transport.departure_service import fetch_departures, fetch_departure_board
 from transport.route_service import find_shortest_route
+from transport.live_departures import event_stream, serve_websocket
+from transport import metrics
+from transport.station_suggestions import suggest_station_names
+from transport.spatial_index import nearest_stations
+from transport.delay_stats import delay_rollup
+from transport.meetup import attach_places, plan_meetup
 from utils.resolve import get_station_id
-from db.db_mongo import get_station_logs  # helper, not raw client
+from schemas.transport import JourneyRefreshBatchRequest
 from pymongo.collection import Collection
+from db.postgres import AsyncSessionLocal
 router = APIRouter(prefix="/transport", tags=["Transport"])
 
 
+def departure_param(departure: Optional[str] = None) -> Optional[str]:
+    """The `departure` query parameter, rejected with a 400 if it is not an ISO time."""
+    try:
+        parse_departure(departure)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return departure
+
+
 @router.get("/journey")
-def journey(
+async def journey(
     from_station: str,
     to_station: str,
     products: Optional[list[str]] = Query(default=None, alias="products[]"),
-    departure: Optional[str] = None,
+    departure: Optional[str] = Depends(departure_param),
     user_id: Optional[str] = None,
+    compact: bool = False,
 ):
-    from_id = get_station_id(from_station) if not from_station.isdigit() else from_station
-    to_id = get_station_id(to_station) if not to_station.isdigit() else to_station
+    from_id = await get_station_id(from_station) if not from_station.isdigit() else from_station
+    to_id = await get_station_id(to_station) if not to_station.isdigit() else to_station
 
-    return fetch_journey(
+    return await fetch_journey(
         from_id,
         to_id,
         products,
         departure=departure,
-        user_id=user_id
+        user_id=user_id,
+        compact=compact,
     )
 
 
+@router.get("/journey/stopovers")
+async def journey_stopovers(handle: str):
+    return await fetch_journey_stopovers(handle)
+
+
 @router.get("/journey/refresh")
-def refresh(token: str):
-    return refresh_journey(token)
+async def refresh(token: str):
+    return await refresh_journey(token)
+
+
+@router.post("/journey/refresh/batch")
+async def refresh_batch(body: JourneyRefreshBatchRequest):
+    return await refresh_journeys(body.tokens, body.stopovers)
 
 
 @router.get("/stations")
-def suggest_stations(q: str = Query(..., min_length=1)):
-    regex_query = {
-        "name": {
-            "$regex": f"^{q}",
-            "$options": "i"
-        }
-    }
-    return get_station_logs(regex_query)
+def suggest_stations(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=20)):
+    return suggest_station_names(q, limit)
+
+
+@router.get("/stations/nearby")
+def stations_nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(5, ge=1, le=50),
+):
+    stations = nearest_stations(lat, lon, k)
+    if stations is None:
+        return {"status": "error", "message": "Station catalog is not available yet (set GTFS_PATH and sync it)."}
+    return {"status": "success", "stations": stations}
 
 
 
 @router.get("/departures")
-def get_departures(station_id: str, duration: int = 60):
-    return fetch_departures(station_id, duration)
+async def get_departures(station_id: str, duration: int = 60):
+    return await fetch_departures(station_id, duration)
+
+
+@router.get("/departures/batch")
+async def get_departure_board(
+    station_ids: list[str] = Query(..., alias="station_ids[]"),
+    duration: int = 60,
+):
+    return await fetch_departure_board(station_ids, duration)
+
+
+@router.websocket("/departures/live")
+async def departures_live(websocket: WebSocket, station_id: str, duration: int = 60):
+    await serve_websocket(websocket, station_id, duration)
+
+
+@router.get("/departures/stream")
+async def departures_stream(request: Request, station_id: str, duration: int = 60):
+    return StreamingResponse(
+        event_stream(request, station_id, duration),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/route")
-def get_route(start_station: str, end_station: str):
-    return find_shortest_route(start_station, end_station)
+async def get_route(start_station: str, end_station: str, departure: Optional[str] = Depends(departure_param)):
+    return await find_shortest_route(start_station, end_station, departure)
+
+
+@router.get("/meetup")
+async def meetup(
+    origins: list[str] = Query(..., alias="origins[]"),
+    departure: Optional[str] = Depends(departure_param),
+    objective: str = Query("minmax", pattern="^(minmax|sum)$"),
+    results: int = Query(5, ge=1, le=20),
+    places: bool = True,
+):
+    plan = await plan_meetup(origins, departure, objective, results)
+    if places and plan["status"] == "success":
+        try:
+            # Postgres is only needed for the places around each station
+            async with AsyncSessionLocal() as db:
+                await attach_places(db, plan["stations"])
+        except Exception as e:
+            # Meeting points are useful on their own
+            print("⚠️ Meetup places lookup failed:", e)
+    return plan
+
+
+@router.get("/delays")
+def delays(
+    line: Optional[str] = None,
+    station_id: Optional[str] = None,
+    hour_of_week: Optional[int] = Query(default=None, ge=0, le=167),
+):
+    return delay_rollup(line, station_id, hour_of_week)
+
+
+@router.get("/stats")
+def transport_stats():
+    return metrics.snapshot()
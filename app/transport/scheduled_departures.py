@@ -0,0 +1,140 @@
+# transport/scheduled_departures.py
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from transport.gtfs import BERLIN, PRODUCTS, Timetable, get_timetable
+
+# transport.rest `line.mode` for each product, so scheduled rows look like live ones
+_MODE_BY_PRODUCT = {
+    "suburban": "train",
+    "subway": "train",
+    "tram": "train",
+    "bus": "bus",
+    "ferry": "watercraft",
+    "express": "train",
+    "regional": "train",
+    "other": "N/A",
+}
+
+
+class DepartureIndex:
+    """
+    Every scheduled departure of the feed, grouped by station and sorted by
+    time of day, so a board is two binary searches plus a calendar check per
+    row. Stored CSR-style like the timetable: station key -> (start, end)
+    into `times` (seconds after service-day midnight, may exceed 24h),
+    `trips` and `stops`.
+    """
+
+    def __init__(self, tt: Timetable):
+        self.tt = tt
+        self.ranges: dict[str, tuple[int, int]] = {}
+        self.times = array("i")
+        self.trips = array("i")
+        self.stops = array("i")
+
+        # Trips without a headsign run towards their last stop
+        self.trip_direction: list[str] = list(tt.trip_headsign)
+        by_stop: list[list[tuple[int, int]]] = [[] for _ in tt.stop_ids]
+        for p in range(len(tt.pattern_route)):
+            stop_start = tt.pattern_stop_offset[p]
+            size = tt.pattern_size(p)
+            terminus = tt.stop_names[tt.pattern_stops[stop_start + size - 1]]
+            time_start = tt.pattern_time_offset[p]
+            for row, t in enumerate(range(tt.pattern_trip_offset[p], tt.pattern_trip_offset[p + 1])):
+                trip = tt.pattern_trips[t]
+                if not self.trip_direction[trip]:
+                    self.trip_direction[trip] = terminus
+                # Nobody departs from the last stop of a trip
+                for pos in range(size - 1):
+                    seconds = tt.departure_times[time_start + row * size + pos]
+                    by_stop[tt.pattern_stops[stop_start + pos]].append((seconds, trip))
+
+        for key, stops in tt.station_stops.items():
+            rows = sorted((seconds, trip, s) for s in stops for seconds, trip in by_stop[s])
+            if not rows:
+                continue
+            start = len(self.times)
+            for seconds, trip, s in rows:
+                self.times.append(seconds)
+                self.trips.append(trip)
+                self.stops.append(s)
+            self.ranges[key] = (start, len(self.times))
+
+    def __len__(self):
+        return len(self.times)
+
+    def departures(self, station: str, start: datetime, duration_minutes: int) -> list[dict]:
+        """Scheduled departures from `station` in [start, start + duration], by time."""
+        tt = self.tt
+        bounds = self.ranges.get(station)
+        if bounds is None:
+            return []
+        lo, hi = bounds
+        day, seconds = tt.to_service_time(start)
+        end = seconds + duration_minutes * 60
+
+        found = []
+        # Trips of yesterday's service day still running after midnight show up as 24:xx+
+        for service_day, offset in ((day - timedelta(days=1), 86400), (day, 0)):
+            if offset and tt.max_seconds < seconds + offset:
+                continue
+            active = tt.active_services(service_day)
+            first = bisect_left(self.times, seconds + offset, lo, hi)
+            last = bisect_right(self.times, end + offset, lo, hi)
+            for i in range(first, last):
+                trip = self.trips[i]
+                if active[tt.trip_service[trip]]:
+                    found.append((tt.to_datetime(service_day, self.times[i]), trip, self.stops[i]))
+
+        found.sort(key=lambda row: row[0])
+        return [self._format(when, trip, stop) for when, trip, stop in found]
+
+    def _format(self, when: datetime, trip: int, stop: int) -> dict:
+        tt = self.tt
+        route = tt.trip_route[trip]
+        planned = when.isoformat()
+        return {
+            "tripId": tt.trip_ids[trip],
+            "line": tt.route_names[route] or "N/A",
+            "direction": self.trip_direction[trip] or "Unknown",
+            "when": planned,
+            "plannedWhen": planned,
+            "delay": None,
+            "platform": "N/A",
+            "mode": _MODE_BY_PRODUCT[PRODUCTS[tt.route_product[route]]],
+            "cancelled": False,
+            # Timetable data only: no delays, cancellations or platform changes
+            "scheduled": True,
+        }
+
+
+_index: DepartureIndex | None = None
+
+
+def get_departure_index() -> DepartureIndex | None:
+    return _index
+
+
+def build_departure_index() -> DepartureIndex | None:
+    global _index
+    tt = get_timetable()
+    if tt is None:
+        return None
+    started = time.perf_counter()
+    _index = DepartureIndex(tt)
+    print(f"🗓️ Departure index built: {len(_index)} departures in {time.perf_counter() - started:.1f}s")
+    return _index
+
+
+def scheduled_departures(station_id: str, duration: int, start: datetime | None = None) -> list[dict] | None:
+    """Timetable departures for a station, or None when no feed is loaded or the station is unknown."""
+    index = get_departure_index()
+    if index is None:
+        return None
+    station = index.tt.find_station(station_id)
+    if station is None or station not in index.ranges:
+        return None
+    return index.departures(station, start or datetime.now(BERLIN), duration)
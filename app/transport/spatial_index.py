@@ -0,0 +1,130 @@
+# transport/spatial_index.py
+import heapq
+import math
+import time
+from array import array
+
+from pymongo.errors import PyMongoError
+
+from transport import station_catalog
+
+# Grid cell edge; a nearby query usually touches the 3x3 cells around the point
+CELL_METERS = 500
+METERS_PER_DEGREE = 111_320
+# Furthest a nearby query looks before giving up
+MAX_SEARCH_METERS = 20_000
+
+
+class StopGrid:
+    """
+    Uniform grid over station coordinates, projected to metres around the
+    feed's mean latitude (plenty accurate at city scale). A nearest query
+    walks rings of cells outward from the query point and stops once the
+    next ring cannot hold anything closer than the k-th result.
+    """
+
+    def __init__(self, entries: list[dict]):
+        # entries: {"id", "name", "lat", "lon", ...}; returned with "distance_m"
+        self.entries = entries
+        self.by_id = {e["id"]: i for i, e in enumerate(entries)}
+        lat0 = sum(e["lat"] for e in entries) / len(entries) if entries else 52.5
+        self.kx = math.cos(math.radians(lat0)) * METERS_PER_DEGREE
+        self.ky = METERS_PER_DEGREE
+        self.xs = array("d", (e["lon"] * self.kx for e in entries))
+        self.ys = array("d", (e["lat"] * self.ky for e in entries))
+        self.cells: dict[tuple[int, int], list[int]] = {}
+        for i in range(len(entries)):
+            self.cells.setdefault(self._cell(self.xs[i], self.ys[i]), []).append(i)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _cell(x: float, y: float) -> tuple[int, int]:
+        return int(x // CELL_METERS), int(y // CELL_METERS)
+
+    def _ring(self, cx: int, cy: int, r: int):
+        if r == 0:
+            yield self.cells.get((cx, cy), ())
+            return
+        for dx in range(-r, r + 1):
+            yield self.cells.get((cx + dx, cy - r), ())
+            yield self.cells.get((cx + dx, cy + r), ())
+        for dy in range(-r + 1, r):
+            yield self.cells.get((cx - r, cy + dy), ())
+            yield self.cells.get((cx + r, cy + dy), ())
+
+    def nearest_ids(self, lat: float, lon: float, k: int = 5, max_distance_m: float = MAX_SEARCH_METERS) -> list[tuple[float, int]]:
+        """(distance in metres, entry index) of the k closest entries, nearest first."""
+        x, y = lon * self.kx, lat * self.ky
+        cx, cy = self._cell(x, y)
+        best: list[tuple[float, int]] = []  # max-heap by negated distance
+        for r in range(int(max_distance_m // CELL_METERS) + 2):
+            # Everything in ring r is at least (r - 1) cells away
+            if len(best) >= k and -best[0][0] <= (r - 1) * CELL_METERS:
+                break
+            for cell in self._ring(cx, cy, r):
+                for i in cell:
+                    d = math.hypot(self.xs[i] - x, self.ys[i] - y)
+                    if d > max_distance_m:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-d, i))
+                    elif d < -best[0][0]:
+                        heapq.heapreplace(best, (-d, i))
+        return sorted((-d, i) for d, i in best)
+
+    def within_ids(self, lat: float, lon: float, radius_m: float) -> list[tuple[float, int]]:
+        """(distance in metres, entry index) of every entry inside the radius, nearest first."""
+        x, y = lon * self.kx, lat * self.ky
+        cx, cy = self._cell(x, y)
+        found = []
+        for r in range(int(radius_m // CELL_METERS) + 2):
+            for cell in self._ring(cx, cy, r):
+                for i in cell:
+                    d = math.hypot(self.xs[i] - x, self.ys[i] - y)
+                    if d <= radius_m:
+                        found.append((d, i))
+        found.sort()
+        return found
+
+    def nearest(self, lat: float, lon: float, k: int = 5, max_distance_m: float = MAX_SEARCH_METERS) -> list[dict]:
+        return [
+            {**self.entries[i], "distance_m": round(d)}
+            for d, i in self.nearest_ids(lat, lon, k, max_distance_m)
+        ]
+
+
+_GRID_FIELDS = ("id", "name", "lat", "lon", "products")
+
+_grid: StopGrid | None = None
+
+
+def get_stop_grid() -> StopGrid | None:
+    return _grid
+
+
+def build_stop_grid() -> StopGrid | None:
+    global _grid
+    started = time.perf_counter()
+    entries = station_catalog.station_entries()
+    if not entries:
+        return None
+    _grid = StopGrid([{k: e[k] for k in _GRID_FIELDS} for e in entries])
+    print(f"📍 Stop grid built: {len(_grid)} stations in {time.perf_counter() - started:.2f}s")
+    return _grid
+
+
+def nearest_stations(lat: float, lon: float, k: int = 5, max_distance_m: float = MAX_SEARCH_METERS) -> list[dict] | None:
+    """Closest served stations to a point; None if neither the grid nor the catalog is available."""
+    grid = get_stop_grid()
+    if grid is not None:
+        return grid.nearest(lat, lon, k, max_distance_m)
+    # Grid still building: the catalog's geo index answers meanwhile
+    try:
+        if station_catalog.catalog_version() is None:
+            return None
+        return station_catalog.nearby(lat, lon, k, max_distance_m)
+    except PyMongoError as e:
+        print("⚠️ Nearby lookup failed:", e)
+        return None
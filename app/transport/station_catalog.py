@@ -0,0 +1,236 @@
+# transport/station_catalog.py
+"""
+Station catalog: every station of the GTFS feed (transport.rest ID, name,
+coordinates, products, trips through it in the feed) in one indexed Mongo
+collection, stamped with the feed version it came from. Autocomplete,
+name resolution and nearby search read from it, so workers that have not
+loaded the timetable themselves still see the full network.
+
+    cd app && python -m transport.station_catalog
+"""
+import re
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, UpdateOne
+from pymongo.errors import PyMongoError
+
+from db.db_mongo import catalog_versions, station_catalog
+from transport.coalesce import release_lock, try_lock
+from transport.gtfs import PRODUCTS, Timetable, get_timetable, load_timetable, normalize_name
+
+CATALOG_ID = "stations"
+# Part of the stored version; bump when the stored name forms change so the
+# next sync rewrites every station even if the feed has not changed
+CATALOG_FORMAT = 2
+SYNC_BATCH_SIZE = 1000
+SYNC_LOCK_KEY = "lock:station_catalog:sync"
+SYNC_LOCK_TTL_MS = 10 * 60 * 1000
+
+# German transliterations, searchable alongside the plain diacritic-free form
+_UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "Ä": "Ae", "Ö": "Oe", "Ü": "Ue"})
+
+_ENTRY_FIELDS = {"_id": 0, "id": "$_id", "name": 1, "lat": 1, "lon": 1, "products": 1, "trips": 1, "hits": 1}
+
+
+def _station_position(tt: Timetable, stops: list[int]) -> tuple[float, float]:
+    # The parent station row if the feed has one, else the centre of its platforms
+    for s in stops:
+        if tt.stop_parent[s] < 0:
+            return tt.stop_lat[s], tt.stop_lon[s]
+    return sum(tt.stop_lat[s] for s in stops) / len(stops), sum(tt.stop_lon[s] for s in stops) / len(stops)
+
+
+def entries_from_timetable(tt: Timetable) -> list[dict]:
+    """One entry per station with at least one trip: {id, name, lat, lon, products, trips}."""
+    products_by_stop: list[set[int]] = [set() for _ in tt.stop_ids]
+    trips_by_stop = [0] * len(tt.stop_ids)
+    for p in range(len(tt.pattern_route)):
+        trips = tt.pattern_trip_offset[p + 1] - tt.pattern_trip_offset[p]
+        start = tt.pattern_stop_offset[p]
+        for pos in range(tt.pattern_size(p)):
+            stop = tt.pattern_stops[start + pos]
+            products_by_stop[stop].add(tt.pattern_product[p])
+            trips_by_stop[stop] += trips
+
+    entries = []
+    for key, stops in tt.station_stops.items():
+        trips = sum(trips_by_stop[s] for s in stops)
+        if not trips:
+            continue
+        products = set().union(*(products_by_stop[s] for s in stops))
+        lat, lon = _station_position(tt, stops)
+        entries.append({
+            "id": key,
+            "name": tt.station_name(key),
+            "lat": lat,
+            "lon": lon,
+            "products": [PRODUCTS[p] for p in sorted(products)],
+            "trips": trips,
+        })
+    return entries
+
+
+def search_names(name: str) -> list[str]:
+    """Every word suffix of the name, so a prefix query on "alexanderplatz" finds "S+U Alexanderplatz"."""
+    forms = {normalize_name(name), normalize_name(name.translate(_UMLAUTS))}
+    suffixes = set()
+    for form in forms:
+        words = form.split(" ")
+        suffixes.update(" ".join(words[w:]) for w in range(len(words)))
+    return sorted(suffixes)
+
+
+# ---------- Sync ----------
+
+def ensure_indexes():
+    station_catalog.create_index("name_normalized")
+    station_catalog.create_index("search_names")
+    station_catalog.create_index([("location", GEOSPHERE)])
+    station_catalog.create_index([("version", ASCENDING), ("trips", DESCENDING)])
+
+
+def catalog_version() -> str | None:
+    meta = catalog_versions.find_one({"_id": CATALOG_ID})
+    return meta["version"] if meta else None
+
+
+def sync_catalog(tt: Timetable | None = None, force: bool = False) -> int | None:
+    """
+    Bulk-load the timetable's stations into the catalog. Skipped when the
+    catalog already holds this feed version; stations missing from the new
+    feed are removed once every batch has landed. `hits` survives re-syncs.
+    Returns the number of stations written, None if nothing was synced.
+    """
+    tt = tt or get_timetable()
+    if tt is None:
+        return None
+    version = f"{tt.feed_version or 'unknown'}/v{CATALOG_FORMAT}"
+    if not force and catalog_version() == version:
+        print(f"🗂️ Station catalog already at {version}")
+        return None
+
+    ensure_indexes()
+    entries = entries_from_timetable(tt)
+    synced_at = datetime.utcnow()
+    for start in range(0, len(entries), SYNC_BATCH_SIZE):
+        station_catalog.bulk_write([
+            UpdateOne(
+                {"_id": e["id"]},
+                {
+                    "$set": {
+                        "name": e["name"],
+                        "name_normalized": normalize_name(e["name"]),
+                        "search_names": search_names(e["name"]),
+                        "lat": e["lat"],
+                        "lon": e["lon"],
+                        "location": {"type": "Point", "coordinates": [e["lon"], e["lat"]]},
+                        "products": e["products"],
+                        "trips": e["trips"],
+                        "version": version,
+                        "synced_at": synced_at,
+                    },
+                    "$setOnInsert": {"hits": 0},
+                },
+                upsert=True,
+            )
+            for e in entries[start:start + SYNC_BATCH_SIZE]
+        ], ordered=False)
+
+    removed = station_catalog.delete_many({"version": {"$ne": version}}).deleted_count
+    catalog_versions.replace_one(
+        {"_id": CATALOG_ID},
+        {"version": version, "stations": len(entries), "synced_at": synced_at},
+        upsert=True,
+    )
+    print(f"🗂️ Station catalog synced to {version}: {len(entries)} stations, {removed} removed")
+    return len(entries)
+
+
+def sync_catalog_once() -> int | None:
+    """sync_catalog from whichever worker gets there first; the others skip it."""
+    token = try_lock(SYNC_LOCK_KEY, SYNC_LOCK_TTL_MS)
+    if not token:
+        return None
+    try:
+        return sync_catalog()
+    finally:
+        release_lock(SYNC_LOCK_KEY, token)
+
+
+# ---------- Reads ----------
+
+def load_catalog() -> list[dict] | None:
+    """Every station of the current version, None if the catalog is empty or unreachable."""
+    try:
+        version = catalog_version()
+        if version is None:
+            return None
+        entries = list(station_catalog.aggregate([
+            {"$match": {"version": version}},
+            {"$project": _ENTRY_FIELDS},
+        ]))
+    except PyMongoError as e:
+        print("⚠️ Station catalog unavailable:", e)
+        return None
+    return entries or None
+
+
+def station_entries() -> list[dict] | None:
+    """Stations from the catalog, else straight from this worker's timetable."""
+    entries = load_catalog()
+    if entries is None:
+        tt = get_timetable()
+        entries = entries_from_timetable(tt) if tt is not None else None
+    return entries
+
+
+def find_station(query: str, prefix: bool = True) -> str | None:
+    """Station ID for a name: the busiest exact match, else (if `prefix`) the busiest word-prefix match."""
+    name = normalize_name(query)
+    if not name:
+        return None
+    try:
+        doc = station_catalog.find_one({"name_normalized": name}, {"_id": 1}, sort=[("trips", DESCENDING)])
+        if doc is None and prefix:
+            doc = station_catalog.find_one(
+                {"search_names": {"$regex": f"^{re.escape(name)}"}},
+                {"_id": 1},
+                sort=[("trips", DESCENDING)],
+            )
+    except PyMongoError as e:
+        print("⚠️ Station catalog unavailable:", e)
+        return None
+    return doc["_id"] if doc else None
+
+
+def search(query: str, limit: int = 10) -> list[dict]:
+    """Autocomplete straight from Mongo, busiest stations first."""
+    name = normalize_name(query)
+    if not name:
+        return []
+    docs = station_catalog.find(
+        {"search_names": {"$regex": f"^{re.escape(name)}"}},
+        {"name": 1, "products": 1},
+    ).sort("trips", DESCENDING).limit(limit)
+    return [{"id": d["_id"], "name": d["name"], "line": None, "products": d.get("products", [])} for d in docs]
+
+
+def nearby(lat: float, lon: float, k: int = 5, max_distance_m: float = 20_000) -> list[dict]:
+    """Closest catalog stations to a point, by great-circle distance."""
+    docs = station_catalog.aggregate([
+        {"$geoNear": {
+            "near": {"type": "Point", "coordinates": [lon, lat]},
+            "distanceField": "distance_m",
+            "maxDistance": max_distance_m,
+            "spherical": True,
+        }},
+        {"$limit": k},
+        {"$project": {"_id": 0, "id": "$_id", "name": 1, "lat": 1, "lon": 1, "products": 1, "distance_m": 1}},
+    ])
+    return [{**d, "distance_m": round(d["distance_m"])} for d in docs]
+
+
+if __name__ == "__main__":
+    if load_timetable() is None:
+        raise SystemExit("GTFS_PATH is not set or missing")
+    sync_catalog(force=True)
@@ -0,0 +1,195 @@
+# transport/station_index.py
+import asyncio
+import math
+import os
+import time
+
+from db.db_mongo import station_logs
+from transport.gtfs import normalize_name
+from transport.station_catalog import search_names, station_entries
+
+STATION_INDEX_REFRESH_SECONDS = int(os.getenv("STATION_INDEX_REFRESH_SECONDS", 600))
+# Best-ranked stations kept on every trie node, i.e. the most we can suggest
+TOP_K = 20
+
+
+class _Node:
+    __slots__ = ("edges", "ids", "top")
+
+    def __init__(self):
+        # first character -> (edge label, child)
+        self.edges: dict[str, tuple[str, "_Node"]] = {}
+        self.ids: list[int] = []
+        self.top: tuple[int, ...] = ()
+
+
+class StationIndex:
+    """
+    Radix trie (path-compressed) over normalised station names.
+
+    Every station is inserted under each suffix of its name that starts at
+    a word boundary, so "alexanderplatz" and "berlin" both find
+    "S+U Alexanderplatz (Berlin)"; names with umlauts are also inserted in
+    their "ue" spelling. Each node caches the TOP_K most popular
+    stations beneath it, so a lookup is one walk down the trie with no
+    scanning or sorting at query time.
+    """
+
+    def __init__(self, entries: list[dict]):
+        # entries: {"id", "name", "popularity", ...}; returned without "popularity"
+        self.entries = entries
+        self.normalized = [normalize_name(e["name"]) for e in entries]
+        self.rank = [-(e.get("popularity") or 0) for e in entries]
+        # Normalised name -> most popular station of that name
+        self.by_name: dict[str, int] = {}
+        for i in sorted(range(len(entries)), key=lambda i: self.rank[i], reverse=True):
+            self.by_name[self.normalized[i]] = i
+        self.root = _Node()
+        for i, entry in enumerate(entries):
+            for key in search_names(entry["name"]):
+                self._insert(key, i)
+        self._compute_top(self.root)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _insert(self, key: str, station: int):
+        node = self.root
+        while key:
+            edge = node.edges.get(key[0])
+            if edge is None:
+                child = _Node()
+                node.edges[key[0]] = (key, child)
+                node = child
+                key = ""
+                break
+            label, child = edge
+            common = 0
+            limit = min(len(label), len(key))
+            while common < limit and label[common] == key[common]:
+                common += 1
+            if common < len(label):
+                # Split the edge at the first differing character
+                middle = _Node()
+                middle.edges[label[common]] = (label[common:], child)
+                node.edges[key[0]] = (label[:common], middle)
+                child = middle
+            node = child
+            key = key[common:]
+        if station not in node.ids:
+            node.ids.append(station)
+
+    def _compute_top(self, node: _Node) -> tuple[int, ...]:
+        candidates = set(node.ids)
+        for _, child in node.edges.values():
+            candidates.update(self._compute_top(child))
+        node.top = tuple(sorted(candidates, key=lambda i: (self.rank[i], len(self.normalized[i])))[:TOP_K])
+        return node.top
+
+    def _find(self, prefix: str) -> _Node | None:
+        node = self.root
+        while prefix:
+            edge = node.edges.get(prefix[0])
+            if edge is None:
+                return None
+            label, child = edge
+            if prefix.startswith(label):
+                prefix = prefix[len(label):]
+                node = child
+            elif label.startswith(prefix):
+                return child
+            else:
+                return None
+        return node
+
+    def suggest(self, query: str, limit: int = 10) -> list[dict]:
+        words = normalize_name(query).split(" ")
+        if not words or not words[0]:
+            return []
+
+        # Walk the trie with the full query; if that fails, use the longest
+        # word and keep candidates containing every other word
+        node = self._find(" ".join(words))
+        if node is not None:
+            candidates = node.top
+        else:
+            anchor = max(words, key=len)
+            node = self._find(anchor)
+            if node is None:
+                return []
+            others = [w for w in words if w != anchor]
+            candidates = [
+                i for i in node.top
+                if all(f" {w}" in f" {self.normalized[i]}" for w in others)
+            ]
+
+        results = []
+        for i in candidates[:limit]:
+            entry = self.entries[i]
+            results.append({k: v for k, v in entry.items() if k != "popularity"})
+        return results
+
+
+    def find(self, query: str, prefix: bool = True) -> str | None:
+        """Station ID for a name: the most popular exact match, else (if `prefix`) the best suggestion."""
+        i = self.by_name.get(normalize_name(query))
+        if i is not None and self.entries[i]["id"]:
+            return self.entries[i]["id"]
+        if prefix:
+            for entry in self.suggest(query, 1):
+                if entry["id"]:
+                    return entry["id"]
+        return None
+
+
+def _entries_from_catalog(stations: list[dict]) -> list[dict]:
+    return [
+        {
+            "id": e["id"],
+            "name": e["name"],
+            "line": None,
+            # Busy interchanges and frequently searched stations first; logs keep
+            # one huge hub from dwarfing everything else
+            "popularity": math.log1p(e.get("trips") or 0) + math.log1p(e.get("hits") or 0),
+        }
+        for e in stations
+    ]
+
+
+def _entries_from_station_logs() -> list[dict]:
+    return [
+        {
+            "id": d.get("station_id"),
+            "name": d["name"],
+            "line": d.get("line"),
+            "popularity": d.get("hits", 0),
+        }
+        for d in station_logs.find({"name": {"$type": "string"}}, {"_id": 0, "station_id": 1, "name": 1, "line": 1, "hits": 1})
+    ]
+
+
+_index: StationIndex | None = None
+
+
+def get_station_index() -> StationIndex | None:
+    return _index
+
+
+def build_station_index() -> StationIndex:
+    global _index
+    started = time.perf_counter()
+    stations = station_entries()
+    entries = _entries_from_catalog(stations) if stations else _entries_from_station_logs()
+    _index = StationIndex(entries)
+    print(f"🔤 Station index built: {len(_index)} stations in {time.perf_counter() - started:.2f}s")
+    return _index
+
+
+async def run_index_refresher():
+    """Periodic rebuild so search popularity from the catalog's hits stays current."""
+    while True:
+        await asyncio.sleep(STATION_INDEX_REFRESH_SECONDS)
+        try:
+            await asyncio.to_thread(build_station_index)
+        except Exception as e:
+            print("⚠️ Station index build failed:", e)
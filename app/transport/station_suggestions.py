@@ -1,27 +1,38 @@
 # transport/station_suggestions.py
+import re
 from fastapi import APIRouter, Query
 from typing import List
-from pymongo.collection import Collection
-from dotenv import load_dotenv
-import os
-from pymongo import MongoClient
 
-load_dotenv()
+from pymongo.errors import PyMongoError
 
-MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
-db = client["Vbb_transport"]
-station_collection: Collection = db["station_logs"]
+from db.db_mongo import get_station_logs
+from transport.station_catalog import catalog_version, search
+from transport.station_index import get_station_index
 
 router = APIRouter()
 
-@router.get("/stations/suggest")
-def suggest_stations(q: str = Query(..., min_length=1)) -> List[dict]:
+
+def suggest_station_names(q: str, limit: int = 10) -> List[dict]:
+    index = get_station_index()
+    if index is not None:
+        return index.suggest(q, limit)
+
+    # Index still building: the catalog's word-prefix index, then legacy station logs
+    try:
+        if catalog_version() is not None:
+            return search(q, limit)
+    except PyMongoError as e:
+        print("⚠️ Station catalog search failed:", e)
+
     regex_query = {
         "name": {
-            "$regex": f"^{q}",
+            "$regex": f"^{re.escape(q)}",
             "$options": "i"
         }
     }
-    return get_station_logs(regex_query)
+    return get_station_logs(regex_query, limit)
+
 
+@router.get("/stations/suggest")
+def suggest_stations(q: str = Query(..., min_length=1)) -> List[dict]:
+    return suggest_station_names(q)
@@ -0,0 +1,144 @@
+# transport/vbb_api.py
+import asyncio
+import os
+import random
+from typing import Any
+
+import httpx
+from dotenv import load_dotenv
+
+from transport import metrics, rate_limit
+from transport.resilience import breaker_for, hedged
+
+load_dotenv()
+
+VBB_BASE_URL = os.getenv("VBB_BASE_URL", "https://v6.vbb.transport.rest")
+VBB_TIMEOUT_SECONDS = float(os.getenv("VBB_TIMEOUT_SECONDS", 8))
+VBB_MAX_RETRIES = int(os.getenv("VBB_MAX_RETRIES", 2))
+VBB_BACKOFF_SECONDS = float(os.getenv("VBB_BACKOFF_SECONDS", 0.25))
+VBB_MAX_CONNECTIONS = int(os.getenv("VBB_MAX_CONNECTIONS", 20))
+
+# Upstream answers worth another attempt; everything else fails immediately
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_client: httpx.AsyncClient | None = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Shared keep-alive HTTP/2 pool for every transport.rest call.
+    Created lazily so it binds to the running event loop.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=VBB_BASE_URL,
+            http2=True,
+            headers={"User-Agent": "Explorix-App"},
+            limits=httpx.Limits(
+                max_connections=VBB_MAX_CONNECTIONS,
+                max_keepalive_connections=VBB_MAX_CONNECTIONS,
+                keepalive_expiry=30,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+async def vbb_get(
+    path: str,
+    params: dict | None = None,
+    timeout: float = VBB_TIMEOUT_SECONDS,
+    retries: int = VBB_MAX_RETRIES,
+    priority: str | None = None,
+) -> Any:
+    """
+    GET a transport.rest resource and return the decoded JSON.
+
+    `timeout` is a deadline for the whole call, retries included.
+    Transport errors and retryable status codes are retried with
+    jittered exponential backoff while the deadline allows it. Each kind
+    of call has its own circuit breaker (UpstreamUnavailable while open)
+    and slow attempts are hedged with a second request.
+
+    Every request, hedges included, takes a token from the rate limiter
+    shared by all workers. `priority` defaults to the one set by
+    rate_limit.priority() around the caller (interactive otherwise).
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    clean_params = {k: v for k, v in (params or {}).items() if v is not None}
+    endpoint = path.strip("/").split("/", 1)[0]
+    breaker = breaker_for(path)
+    priority = priority or rate_limit.current_priority()
+    sends = 0
+
+    def send():
+        nonlocal sends
+        sends += 1
+        # The first copy already holds a token; a hedge goes out only if one is free
+        if sends > 1 and not rate_limit.try_acquire(priority):
+            raise rate_limit.RateLimited(f"No token to hedge {path}")
+        metrics.incr(f"vbb_calls:{endpoint}")
+        return get_client().get(
+            path,
+            params=clean_params,
+            timeout=httpx.Timeout(max(deadline - loop.time(), 0.001)),
+        )
+
+    attempt = 0
+    while True:
+        if deadline - loop.time() <= 0:
+            raise httpx.TimeoutException(f"VBB deadline exceeded for {path}")
+
+        # An open breaker rejects the call before it can spend a shared token
+        breaker.acquire()
+        try:
+            await rate_limit.acquire(deadline, priority)
+        except BaseException:
+            # Never sent: no outcome to record, and a half-open probe slot is freed
+            breaker.release(None, 0)
+            raise
+        sends = 0
+        started = loop.time()
+        failed = None
+        retry_delay = None
+        try:
+            response = await hedged(breaker, send)
+            failed = response.status_code in RETRY_STATUS_CODES
+            if response.status_code == 429:
+                # Our shared quota is exhausted: hold back every worker, not just this call
+                rate_limit.pause(_retry_after(response))
+            if not failed or attempt >= retries:
+                response.raise_for_status()
+                return response.json()
+            retry_delay = _retry_after(response)
+            print(f"⚠️ VBB {path} returned {response.status_code}, retrying...")
+        except httpx.TransportError as e:
+            failed = True
+            if attempt >= retries:
+                raise
+            print(f"⚠️ VBB {path} failed ({e.__class__.__name__}), retrying...")
+        finally:
+            breaker.release(failed, loop.time() - started)
+
+        attempt += 1
+        backoff = retry_delay or VBB_BACKOFF_SECONDS * (2 ** (attempt - 1))
+        backoff *= random.uniform(0.5, 1.0) if retry_delay is None else 1.0
+        if loop.time() + backoff >= deadline:
+            raise httpx.TimeoutException(f"VBB deadline exceeded for {path}")
+        await asyncio.sleep(backoff)
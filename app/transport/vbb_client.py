@@ -1,17 +1,15 @@
 # transport/vbb_client.py
-import requests
 from datetime import datetime
-from app.db.db_mongo import log_trip
-from bson import ObjectId
 
-# from utils.db_neo4j import create_route  # Neo4j disabled
+from db.db_mongo import db
+from db.db_redis import cache_departure, get_cached_departure
+from db.write_behind import enqueue_insert
+from transport.coalesce import single_flight
+from transport.vbb_api import vbb_get
 
-# Redis fallback: dummy no-op functions
-def cache_departure(*args, **kwargs):
-    pass
+# from utils.db_neo4j import create_route  # Neo4j disabled
 
-def get_cached_departure(*args, **kwargs):
-    return None
+MODE_CACHE_TTL_SECONDS = 60
 
 # Transport mode filters
 MODE_FILTERS = {
@@ -22,67 +20,79 @@ MODE_FILTERS = {
     "ubahn": ["U"],
     "re": ["RE", "RB"]
 }
+# productName -> mode key
+_MODE_BY_PRODUCT = {product: mode for mode, products in MODE_FILTERS.items() for product in products}
 
-def fetch_mode_data(station_from, station_to, mode_key):
-    redis_key = f"{mode_key}:{station_from}->{station_to}"
-    cached = get_cached_departure(redis_key)
-    if cached:
-        print(f"🔁 Using cached {mode_key.upper()} data")
-        return cached
-
-    url = f"https://v5.vbb.transport.rest/stops/{station_from}/departures"
-    params = {
-        "duration": 120,
-        "language": "en",
-        "remarks": "true"
-    }
 
-    print(f"📡 Calling URL: {url}")
-    print("🔥 Fetching mode data triggered!")
+async def fetch_mode_data(station_from, station_to, mode_key):
+    """
+    Departures from `station_from` for one mode. One upstream fetch per
+    station fills a cache entry holding every mode, so the other mode
+    filters are answered from it. `station_to` is not used for filtering.
+    """
+    if mode_key not in MODE_FILTERS:
+        return {"error": f"Unknown mode: {mode_key}"}
 
+    key = f"departures:modes:{station_from}"
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-
-        journeys = []
-        for trip in data:
-            line_info = trip.get("line", {})
-            product = line_info.get("productName", "Unknown")
-
-            if product not in MODE_FILTERS.get(mode_key, []):
-                continue
-
-            journey_data = {
-                "from": trip.get("stop", {}).get("name", "Unknown"),
-                "to": trip.get("destination", {}).get("name", "Unknown"),
-                "departure": datetime.fromisoformat(trip["when"]).strftime("%H:%M") if trip.get("when") else "N/A",
-                "arrival": "N/A",
-                "duration": "N/A",
-                "line": line_info.get("name", "N/A"),
-                "platform": trip.get("platform", "N/A"),
-                "delay": trip.get("delay", 0),
-                "stops": [],
-                "mode": product
-            }
-
-            # Log to MongoDB (do not return ObjectId)
-            log_trip(journey_data, f"{mode_key}_logs")
-
-            # Neo4j disabled
-            # create_route(journey_data["from"], journey_data["to"], journey_data["line"], journey_data["delay"])
-
-            journeys.append(journey_data)
-
-        # Cache result (safe no-op)
-              # Cache result (no-op if Redis is disabled)
-        cache_departure(redis_key, journeys)
-
-        # Clean out ObjectId (_id) that MongoDB adds
-        clean_journeys = [{k: v for k, v in j.items() if k != "_id"} for j in journeys]
-
-        return clean_journeys
+        modes = get_cached_departure(key)
+        if modes is not None:
+            print(f"🔁 Using cached {mode_key.upper()} data")
+        else:
+            modes = await single_flight(
+                key,
+                lambda: _fetch_modes(station_from),
+                lambda: get_cached_departure(key),
+                lambda value: cache_departure(key, value, ttl=MODE_CACHE_TTL_SECONDS),
+            )
+        return modes[mode_key]
 
     except Exception as e:
         print(f"❌ Error in fetch_mode_data: {e}")
         return {"error": str(e)}
+
+
+async def _fetch_modes(station_id) -> dict[str, list[dict]]:
+    params = {
+        "duration": 120,
+        "language": "en",
+        "remarks": "true"
+    }
+    print(f"📡 Fetching departures for all modes at {station_id}")
+    data = await vbb_get(f"/stops/{station_id}/departures", params=params)
+
+    modes = {mode: [] for mode in MODE_FILTERS}
+    for trip in data.get("departures", []):
+        line_info = trip.get("line") or {}
+        product = line_info.get("productName", "Unknown")
+        mode = _MODE_BY_PRODUCT.get(product)
+        if mode is None:
+            continue
+
+        modes[mode].append({
+            "from": trip.get("stop", {}).get("name", "Unknown"),
+            "to": trip.get("destination", {}).get("name", "Unknown"),
+            "departure": datetime.fromisoformat(trip["when"]).strftime("%H:%M") if trip.get("when") else "N/A",
+            "arrival": "N/A",
+            "duration": "N/A",
+            "line": line_info.get("name", "N/A"),
+            "platform": trip.get("platform", "N/A"),
+            "delay": trip.get("delay", 0),
+            "stops": [],
+            "mode": product
+        })
+
+        # Neo4j disabled
+        # create_route(journey_data["from"], journey_data["to"], journey_data["line"], journey_data["delay"])
+
+    _log_trips(modes)
+    return modes
+
+
+def _log_trips(modes: dict[str, list[dict]]):
+    """Every fetched trip once, into its mode's log; flushed as one bulk write per collection."""
+    for mode, trips in modes.items():
+        collection = db[f"{mode}_logs"]
+        for trip in trips:
+            # Copy: the insert gets an _id that must not leak into the cached entry
+            enqueue_insert(collection, dict(trip))
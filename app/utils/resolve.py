@@ -1,35 +1,172 @@
-import requests
-from urllib.parse import quote_plus
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
 
-def get_station_id(station_name: str) -> str:
+import redis
+
+from db.db_redis import redis_client
+from transport import metrics, station_catalog
+from transport.coalesce import single_flight
+from transport.gtfs import get_timetable, normalize_name
+from transport.station_index import get_station_index
+from transport.vbb_api import vbb_get
+
+# Station IDs are stable, so a resolved name is good for a week
+RESOLVE_TTL_SECONDS = int(os.getenv("RESOLVE_TTL_SECONDS", 7 * 86400))
+# Unresolvable names are retried sooner, they may just be typos being fixed
+RESOLVE_NEGATIVE_TTL_SECONDS = int(os.getenv("RESOLVE_NEGATIVE_TTL_SECONDS", 600))
+RESOLVE_LRU_SIZE = int(os.getenv("RESOLVE_LRU_SIZE", 4096))
+# Optional JSON object of extra {"alias": "station ID"} entries
+STATION_ALIASES_PATH = os.getenv("STATION_ALIASES_PATH")
+
+UNKNOWN_STATION_ID = "000000000"
+
+# Names that never need a lookup: nicknames and the old demo fallbacks
+STATION_ALIASES = {
+    "berlin": "900037168",
+    "potsdam": "900230999",
+    "spandau": "900090001",
+    "charlottenburg": "900020201",
+    "alexanderplatz": "900100003",
+    "alex": "900100003",
+    "hbf": "900003201",
+    "berlin hbf": "900003201",
+    "hauptbahnhof": "900003201",
+    "zoo": "900023201",
+    "bahnhof zoo": "900023201",
+    "ostkreuz": "900120003",
+    "friedrichstrasse": "900100001",
+}
+
+# normalized name -> (station ID, or "" if unresolvable; monotonic expiry)
+_lru: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+
+def _load_aliases() -> dict[str, str]:
+    aliases = {normalize_name(k): v for k, v in STATION_ALIASES.items()}
+    if STATION_ALIASES_PATH and os.path.exists(STATION_ALIASES_PATH):
+        with open(STATION_ALIASES_PATH, encoding="utf-8") as f:
+            aliases.update({normalize_name(k): str(v) for k, v in json.load(f).items()})
+    return aliases
+
+
+_aliases = _load_aliases()
+
+
+def _lru_get(name: str) -> str | None:
+    entry = _lru.get(name)
+    if entry is None:
+        return None
+    if entry[1] <= time.monotonic():
+        del _lru[name]
+        return None
+    _lru.move_to_end(name)
+    return entry[0]
+
+
+def _lru_put(name: str, station_id: str, ttl: float):
+    _lru[name] = (station_id, time.monotonic() + ttl)
+    _lru.move_to_end(name)
+    while len(_lru) > RESOLVE_LRU_SIZE:
+        _lru.popitem(last=False)
+
+
+def _read_stored(key: str) -> str | None:
     try:
-        # Ensure the station name is URL-safe
-        encoded_name = quote_plus(station_name)
-        url = f"https://v6.vbb.transport.rest/locations?query={encoded_name}"
+        return redis_client.get(key)
+    except redis.RedisError:
+        return None
 
-        # Shorter timeout for reliability
-        response = requests.get(url, timeout=10)
 
-        # Check for success
-        if response.status_code != 200:
-            raise RuntimeError(f"API returned {response.status_code}: {response.text}")
+def _store(key: str, station_id: str):
+    ttl = RESOLVE_TTL_SECONDS if station_id else RESOLVE_NEGATIVE_TTL_SECONDS
+    try:
+        redis_client.set(key, station_id, ex=ttl)
+    except redis.RedisError as e:
+        print(f"⚠️ Could not store resolution {key}:", e)
 
-        data = response.json()
 
-        # Validate data
-        if not data or "id" not in data[0]:
-            raise RuntimeError("No valid station found.")
+class _Unresolved(Exception):
+    """Lookup failed for a reason that may not last (upstream down); never cached."""
+
+
+async def _local_station(station_name: str, prefix: bool = True) -> str | None:
+    # The in-memory station index holds the catalog; Mongo is only asked
+    # (off the event loop) while the index is still building
+    index = get_station_index()
+    if index is not None:
+        return index.find(station_name, prefix)
+    return await asyncio.to_thread(station_catalog.find_station, station_name, prefix)
 
-        return data[0]["id"]
 
+async def _offline_station(station_name: str) -> str | None:
+    tt = get_timetable()
+    return (tt.find_station(station_name) if tt is not None else None) or await _local_station(station_name)
+
+
+async def _lookup(station_name: str) -> str:
+    """Station ID for a name, "" if it definitely has none."""
+    # An exact catalog name needs no upstream call
+    station = await _local_station(station_name, prefix=False)
+    if station:
+        return station
+    try:
+        # Shorter timeout for reliability
+        data = await vbb_get(
+            "/locations",
+            params={"query": station_name, "results": 1, "addresses": "false", "poi": "false"},
+            timeout=5,
+        )
     except Exception as e:
         print(f"⚠️ Live VBB lookup failed for '{station_name}': {e}")
-        # --- Fallback demo station IDs ---
-        fallback_ids = {
-            "berlin": "900037168",
-            "potsdam": "900230999",
-            "spandau": "900090001",
-            "charlottenburg": "900020201",
-            "alexanderplatz": "900100003",
-        }
-        return fallback_ids.get(station_name.lower(), "000000000")
+        # --- Offline timetable or station catalog ---
+        station = await _offline_station(station_name)
+        if station:
+            return station
+        raise _Unresolved(str(e)) from e
+
+    if data and "id" in data[0]:
+        return data[0]["id"]
+    return await _offline_station(station_name) or ""
+
+
+async def get_station_id(station_name: str) -> str:
+    """
+    Resolve a typed station name to a transport.rest ID. Answers come from,
+    in order: the alias table, this worker's LRU, Redis, then one live
+    lookup per name across all workers. Names nothing can resolve are
+    remembered for RESOLVE_NEGATIVE_TTL_SECONDS and map to UNKNOWN_STATION_ID.
+    """
+    name = normalize_name(station_name)
+    if not name:
+        return UNKNOWN_STATION_ID
+    if name in _aliases:
+        metrics.incr("station_resolve:alias")
+        return _aliases[name]
+
+    station_id = _lru_get(name)
+    if station_id is not None:
+        metrics.incr("station_resolve_cache:hit")
+        return station_id or UNKNOWN_STATION_ID
+
+    key = f"resolve:station:{name}"
+    station_id = _read_stored(key)
+    if station_id is None:
+        metrics.incr("station_resolve_cache:miss")
+        try:
+            station_id = await single_flight(
+                key,
+                lambda: _lookup(station_name),
+                lambda: _read_stored(key),
+                lambda value: _store(key, value),
+            )
+        except _Unresolved:
+            return UNKNOWN_STATION_ID
+    else:
+        metrics.incr("station_resolve_cache:hit")
+
+    ttl = RESOLVE_TTL_SECONDS if station_id else RESOLVE_NEGATIVE_TTL_SECONDS
+    _lru_put(name, station_id, ttl)
+    return station_id or UNKNOWN_STATION_ID